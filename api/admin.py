@@ -1,3 +1,162 @@
+import json
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import EquipmentDataset, Equipment
+
+# Query string parameter holding the keyset cursor of large changelists.
+KEYSET_VAR = 'after'
+
+
+def estimate_count(queryset):
+    """Return the database's row estimate for ``queryset``, or None if it has none."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    if connection.vendor == 'sqlite' and not queryset.query.where:
+        # Row count recorded by the last ANALYZE, if any.
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                    [queryset.model._meta.db_table],
+                )
+            except DatabaseError:
+                return None
+            row = cursor.fetchone()
+        return int(row[0].split()[0]) if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly up to ``exact_limit`` rows and uses the database's
+    estimate beyond that, so large changelists never run a full COUNT(*).
+    Without an estimate the count stays at ``exact_limit + 1`` and
+    ``is_lower_bound`` is set.
+    """
+
+    exact_limit = 10000
+
+    is_estimate = False
+    is_lower_bound = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        bounded = queryset[:self.exact_limit + 1].count()
+        if bounded <= self.exact_limit:
+            return bounded
+        estimate = estimate_count(queryset)
+        if estimate is None or estimate <= bounded:
+            self.is_lower_bound = True
+            return bounded
+        self.is_estimate = True
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Pages with ``?after=<pk>`` instead of OFFSET while the list is in its
+    default newest-first order; any other ordering falls back to page numbers.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.after = int(request.GET[KEYSET_VAR])
+        except (KeyError, ValueError):
+            self.after = None
+        self.keyset = False
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(KEYSET_VAR, None)
+        return params
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        self.keyset = ORDER_VAR not in self.params and list(queryset.query.order_by) == ['-pk']
+        if self.keyset:
+            self.page_num = 1
+            if self.after is not None:
+                queryset = queryset.filter(pk__lt=self.after)
+        return queryset
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_page_url = None
+        self.first_page_url = None
+        if not self.keyset:
+            return
+        shown = len(self.result_list)
+        if self.multi_page and shown == self.list_per_page:
+            self.next_page_url = self.get_query_string({KEYSET_VAR: self.result_list[shown - 1].pk})
+        if self.after is not None:
+            self.first_page_url = self.get_query_string(remove=[KEYSET_VAR])
+
+
+class RecentDatasetFilter(admin.SimpleListFilter):
+    """Lists only the most recent datasets instead of every dataset in the table."""
+
+    title = 'dataset'
+    parameter_name = 'dataset'
+    limit = 20
+
+    def lookups(self, request, model_admin):
+        datasets = list(EquipmentDataset.objects.select_related('user')[:self.limit])
+        selected = self.value()
+        if selected and selected.isdigit() and all(str(d.pk) != selected for d in datasets):
+            datasets += list(EquipmentDataset.objects.select_related('user').filter(pk=selected))
+        return [(str(dataset.pk), str(dataset)) for dataset in datasets]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(dataset_id=self.value())
+        return queryset
+
+
+@admin.register(EquipmentDataset)
+class EquipmentDatasetAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'user', 'upload_date', 'total_equipment', 'equipment_link']
+    list_filter = ['upload_date', 'user']
+    list_select_related = ['user']
+    search_fields = ['filename', 'user__username']
+    readonly_fields = ['upload_date']
+
+    fieldsets = (
+        ('Basic Information', {
+            'fields': ('user', 'filename', 'upload_date')
+        }),
+        ('Statistics', {
+            'fields': ('total_equipment', 'avg_flowrate', 'avg_pressure',
+                      'avg_temperature', 'type_distribution')
+        }),
+    )
+
+    @admin.display(description='Equipment')
+    def equipment_link(self, obj):
+        url = reverse('admin:api_equipment_changelist')
+        return format_html('<a href="{}?dataset={}">View rows</a>', url, obj.pk)
+
+
+@admin.register(Equipment)
+class EquipmentAdmin(admin.ModelAdmin):
+    list_display = ['name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'dataset']
+    list_filter = ['equipment_type', RecentDatasetFilter]
+    list_select_related = ['dataset', 'dataset__user']
+    # name is backed by a trigram index on PostgreSQL; type only matches exactly.
+    search_fields = ['name', '=equipment_type']
+    autocomplete_fields = ['dataset']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/api/equipment/change_list.html'
 
-# Register your models here.
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,165 @@
+"""
+Cross-dataset aggregation of a user's ``Equipment`` rows.
+
+Rows are grouped by equipment name or type and, optionally, by a time
+bucket of their dataset's ``upload_date``. Grouping and aggregation run
+as a single GROUP BY query in the database; only the aggregated rows are
+loaded into Python. A dataset linked to another's rows (a repeated upload)
+selects those rows, which are counted once however many of the datasets
+sharing them are selected.
+"""
+import math
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import Avg, Case, Count, DateTimeField, F, Max, Min, Value, When
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Equipment, EquipmentDataset
+from .sketches import PARAMETER_FIELDS
+
+GROUP_FIELDS = {
+    'name': 'name',
+    'type': 'equipment_type',
+}
+
+BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+
+DEFAULT_MAX_ROWS = 10000
+
+
+class AggregationQueryError(ValueError):
+    """Raised for an invalid aggregation query parameter."""
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+
+def _parse_moment(value, name):
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.min) if day is not None else None
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise AggregationQueryError(f'{name} must be an ISO 8601 date or datetime')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_query(params):
+    """Validate request query parameters into keyword arguments for ``aggregate``."""
+    group_by = params.get('group_by', 'type')
+    if group_by not in GROUP_FIELDS:
+        raise AggregationQueryError(f'group_by must be one of: {", ".join(GROUP_FIELDS)}')
+
+    bucket = params.get('bucket') or None
+    if bucket is not None and bucket not in BUCKETS:
+        raise AggregationQueryError(f'bucket must be one of: {", ".join(BUCKETS)}')
+
+    try:
+        datasets = [int(pk) for pk in _split(params.get('datasets'))]
+    except ValueError:
+        raise AggregationQueryError('datasets must be a comma-separated list of ids')
+
+    return {
+        'group_by': group_by,
+        'bucket': bucket,
+        'keys': _split(params.get('keys')),
+        'datasets': datasets,
+        'since': _parse_moment(params.get('since'), 'since'),
+        'until': _parse_moment(params.get('until'), 'until'),
+    }
+
+
+def aggregate(user, group_by='type', bucket=None, keys=None, datasets=None, since=None, until=None):
+    """
+    Aggregate ``user``'s equipment rows across datasets.
+
+    Returns ``(rows, truncated)``. Each row holds the group ``key``, the
+    ``bucket`` start (None when not bucketing), the row and dataset counts
+    and mean/min/max/std for every parameter. At most
+    ``AGGREGATE_MAX_ROWS`` rows are returned; ``truncated`` is True when
+    more groups matched.
+    """
+    group_field = GROUP_FIELDS[group_by]
+
+    selected = EquipmentDataset.objects.filter(user=user)
+    if datasets:
+        selected = selected.filter(pk__in=datasets)
+    if since is not None:
+        selected = selected.filter(upload_date__gte=since)
+    if until is not None:
+        selected = selected.filter(upload_date__lt=until)
+
+    rows = Equipment.objects.filter(dataset__in=selected.values(rows_owner=Coalesce('rows_source', 'pk')))
+    if keys:
+        rows = rows.filter(**{f'{group_field}__in': keys})
+
+    group_columns = [group_field]
+    if bucket is not None:
+        rows = rows.annotate(bucket=_bucket_expression(selected, bucket))
+        group_columns.append('bucket')
+
+    aggregates = {'count': Count('id'), 'datasets': Count('dataset', distinct=True)}
+    for field in PARAMETER_FIELDS.values():
+        aggregates[f'{field}_mean'] = Avg(field)
+        aggregates[f'{field}_min'] = Min(field)
+        aggregates[f'{field}_max'] = Max(field)
+        aggregates[f'{field}_sq'] = Avg(F(field) * F(field))
+
+    max_rows = getattr(settings, 'AGGREGATE_MAX_ROWS', DEFAULT_MAX_ROWS)
+    results = list(
+        rows.values(*group_columns).annotate(**aggregates).order_by(*group_columns)[:max_rows + 1]
+    )
+    truncated = len(results) > max_rows
+    return [_format_row(row, group_field) for row in results[:max_rows]], truncated
+
+
+def _bucket_expression(datasets, bucket):
+    """
+    Map each row's dataset to its upload-date bucket with a CASE expression.
+
+    Buckets depend only on the dataset, so they are truncated once per
+    dataset here rather than once per equipment row in the GROUP BY.
+    """
+    members = {}
+    buckets = datasets.annotate(bucket=Trunc('upload_date', bucket), rows_owner=Coalesce('rows_source', 'pk'))
+    for pk, start in buckets.values_list('rows_owner', 'bucket'):
+        members.setdefault(start, []).append(pk)
+    if not members:
+        return Value(None, output_field=DateTimeField())
+    return Case(
+        *[When(dataset_id__in=pks, then=Value(start)) for start, pks in members.items()],
+        output_field=DateTimeField(),
+    )
+
+
+def _format_row(row, group_field):
+    bucket = row.get('bucket')
+    formatted = {
+        'key': row[group_field],
+        'bucket': bucket.isoformat() if bucket is not None else None,
+        'count': row['count'],
+        'datasets': row['datasets'],
+        'parameters': {},
+    }
+    for parameter, field in PARAMETER_FIELDS.items():
+        mean = row[f'{field}_mean']
+        # Population std from E[x^2] - E[x]^2, clamped against rounding.
+        variance = max(row[f'{field}_sq'] - mean * mean, 0.0)
+        formatted['parameters'][parameter] = {
+            'mean': mean,
+            'min': row[f'{field}_min'],
+            'max': row[f'{field}_max'],
+            'std': math.sqrt(variance),
+        }
+    return formatted
@@ -0,0 +1,14 @@
+from rest_framework.authentication import TokenAuthentication
+
+
+class QueryTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication from a ``token`` query parameter, for clients that
+    cannot set headers, such as the browser's ``EventSource``.
+    """
+
+    def authenticate(self, request):
+        key = request.query_params.get('token')
+        if not key:
+            return None
+        return self.authenticate_credentials(key)
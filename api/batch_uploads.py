@@ -0,0 +1,114 @@
+"""
+Batch CSV uploads.
+
+A batch is any mix of CSV files and zip archives of CSV files, posted
+together as ``files``. ``BatchUpload`` checks and spools them to disk when
+it is created; ``results`` then ingests them with ``ingest_many`` and
+yields each file's outcome as soon as it is known, so a client sees every
+file finish instead of waiting for the whole batch.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+
+from .ingestion import ingest_many
+
+DEFAULT_MAX_FILES = 100
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class BatchUploadError(ValueError):
+    """Raised for a batch that cannot be accepted at all."""
+
+
+def max_files():
+    return getattr(settings, 'MAX_BATCH_UPLOAD_FILES', DEFAULT_MAX_FILES)
+
+
+class BatchUpload:
+    """
+    The CSV files of one batch request, spooled to a temporary directory.
+
+    Files that cannot be ingested (wrong type, too large, broken archive)
+    are kept as rejected results rather than failing the batch. Uploads the
+    server already spooled to disk are read in place.
+    """
+
+    def __init__(self, uploads):
+        if not uploads:
+            raise BatchUploadError('No files provided')
+        self.sources = []
+        self.rejected = []
+        self._directory = tempfile.TemporaryDirectory(prefix='batch-')
+        try:
+            for upload in uploads:
+                name = upload.name.lower()
+                if name.endswith('.zip'):
+                    self._add_archive(upload)
+                elif name.endswith('.csv'):
+                    self._add_upload(upload)
+                else:
+                    self._reject(upload.name, 'Only CSV files and zip archives of them are supported')
+        except BaseException:
+            self._directory.cleanup()
+            raise
+
+    def results(self, user, progress=None):
+        """
+        Yield ``(filename, dataset, error)`` for every file, rejected ones
+        first; ``error`` is the exception that stopped the file, if any.
+        """
+        try:
+            yield from self.rejected
+            yield from ingest_many(self.sources, user, progress)
+        finally:
+            self._directory.cleanup()
+
+    def _reject(self, filename, message):
+        self.rejected.append((filename, None, BatchUploadError(message)))
+
+    def _add_source(self, filename, path=None):
+        if len(self.sources) >= max_files():
+            raise BatchUploadError(f'A batch can hold at most {max_files()} CSV files')
+        path = path or os.path.join(self._directory.name, f'{len(self.sources)}.csv')
+        self.sources.append((filename, path))
+        return path
+
+    def _add_upload(self, upload):
+        if upload.size > settings.MAX_UPLOAD_SIZE:
+            self._reject(upload.name, 'File too large')
+            return
+        if hasattr(upload, 'temporary_file_path'):
+            self._add_source(upload.name, upload.temporary_file_path())
+            return
+        with open(self._add_source(upload.name), 'wb') as f:
+            for chunk in upload.chunks():
+                f.write(chunk)
+
+    def _add_archive(self, upload):
+        try:
+            archive = zipfile.ZipFile(upload)
+        except zipfile.BadZipFile:
+            self._reject(upload.name, 'Not a valid zip archive')
+            return
+        with archive:
+            for member in archive.infolist():
+                filename = os.path.basename(member.filename)
+                if member.is_dir() or filename.startswith('.') or member.filename.startswith('__MACOSX/'):
+                    continue
+                if not filename.lower().endswith('.csv'):
+                    continue
+                # Reads stop at the declared size, so checking it bounds the copy.
+                if member.file_size > settings.MAX_UPLOAD_SIZE:
+                    self._reject(filename, 'File too large')
+                    continue
+                path = self._add_source(filename)
+                try:
+                    with archive.open(member) as source, open(path, 'wb') as target:
+                        shutil.copyfileobj(source, target, COPY_BLOCK_SIZE)
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                    self.sources.pop()
+                    self._reject(filename, f'Could not extract from {upload.name}: {e}')
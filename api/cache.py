@@ -0,0 +1,94 @@
+"""
+Server-side response cache for the dataset API.
+
+Detail payloads, history lists and chart data are stored in the Django
+cache selected by ``API_CACHE_ALIAS`` (local memory, file system or Redis,
+see ``CACHES`` in settings). PDF reports are not: the report job queue keeps
+one file per dataset version (see ``api.reports``). Values are stored
+pickled, so the bytes measured against ``API_CACHE_MAX_ENTRY_BYTES`` are the
+bytes that get cached. Entries are dropped by the signal handlers in
+``api.signals`` whenever a dataset is saved or deleted; chart entries, whose
+variants are open-ended, carry the dataset version in their key instead.
+Hit/miss counters are kept in the cache itself so every worker reports the
+same numbers.
+"""
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+
+KINDS = ('detail', 'history', 'chart')
+DATASET_VARIANTS = ('detail-rows', 'detail-columns')
+
+DEFAULT_TIMEOUT = 60 * 60
+DEFAULT_MAX_ENTRY_BYTES = 5 * 1024 * 1024
+
+_MISSING = object()
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def dataset_key(dataset_id, variant):
+    return f'api:dataset:{dataset_id}:{variant}'
+
+
+def history_key(user_id):
+    return f'api:history:{user_id}'
+
+
+def _stats_key(kind, outcome):
+    return f'api:stats:{kind}:{outcome}'
+
+
+def _count(kind, outcome):
+    cache = get_cache()
+    key = _stats_key(kind, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def cached(key, kind, build):
+    """Return the cached value for ``key``, calling ``build`` on a miss."""
+    cache = get_cache()
+    entry = cache.get(key, _MISSING)
+    if entry is not _MISSING:
+        _count(kind, 'hits')
+        # Entries cached before values were stored pickled are the value itself.
+        return pickle.loads(entry) if isinstance(entry, bytes) else entry
+
+    _count(kind, 'misses')
+    value = build()
+    # Pickle once: the backend only has to copy these bytes, not walk the value again.
+    entry = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    max_bytes = getattr(settings, 'API_CACHE_MAX_ENTRY_BYTES', DEFAULT_MAX_ENTRY_BYTES)
+    if len(entry) <= max_bytes:
+        cache.set(key, entry, getattr(settings, 'API_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return value
+
+
+def invalidate_dataset(dataset_id, user_id):
+    keys = [dataset_key(dataset_id, variant) for variant in DATASET_VARIANTS]
+    get_cache().delete_many(keys + [history_key(user_id)])
+
+
+def stats():
+    cache = get_cache()
+    counters = cache.get_many(
+        [_stats_key(kind, outcome) for kind in KINDS for outcome in ('hits', 'misses')]
+    )
+    result = {}
+    for kind in KINDS:
+        hits = counters.get(_stats_key(kind, 'hits'), 0)
+        misses = counters.get(_stats_key(kind, 'misses'), 0)
+        total = hits + misses
+        result[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else None,
+        }
+    return result
@@ -0,0 +1,231 @@
+"""
+Plot-ready chart series for a dataset.
+
+Each chart is computed on the server and stays small whatever the size of
+the dataset:
+
+* ``types``: count and mean of every parameter per equipment type, read
+  from the stored ``DatasetSketch`` without touching the rows.
+* ``histogram``: counts of one parameter in ``bins`` equal-width bins.
+* ``line``: one parameter in row order (or against ``x``), downsampled to
+  ``points`` with LTTB or min/max decimation.
+* ``scatter``: one parameter against another, ordered by ``x`` and
+  decimated the same way.
+
+Row-based charts read only the columns they plot (from the column store
+when enabled) and can be restricted to one equipment ``type``.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+
+from .columnar import fetch_columns
+from .models import DatasetStatistics
+from .sketches import PARAMETERS, DatasetSketch, build_statistics
+
+CHARTS = ('types', 'histogram', 'line', 'scatter')
+METHODS = ('lttb', 'minmax')
+
+DEFAULT_BINS = 20
+MAX_BINS = 200
+DEFAULT_POINTS = 1000
+MAX_POINTS = 10000
+
+
+class ChartQueryError(ValueError):
+    """Raised for an invalid chart query parameter."""
+
+
+def _parameter(params, name, required=True):
+    value = params.get(name)
+    if not value:
+        if required:
+            raise ChartQueryError(f'{name} is required')
+        return None
+    if value not in PARAMETERS:
+        raise ChartQueryError(f'{name} must be one of: {", ".join(PARAMETERS)}')
+    return value
+
+
+def _bounded_int(params, name, default, maximum, minimum=1):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ChartQueryError(f'{name} must be an integer')
+    if value < minimum:
+        raise ChartQueryError(f'{name} must be at least {minimum}')
+    return min(value, maximum)
+
+
+def parse_query(params):
+    """Validate the chart query string into keyword arguments for ``chart_data``."""
+    chart = params.get('chart', 'types')
+    if chart not in CHARTS:
+        raise ChartQueryError(f'chart must be one of: {", ".join(CHARTS)}')
+    if chart == 'types':
+        return {'chart': chart}
+
+    query = {'chart': chart, 'equipment_type': params.get('type') or None}
+    if chart == 'histogram':
+        query['field'] = _parameter(params, 'field')
+        query['bins'] = _bounded_int(params, 'bins', DEFAULT_BINS, getattr(settings, 'CHART_MAX_BINS', MAX_BINS))
+        return query
+
+    query['y'] = _parameter(params, 'y')
+    query['x'] = _parameter(params, 'x', required=chart == 'scatter')
+    query['points'] = _bounded_int(
+        params, 'points', DEFAULT_POINTS, getattr(settings, 'CHART_MAX_POINTS', MAX_POINTS), minimum=3
+    )
+    query['method'] = params.get('method') or ('lttb' if chart == 'line' else 'minmax')
+    if query['method'] not in METHODS:
+        raise ChartQueryError(f'method must be one of: {", ".join(METHODS)}')
+    return query
+
+
+def query_key(query):
+    """Short stable key of a parsed query, for cache keys and ETags."""
+    text = '&'.join(f'{name}={query[name]}' for name in sorted(query))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def chart_data(dataset, chart, **options):
+    if chart == 'types':
+        return types_chart(dataset)
+    if chart == 'histogram':
+        return histogram_chart(dataset, **options)
+    return series_chart(dataset, chart, **options)
+
+
+def types_chart(dataset):
+    try:
+        statistics = dataset.statistics
+    except DatasetStatistics.DoesNotExist:
+        statistics = build_statistics(dataset)
+    sketch = DatasetSketch.from_dict(statistics.sketch)
+
+    labels = list(sketch.by_type)
+    return {
+        'chart': 'types',
+        'labels': labels,
+        'counts': [sketch.by_type[label][PARAMETERS[0]].count for label in labels],
+        'means': {
+            name: [sketch.by_type[label][name].mean for label in labels] for name in PARAMETERS
+        },
+        'overall': {name: sketch.parameters[name].moments.mean for name in PARAMETERS},
+    }
+
+
+def _read(dataset, fields, eq_type):
+    """Float arrays of ``fields``, restricted to rows of ``eq_type`` if given."""
+    columns, _ = fetch_columns(dataset, [*fields, 'Type'] if eq_type else list(fields))
+    arrays = [np.asarray(columns[field], dtype=np.float64) for field in fields]
+    if eq_type:
+        mask = np.asarray(columns['Type'], dtype=object) == eq_type
+        arrays = [values[mask] for values in arrays]
+    return arrays
+
+
+def histogram_chart(dataset, field, bins, equipment_type=None):
+    values, = _read(dataset, [field], equipment_type)
+    if values.size:
+        counts, edges = np.histogram(values, bins=bins)
+    else:
+        counts, edges = np.zeros(bins, dtype=np.intp), np.linspace(0.0, 1.0, bins + 1)
+    return {
+        'chart': 'histogram',
+        'field': field,
+        'type': equipment_type,
+        'total': int(values.size),
+        'edges': edges.tolist(),
+        'counts': counts.tolist(),
+    }
+
+
+def series_chart(dataset, chart, y, x, points, method, equipment_type=None):
+    if x is None:
+        y_values, = _read(dataset, [y], equipment_type)
+        x_values = np.arange(y_values.size, dtype=np.float64)
+    else:
+        x_values, y_values = _read(dataset, [x, y], equipment_type)
+        order = np.argsort(x_values, kind='stable')
+        x_values, y_values = x_values[order], y_values[order]
+
+    if method == 'lttb':
+        indices = lttb(x_values, y_values, points)
+    else:
+        indices = minmax(y_values, points)
+    return {
+        'chart': chart,
+        'x_field': x or 'index',
+        'y_field': y,
+        'type': equipment_type,
+        'method': method,
+        'total': int(y_values.size),
+        'x': x_values[indices].tolist(),
+        'y': y_values[indices].tolist(),
+    }
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of ``threshold`` points chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept; every bucket in between contributes
+    the point forming the largest triangle with the previously chosen point
+    and the average of the next bucket.
+    """
+    n = y.size
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    bounds = (np.arange(threshold - 1) * every).astype(np.intp) + 1
+    bounds[-1] = n - 1
+    # Averages of each bucket's successor; the last bucket's is the final point.
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    next_start = np.append(bounds[1:-1], n - 1)
+    next_end = np.append(bounds[2:], n)
+    widths = next_end - next_start
+    avg_x = (cx[next_end] - cx[next_start]) / widths
+    avg_y = (cy[next_end] - cy[next_start]) / widths
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        area = np.abs(
+            (x[a] - avg_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y[i] - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, points):
+    """
+    Indices of the minimum and maximum of ``y`` in each of ``(points - 2) // 2``
+    equal buckets, plus the first and last point, in order.
+    """
+    n = y.size
+    if points >= n:
+        return np.arange(n)
+
+    size = -(-n // max((points - 2) // 2, 1))
+    buckets = -(-n // size)
+    offsets = np.arange(buckets) * size
+    low = np.full(buckets * size, np.inf)
+    low[:n] = y
+    high = np.full(buckets * size, -np.inf)
+    high[:n] = y
+    indices = np.concatenate((
+        [0, n - 1],
+        low.reshape(buckets, size).argmin(axis=1) + offsets,
+        high.reshape(buckets, size).argmax(axis=1) + offsets,
+    ))
+    return np.unique(indices)
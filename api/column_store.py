@@ -0,0 +1,231 @@
+"""
+Columnar on-disk copy of each dataset's rows.
+
+Every dataset version is written once as an Arrow IPC (Feather v2) file
+under ``COLUMN_STORE_DIR/<dataset id>/<version>.arrow``, where the version
+is ``updated_at``, so a file can never be read for rows it does not hold.
+Files are streamed batch by batch during ingestion and opened with
+``memory_map`` for reads: only the requested columns are touched, and
+their buffers are used in place when ``COLUMN_STORE_COMPRESSION`` is None
+(with LZ4 or zstd only those columns are decompressed).
+
+``Equipment`` rows remain the source of truth. A delta (see
+``api.deltas``) derives the new version from the previous file with
+``patch_column_file``. A dataset with no file for its current version
+(older uploads, rows changed some other way) gets one rebuilt from the
+database on first read; ``manage.py build_column_store`` backfills them
+ahead of time. A dataset linked to another's rows (see ``api.dedup``)
+reads that dataset's file.
+"""
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.feather
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+DEFAULT_COMPRESSION = 'lz4'
+BUILD_CHUNK_SIZE = 50000
+
+# CSV column name -> Equipment field, in file order.
+COLUMNS = {
+    'Equipment Name': 'name',
+    'Type': 'equipment_type',
+    'Flowrate': 'flowrate',
+    'Pressure': 'pressure',
+    'Temperature': 'temperature',
+}
+
+
+def enabled():
+    return pyarrow is not None and getattr(settings, 'COLUMN_STORE_ENABLED', True)
+
+
+def store_dir():
+    return getattr(settings, 'COLUMN_STORE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'columns')
+
+
+def dataset_dir(dataset_id):
+    return os.path.join(store_dir(), str(dataset_id))
+
+
+def version(dataset):
+    return f'{dataset.rows_dataset.updated_at.timestamp():.6f}'
+
+
+def column_path(dataset):
+    return os.path.join(dataset_dir(dataset.rows_dataset.pk), f'{version(dataset)}.arrow')
+
+
+def schema():
+    return pyarrow.schema([
+        ('Equipment Name', pyarrow.string()),
+        ('Type', pyarrow.string()),
+        ('Flowrate', pyarrow.float64()),
+        ('Pressure', pyarrow.float64()),
+        ('Temperature', pyarrow.float64()),
+    ])
+
+
+class ColumnFileWriter:
+    """
+    Streams DataFrame chunks into a temporary column file; ``commit`` moves
+    it into place for the dataset's current version. Leaving the ``with``
+    block without committing deletes the file.
+    """
+
+    def __init__(self, dataset_id):
+        self._directory = dataset_dir(dataset_id)
+        self._schema = schema()
+        self._temp_path = None
+        self._sink = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._close()
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        return False
+
+    def write(self, frame):
+        """Append a DataFrame with the CSV columns (``Type`` may be categorical)."""
+        arrays = [
+            pyarrow.array(frame[field.name], from_pandas=True).cast(field.type)
+            for field in self._schema
+        ]
+        self.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+
+    def write_table(self, table):
+        """Append a ``pyarrow.Table`` with the file's schema."""
+        if self._writer is None:
+            os.makedirs(self._directory, exist_ok=True)
+            self._temp_path = os.path.join(self._directory, f'{uuid.uuid4().hex}.tmp')
+            self._sink = pyarrow.OSFile(self._temp_path, 'wb')
+            compression = getattr(settings, 'COLUMN_STORE_COMPRESSION', DEFAULT_COMPRESSION)
+            self._writer = pyarrow.ipc.new_file(
+                self._sink, self._schema,
+                options=pyarrow.ipc.IpcWriteOptions(compression=compression),
+            )
+        self._writer.write_table(table)
+
+    def commit(self, dataset):
+        """Publish the file as ``dataset``'s current version and drop older versions."""
+        if self._writer is None:
+            self.write(_empty_frame())
+        self._close()
+        path = column_path(dataset)
+        os.replace(self._temp_path, path)
+        self._temp_path = None
+        for name in os.listdir(self._directory):
+            if name.endswith('.arrow') and os.path.join(self._directory, name) != path:
+                os.remove(os.path.join(self._directory, name))
+        return path
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            self._writer = None
+
+
+def _empty_frame():
+    return pd.DataFrame({name: [] for name in COLUMNS})
+
+
+def build_column_file(dataset, chunk_size=BUILD_CHUNK_SIZE):
+    """Write ``dataset``'s current rows from the database into its column file."""
+    dataset = dataset.rows_dataset
+    rows = dataset.equipment.order_by('id').values_list(*COLUMNS.values())
+    with ColumnFileWriter(dataset.pk) as writer:
+        batch = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                writer.write(pd.DataFrame(batch, columns=list(COLUMNS)))
+                batch = []
+        if batch:
+            writer.write(pd.DataFrame(batch, columns=list(COLUMNS)))
+        return writer.commit(dataset)
+
+
+def patch_column_file(path, dataset, updates, deletes, inserts):
+    """
+    Write ``dataset``'s current column file from the file of its previous
+    version at ``path`` rather than from the database. ``updates`` maps
+    names to new ``(type, flowrate, pressure, temperature)`` values, which
+    go to the first row of that name (later ones are dropped); rows named
+    in ``deletes`` are dropped and the ``inserts`` rows (name, type and
+    parameters) appended, as the delta did to the ``Equipment`` rows.
+
+    Returns the new file's path, or None when there is no file at ``path``.
+    """
+    try:
+        table = pyarrow.feather.read_table(path, memory_map=True)
+    except FileNotFoundError:
+        return None
+
+    updates = dict(updates)
+    names = table.column('Equipment Name')
+    value_set = pyarrow.array([*updates, *deletes], pyarrow.string())
+    touched = pyarrow.compute.is_in(names, value_set=value_set).to_numpy(zero_copy_only=False)
+    keep, updated = ~touched, np.zeros_like(touched)
+    values = []
+    for position in touched.nonzero()[0]:
+        name = names[position].as_py()
+        if name in updates:
+            keep[position] = updated[position] = True
+            values.append(updates.pop(name))
+
+    if values:
+        mask = pyarrow.array(updated)
+        for index, column in enumerate(list(COLUMNS)[1:], start=1):
+            replacements = pyarrow.array([row[index - 1] for row in values], table.schema.field(column).type)
+            column_values = pyarrow.compute.replace_with_mask(
+                table.column(column).combine_chunks(), mask, replacements,
+            )
+            table = table.set_column(index, column, column_values)
+
+    with ColumnFileWriter(dataset.rows_dataset.pk) as writer:
+        writer.write_table(table.filter(pyarrow.array(keep)))
+        if inserts:
+            writer.write(pd.DataFrame(inserts, columns=list(COLUMNS)))
+        return writer.commit(dataset)
+
+
+def read_table(dataset, columns=None):
+    """
+    Return ``dataset``'s rows as a memory-mapped ``pyarrow.Table`` holding
+    only ``columns``, building the file if needed, or None when the column
+    store is disabled.
+    """
+    if not enabled():
+        return None
+    columns = list(columns or COLUMNS)
+    try:
+        return pyarrow.feather.read_table(column_path(dataset), columns=columns, memory_map=True)
+    except FileNotFoundError:
+        path = build_column_file(dataset)
+        return pyarrow.feather.read_table(path, columns=columns, memory_map=True)
+
+
+def move_file(path, target):
+    """Move the column file at ``path``, if there is one, to ``target``."""
+    if os.path.exists(path):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+
+def delete_dataset_files(dataset_id):
+    shutil.rmtree(dataset_dir(dataset_id), ignore_errors=True)
@@ -0,0 +1,115 @@
+"""
+Columnar, cursor-paginated access to a dataset's ``Equipment`` rows.
+
+Rows are returned as one array per requested column, so clients fetch
+only the columns and row ranges they render. With the column store
+enabled they are sliced from the dataset's memory-mapped column file and
+paged by row offset; otherwise they are read from ``Equipment`` and paged
+by keyset on ``Equipment.id``.
+"""
+import base64
+
+from django.conf import settings
+
+from . import column_store
+
+COLUMN_FIELDS = column_store.COLUMNS
+
+DEFAULT_PAGE_SIZE = 10000
+MAX_PAGE_SIZE = 100000
+
+
+class ColumnarQueryError(ValueError):
+    """Raised for an invalid ``fields``, ``cursor`` or ``limit`` parameter."""
+
+
+def parse_fields(value):
+    if not value:
+        return list(COLUMN_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in COLUMN_FIELDS]
+    if unknown:
+        raise ColumnarQueryError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return getattr(settings, 'COLUMNAR_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ColumnarQueryError('limit must be an integer')
+    if limit < 1:
+        raise ColumnarQueryError('limit must be positive')
+    return min(limit, getattr(settings, 'COLUMNAR_MAX_PAGE_SIZE', MAX_PAGE_SIZE))
+
+
+def encode_cursor(position, version=None):
+    """Cursor after ``Equipment.id`` ``position``, or row offset ``position`` of a column file version."""
+    value = str(position) if version is None else f'{position}@{version}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(value):
+    """Return ``(position, version)``, or None without a cursor."""
+    if not value:
+        return None
+    try:
+        position, _, version = base64.urlsafe_b64decode(value.encode()).decode().partition('@')
+        return int(position), version or None
+    except (ValueError, UnicodeDecodeError):
+        raise ColumnarQueryError('Invalid cursor')
+
+
+def fetch_columns(dataset, fields=None, after=None, limit=None):
+    """
+    Return ``(columns, next_cursor)`` for one page of ``dataset``'s rows.
+
+    ``columns`` maps each requested column name to an array of values
+    (a NumPy array from the column store, a list from the database);
+    ``next_cursor`` is None on the last page. ``after`` is a decoded
+    cursor. Without ``limit`` every row after ``after`` is returned.
+    """
+    fields = fields or list(COLUMN_FIELDS)
+    position, cursor_version = after or (None, None)
+
+    if cursor_version is not None or position is None:
+        table = column_store.read_table(dataset, fields)
+        if table is not None:
+            version = column_store.version(dataset)
+            if cursor_version not in (None, version):
+                raise ColumnarQueryError('The dataset has changed since this cursor was issued')
+            return _slice_table(table, fields, position or 0, limit, version)
+        if cursor_version is not None:
+            raise ColumnarQueryError('Invalid cursor')
+
+    return _fetch_rows(dataset, fields, position, limit)
+
+
+def _slice_table(table, fields, offset, limit, version):
+    page = table.slice(offset, limit)
+    next_cursor = None
+    if limit is not None and offset + limit < table.num_rows:
+        next_cursor = encode_cursor(offset + limit, version)
+    columns = {field: page.column(field).to_numpy() for field in fields}
+    return columns, next_cursor
+
+
+def _fetch_rows(dataset, fields, after, limit):
+    rows = dataset.rows_dataset.equipment.order_by('id')
+    if after is not None:
+        rows = rows.filter(id__gt=after)
+    rows = rows.values_list('id', *[COLUMN_FIELDS[field] for field in fields])
+    if limit is not None:
+        rows = rows[:limit + 1]
+
+    rows = list(rows)
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0])
+
+    arrays = list(zip(*rows)) if rows else [()] * (len(fields) + 1)
+    columns = {field: list(values) for field, values in zip(fields, arrays[1:])}
+    return columns, next_cursor
@@ -0,0 +1,159 @@
+"""
+HTTP compression of request and response bodies.
+
+``RequestDecompressionMiddleware`` decodes ``Content-Encoding: gzip`` (and
+``zstd`` when the ``zstandard`` package is installed) request bodies as
+they are read, so a compressed upload is never inflated in memory as a
+whole. ``ResponseCompressionMiddleware`` compresses text, JSON and Arrow
+responses of at least ``RESPONSE_COMPRESSION_MIN_SIZE`` bytes with the
+encoding the client's ``Accept-Encoding`` prefers.
+"""
+import gzip
+import io
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_MAX_DECODED_SIZE = 128 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/vnd.apache.arrow.stream')
+
+DECODERS = {
+    'gzip': lambda stream: gzip.GzipFile(fileobj=stream, mode='rb'),
+    'x-gzip': lambda stream: gzip.GzipFile(fileobj=stream, mode='rb'),
+}
+DECODE_ERRORS = (OSError, EOFError, zlib.error)
+
+# In order of preference when the client accepts several equally.
+ENCODERS = {
+    'gzip': lambda content: gzip.compress(content, compresslevel=6, mtime=0),
+}
+
+if zstandard is not None:
+    DECODERS['zstd'] = lambda stream: zstandard.ZstdDecompressor().stream_reader(
+        stream, read_across_frames=True
+    )
+    DECODE_ERRORS += (zstandard.ZstdError,)
+    ENCODERS = {'zstd': lambda content: zstandard.ZstdCompressor(level=3).compress(content), **ENCODERS}
+
+
+class ContentDecodingError(SuspiciousOperation):
+    """A request body that is not valid for its encoding, or decodes past the size limit."""
+
+
+class DecodedStream(io.RawIOBase):
+    """Decoded view of a request body, bounded to ``limit`` bytes."""
+
+    def __init__(self, reader, encoding, limit):
+        self._reader = reader
+        self._encoding = encoding
+        self._limit = limit
+        self._size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self._reader.read(len(buffer))
+        except DECODE_ERRORS as e:
+            raise ContentDecodingError(f'Invalid {self._encoding} request body: {e}')
+        self._size += len(data)
+        if self._size > self._limit:
+            raise ContentDecodingError('Request body too large once decoded')
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def accepted_encoding(header):
+    """Return the entry of ``ENCODERS`` an ``Accept-Encoding`` header ranks highest, or None."""
+    weights = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for coding in ENCODERS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class RequestDecompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity':
+            decoder = DECODERS.get(encoding)
+            if decoder is None:
+                response = JsonResponse(
+                    {'error': f'Unsupported Content-Encoding: {encoding}'}, status=415
+                )
+                response['Accept-Encoding'] = ', '.join(DECODERS)
+                return response
+
+            limit = getattr(settings, 'MAX_DECODED_REQUEST_SIZE', DEFAULT_MAX_DECODED_SIZE)
+            request._stream = DecodedStream(decoder(request._stream), encoding, limit)
+            # The decoded size is unknown up front, so never buffer files in memory.
+            request.upload_handlers = [TemporaryFileUploadHandler(request)]
+
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, ContentDecodingError):
+            return JsonResponse({'error': str(exception)}, status=400)
+        return None
+
+
+class ResponseCompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE):
+            return response
+        encoding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = ENCODERS[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+
+        # The encoded bytes differ from the identity representation.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
@@ -0,0 +1,172 @@
+"""
+Recognising repeated uploads.
+
+Every upload is hashed twice: ``content_hash`` over its raw bytes and
+``RowsHash`` over its validated rows in a normalized form (canonical
+column order, stripped text, float values), so files that differ only in
+layout (whitespace, line endings, column order, extra columns, rows that
+fail validation) still match. An upload matching an earlier dataset of
+the same user becomes a new dataset linked to the one holding the rows:
+it keeps its own history entry and a copy of the small statistics sketch,
+but no ``Equipment`` rows or column file of its own.
+"""
+import hashlib
+
+import pandas as pd
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import column_store
+from .cache import invalidate_dataset
+from .bulk_writer import ROW_COLUMNS
+from .models import DatasetStatistics, Equipment, EquipmentDataset
+from .sketches import PARAMETERS, DatasetSketch, build_statistics
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hash(stream):
+    """SHA-256 of everything left in the binary ``stream``, read in blocks."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+class RowsHash:
+    """Order-sensitive SHA-256 of validated rows, fed chunk by chunk."""
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def add_rows(self, chunk):
+        frame = pd.DataFrame({
+            'Equipment Name': chunk['Equipment Name'],
+            # Categorical or not, values hash the same.
+            'Type': chunk['Type'],
+            **{name: chunk[name].astype('float64') for name in PARAMETERS},
+        })
+        self._digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def find_duplicate(user, content_hash=None, rows_hash=None):
+    """The dataset holding the rows of ``user``'s earlier upload with either hash, or None."""
+    query = Q()
+    if content_hash:
+        query |= Q(content_hash=content_hash)
+    if rows_hash:
+        query |= Q(rows_hash=rows_hash)
+    if not query:
+        return None
+    match = (
+        EquipmentDataset.objects.filter(query, user=user)
+        .select_related('rows_source').order_by('upload_date').first()
+    )
+    return match.rows_dataset if match is not None else None
+
+
+def link_duplicate(source, user, filename, content_hash, validation=None):
+    """
+    Create ``user``'s dataset for an upload whose rows ``source`` already
+    holds. Its ``validation`` report is ``source``'s unless given.
+    """
+    try:
+        sketch = source.statistics.sketch
+    except DatasetStatistics.DoesNotExist:
+        sketch = build_statistics(source).sketch
+
+    with transaction.atomic():
+        dataset = EquipmentDataset.objects.create(
+            user=user, filename=filename, rows_source=source,
+            content_hash=content_hash, rows_hash=source.rows_hash,
+            validation=source.validation if validation is None else validation,
+            **DatasetSketch.from_dict(sketch).as_dataset_fields(),
+        )
+        DatasetStatistics.objects.create(dataset=dataset, sketch=sketch)
+    return dataset
+
+
+def hand_over_rows(dataset):
+    """
+    Before ``dataset`` is deleted, give its rows and column file to the
+    oldest dataset linked to it; the other links then point there.
+    """
+    heir = dataset.linked_datasets.order_by('upload_date', 'pk').first()
+    if heir is None:
+        return
+    source_path = column_store.column_path(dataset)
+    linked = list(dataset.linked_datasets.values_list('pk', 'user_id'))
+
+    Equipment.objects.filter(dataset=dataset).update(dataset=heir)
+    dataset.linked_datasets.exclude(pk=heir.pk).update(rows_source=heir)
+    EquipmentDataset.objects.filter(pk=heir.pk).update(rows_source=None)
+    # The file goes to the version the heir has once touched.
+    heir.updated_at = _touch(linked)
+
+    heir.rows_source = None
+    target_path = column_store.column_path(heir)
+    transaction.on_commit(lambda: column_store.move_file(source_path, target_path))
+
+
+def detach_rows(dataset):
+    """
+    Before ``dataset``'s rows change, stop sharing them: a linked dataset
+    gets a copy of its source's rows, and a dataset others link to copies
+    its rows to the oldest of them, which the rest then point to. Either
+    way ``dataset`` no longer matches its upload, so its hashes are cleared.
+    """
+    if dataset.rows_source_id:
+        copy_rows(dataset.rows_source_id, dataset.pk)
+    else:
+        heir = dataset.linked_datasets.order_by('upload_date', 'pk').first()
+        if heir is not None:
+            copy_rows(dataset.pk, heir.pk)
+            others = dataset.linked_datasets.exclude(pk=heir.pk)
+            _touch(others.values_list('pk', 'user_id'))
+            others.update(rows_source=heir)
+            heir.rows_source = None
+            # Also clears the heir's cached detail, whose rows_source changed.
+            heir.save(update_fields=['rows_source'])
+
+    dataset.rows_source = None
+    dataset.content_hash = dataset.rows_hash = ''
+    EquipmentDataset.objects.filter(pk=dataset.pk).update(rows_source=None, content_hash='', rows_hash='')
+
+
+def _touch(datasets):
+    """
+    Mark the ``(pk, user_id)`` datasets whose rows changed hands through
+    ``update()``, which sends no signals: a new ``updated_at`` retires their
+    ETags and versioned chart entries, and their cached detail is dropped
+    once the transaction commits. Returns the new ``updated_at``.
+    """
+    datasets = list(datasets)
+    if not datasets:
+        return None
+    updated_at = timezone.now()
+    EquipmentDataset.objects.filter(pk__in=[pk for pk, _ in datasets]).update(updated_at=updated_at)
+
+    def invalidate():
+        for pk, user_id in datasets:
+            invalidate_dataset(pk, user_id)
+    transaction.on_commit(invalidate)
+    return updated_at
+
+
+def copy_rows(source_id, target_id):
+    """Copy the ``Equipment`` rows of one dataset to another, in order, inside the database."""
+    connection = connections[router.db_for_write(Equipment)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in ROW_COLUMNS)
+    copied = ', '.join(quote(column) for column in ROW_COLUMNS[1:])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(Equipment._meta.db_table)} ({columns}) '
+            f'SELECT %s, {copied} FROM {quote(Equipment._meta.db_table)} '
+            f'WHERE {quote("dataset_id")} = %s ORDER BY {quote("id")}',
+            [target_id, source_id],
+        )
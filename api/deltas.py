@@ -0,0 +1,145 @@
+"""
+Delta uploads: inserts, updates and deletes applied to an existing dataset.
+
+Rows are keyed by ``Equipment Name``. Every ``upsert`` row (from a CSV file
+or a JSON list of row objects, with the upload columns) replaces the row of
+that name, or is appended when there is none; ``delete`` lists names to
+remove. Upserted rows are validated like an upload, but a delta is applied
+whole or not at all, so any rejected row fails it.
+
+Only the named rows are read and written, and the stored statistics are
+updated from their old and new values (``update_statistics``), so a delta
+costs time in proportion to its own size rather than the dataset's. The
+column file's new version is patched from the previous one once the delta
+has committed (``column_store.patch_column_file``), which rewrites the file
+but reads no rows from the database. The exception is a dataset sharing its
+rows with a repeated upload (see ``api.dedup``), whose rows are copied
+apart first and whose column file is rebuilt on first read.
+"""
+import pandas as pd
+from django.db import transaction
+
+from . import column_store, dedup, events
+from .bulk_writer import EquipmentBulkWriter
+from .models import Equipment, EquipmentDataset
+from .sketches import PARAMETERS, update_statistics
+from .validation import ChunkValidator, Header, IngestionError
+
+LOOKUP_BATCH_SIZE = 500
+UPDATE_BATCH_SIZE = 1000
+ROW_FIELDS = ['equipment_type', 'flowrate', 'pressure', 'temperature']
+
+
+class DeltaError(IngestionError):
+    """Raised for a delta that cannot be applied; ``errors`` lists rejected rows."""
+
+
+def row_chunks(rows, report):
+    """Validate a JSON list of row objects into the single chunk ``apply_delta`` takes."""
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise DeltaError('upsert must be a list of row objects')
+    if rows:
+        frame = pd.DataFrame.from_records(rows)
+        yield ChunkValidator(Header(frame.columns), report).validate(frame)
+
+
+def parse_deletes(names):
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise DeltaError('delete must be a list of equipment names')
+    return {name.strip() for name in names if name.strip()}
+
+
+def apply_delta(dataset, chunks, report, deletes=()):
+    """
+    Upsert the validated ``chunks`` (see ``iter_chunks`` and ``row_chunks``,
+    validating into ``report``) and delete the ``deletes`` names in
+    ``dataset``. Returns the updated dataset and counts of the rows
+    inserted, updated and deleted, plus the names to delete that were not
+    found.
+    """
+    deletes = set(deletes)
+    added, removed = [], []
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    with EquipmentBulkWriter() as writer:
+        dataset = EquipmentDataset.objects.select_for_update().get(pk=dataset.pk)
+        shared = dataset.rows_source_id is not None or dataset.linked_datasets.exists()
+        previous_file = column_store.column_path(dataset)
+        dedup.detach_rows(dataset)
+        rows = Equipment.objects.filter(dataset=dataset)
+        updates, inserts = {}, []
+
+        for chunk in chunks:
+            if report.rejected:
+                raise DeltaError(
+                    f'{report.rejected} rows of the delta are invalid', report.to_dict()['errors']
+                )
+            conflicts = deletes.intersection(chunk['Equipment Name'])
+            if conflicts:
+                raise DeltaError(f'Rows both upserted and deleted: {", ".join(sorted(conflicts)[:20])}')
+
+            existing = _find(rows, chunk['Equipment Name'].tolist())
+            changed, stale, new = [], [], []
+            for name, eq_type, flowrate, pressure, temperature in chunk.itertuples(index=False, name=None):
+                matches = existing.get(name)
+                if not matches:
+                    new.append((name, eq_type, flowrate, pressure, temperature))
+                    continue
+                removed.extend(_values(row) for row in matches)
+                # Older uploads may hold a name more than once; the delta leaves one row.
+                row, *extra = matches
+                row.equipment_type, row.flowrate, row.pressure, row.temperature = (
+                    eq_type, flowrate, pressure, temperature
+                )
+                changed.append(row)
+                stale.extend(extra)
+                updates[name] = (eq_type, flowrate, pressure, temperature)
+
+            Equipment.objects.bulk_update(changed, ROW_FIELDS, batch_size=UPDATE_BATCH_SIZE)
+            _delete(stale)
+            writer.write(dataset, new)
+            inserts.extend(new)
+            added.append(chunk[['Type', *PARAMETERS]])
+            counts['inserted'] += len(new)
+            counts['updated'] += len(changed)
+
+        existing = _find(rows, deletes)
+        for matches in existing.values():
+            removed.extend(_values(row) for row in matches)
+            _delete(matches)
+            counts['deleted'] += len(matches)
+        not_found = sorted(deletes.difference(existing))
+
+        update_statistics(
+            dataset,
+            added=pd.concat(added, ignore_index=True) if added else None,
+            removed=pd.DataFrame(removed, columns=['Type', *PARAMETERS]) if removed else None,
+        )
+        events.dataset_changed('dataset_updated', dataset)
+        if column_store.enabled() and not shared:
+            deleted = list(existing)
+            transaction.on_commit(
+                lambda: column_store.patch_column_file(previous_file, dataset, updates, deleted, inserts)
+            )
+
+    return dataset, {**counts, 'not_found': not_found}
+
+
+def _find(rows, names):
+    """The rows named in ``names``, as lists by name, looked up in batches."""
+    names = list(names)
+    found = {}
+    for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+        for row in rows.filter(name__in=names[start:start + LOOKUP_BATCH_SIZE]).order_by('id'):
+            found.setdefault(row.name, []).append(row)
+    return found
+
+
+def _values(row):
+    return row.equipment_type, row.flowrate, row.pressure, row.temperature
+
+
+def _delete(rows):
+    ids = [row.pk for row in rows]
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        Equipment.objects.filter(pk__in=ids[start:start + LOOKUP_BATCH_SIZE]).delete()
@@ -0,0 +1,198 @@
+"""
+Per-user push events, streamed to clients as Server-Sent Events.
+
+Events are appended to a short log in the cache selected by
+``EVENTS_CACHE_ALIAS`` (the API cache by default): a counter per user
+numbers them and each one is stored under its number for
+``EVENTS_TTL`` seconds. Any process can publish (web workers, the ingestion
+pool's parent, the report worker) and any process can stream, as long as
+they share the cache, i.e. with the file or Redis backend rather than local
+memory once there is more than one process.
+
+``/api/events/`` streams the log as ``text/event-stream``. Every message
+carries its number as the SSE ``id``, and each stream opens with the number
+it starts after, so a client reconnecting with ``Last-Event-ID`` resumes
+where it left off. Under ASGI streams end after ``EVENTS_STREAM_SECONDS``;
+under WSGI, where an open stream holds a worker, after
+``EVENTS_WSGI_STREAM_SECONDS`` (by default right after the first poll, which
+makes the stream a poll every ``RECONNECT_MS``). ``EventSource`` clients
+reconnect on their own.
+
+Kinds sent:
+
+* ``ingest_progress``: ``{upload, filename, rows, bytes}`` after each chunk
+  of an upload is written (``upload`` is the chunked upload session, if any);
+* ``dataset_created``, ``dataset_updated``: ``{dataset}`` as in the history
+  list, once the change has committed;
+* ``dataset_deleted``: ``{id}``;
+* ``upload_finished``: ``{upload}`` as returned by ``/api/uploads/{id}/``,
+  once a completed chunked upload has been ingested or has failed;
+* ``report_finished``: ``{job}`` as returned by ``/api/reports/{id}/``.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .serializers import EquipmentDatasetListSerializer
+
+DEFAULT_TTL = 5 * 60
+DEFAULT_POLL_INTERVAL = 0.25
+DEFAULT_KEEPALIVE = 15
+DEFAULT_STREAM_SECONDS = 5 * 60
+DEFAULT_WSGI_STREAM_SECONDS = 0
+RECONNECT_MS = 3000
+MAX_BACKLOG = 1000
+# Seconds the newest event may stay numbered but unstored before a stream
+# moves past it.
+WRITE_GRACE = 2.0
+
+
+def get_cache():
+    alias = getattr(settings, 'EVENTS_CACHE_ALIAS', None)
+    return caches[alias or getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def _last_key(user_id):
+    return f'api:events:{user_id}:last'
+
+
+def _event_key(user_id, number):
+    return f'api:events:{user_id}:{number}'
+
+
+def publish(user_id, kind, data):
+    """Append a ``kind`` event with JSON-serializable ``data`` to ``user_id``'s log."""
+    cache = get_cache()
+    key = _last_key(user_id)
+    try:
+        number = cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        number = cache.incr(key)
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    cache.set(_event_key(user_id, number), (kind, payload), getattr(settings, 'EVENTS_TTL', DEFAULT_TTL))
+    return number
+
+
+def publish_on_commit(user_id, kind, build):
+    """Publish ``build()`` once the current transaction commits; nothing on rollback."""
+    transaction.on_commit(lambda: publish(user_id, kind, build()))
+
+
+def dataset_changed(kind, dataset):
+    """Publish ``dataset_created`` or ``dataset_updated`` for ``dataset`` on commit."""
+    publish_on_commit(
+        dataset.user_id, kind, lambda: {'dataset': EquipmentDatasetListSerializer(dataset).data}
+    )
+
+
+def ingest_progress(user_id, upload=None):
+    """A ``progress(filename, rows, position)`` callback for ``ingest_csv``/``ingest_many``."""
+    def progress(filename, rows, position):
+        publish(user_id, 'ingest_progress', {
+            'upload': upload, 'filename': filename, 'rows': rows, 'bytes': position,
+        })
+    return progress
+
+
+def parse_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Subscription:
+    """
+    Reads one user's events in order, after event number ``after`` (or
+    only new ones), as SSE frames.
+    """
+
+    def __init__(self, user_id, after=None):
+        self.user_id = user_id
+        self._cache = get_cache()
+        last = self._cache.get(_last_key(user_id), 0)
+        # A number from before the counter was lost (cache flush) starts over.
+        self.after = last if after is None or after > last else after
+        self._waiting_since = None
+        self._keepalive_at = time.monotonic() + getattr(settings, 'EVENTS_KEEPALIVE', DEFAULT_KEEPALIVE)
+
+    def poll(self):
+        """New ``(number, kind, payload)`` events, oldest first."""
+        last = self._cache.get(_last_key(self.user_id), 0)
+        if last < self.after:
+            self.after = 0
+        if last == self.after:
+            return []
+
+        first = max(self.after + 1, last - MAX_BACKLOG + 1)
+        keys = {number: _event_key(self.user_id, number) for number in range(first, last + 1)}
+        found = self._cache.get_many(list(keys.values()))
+        stored = [number for number, key in keys.items() if key in found]
+        if stored:
+            self.after = stored[-1]
+        if self.after < last:
+            # The newest numbers are not stored yet (or have expired): give
+            # their publishers a moment before moving past them.
+            now = time.monotonic()
+            if self._waiting_since is None:
+                self._waiting_since = now
+            elif now - self._waiting_since >= WRITE_GRACE:
+                self.after, self._waiting_since = last, None
+        else:
+            self._waiting_since = None
+        return [(number, *found[keys[number]]) for number in stored]
+
+    def frames(self):
+        """SSE frames for the new events, or a keepalive comment when idle too long."""
+        events = self.poll()
+        now = time.monotonic()
+        if events:
+            self._keepalive_at = now + getattr(settings, 'EVENTS_KEEPALIVE', DEFAULT_KEEPALIVE)
+            return [
+                f'id: {number}\nevent: {kind}\ndata: {payload}\n\n'.encode()
+                for number, kind, payload in events
+            ]
+        if now >= self._keepalive_at:
+            self._keepalive_at = now + getattr(settings, 'EVENTS_KEEPALIVE', DEFAULT_KEEPALIVE)
+            return [b': keepalive\n\n']
+        return []
+
+
+def _opening(subscription):
+    # The id (with no data) only moves the client's Last-Event-ID, so the
+    # next stream resumes here even if this one carries no events.
+    return f'retry: {RECONNECT_MS}\nid: {subscription.after}\n\n'.encode()
+
+
+def stream(subscription):
+    """
+    The SSE body for a WSGI response: polls ``subscription`` at least once,
+    then until ``EVENTS_WSGI_STREAM_SECONDS`` have passed.
+    """
+    yield _opening(subscription)
+    deadline = time.monotonic() + getattr(settings, 'EVENTS_WSGI_STREAM_SECONDS', DEFAULT_WSGI_STREAM_SECONDS)
+    interval = getattr(settings, 'EVENTS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    while True:
+        yield from subscription.frames()
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(interval)
+
+
+async def astream(subscription):
+    """As ``stream``, for ASGI: waiting between polls holds no thread, so streams stay open."""
+    yield _opening(subscription)
+    deadline = time.monotonic() + getattr(settings, 'EVENTS_STREAM_SECONDS', DEFAULT_STREAM_SECONDS)
+    interval = getattr(settings, 'EVENTS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    frames = sync_to_async(subscription.frames, thread_sensitive=False)
+    while time.monotonic() < deadline:
+        for frame in await frames():
+            yield frame
+        await asyncio.sleep(interval)
@@ -0,0 +1,134 @@
+"""
+Streaming exports of a dataset's rows.
+
+``csv`` uses the upload format, so an export can be uploaded again;
+``parquet`` needs pyarrow. Rows are read in batches of ``EXPORT_CHUNK_ROWS``
+from the column store (or the database when it is disabled) and every
+batch is encoded and yielded before the next is read, so memory use does
+not grow with the size of the dataset.
+"""
+import csv
+import io
+
+from django.conf import settings
+
+from . import column_store
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+DEFAULT_CHUNK_ROWS = 50000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """Raised for an export format that is unknown or unavailable."""
+
+
+def chunk_rows():
+    return getattr(settings, 'EXPORT_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)
+
+
+def export_chunks(dataset, file_format):
+    """
+    Return an iterator of the encoded export of ``dataset``. The format is
+    checked here; no rows are read until the iterator is consumed.
+    """
+    if file_format not in CONTENT_TYPES:
+        raise ExportError(f'Export format must be one of: {", ".join(CONTENT_TYPES)}')
+    if pyarrow is None:
+        if file_format == 'parquet':
+            raise ExportError('Parquet export requires pyarrow')
+        return _csv_rows(dataset)
+    if file_format == 'parquet':
+        return _parquet(dataset)
+    return _csv_batches(dataset)
+
+
+def _row_batches(dataset):
+    """Lists of row tuples in CSV column order, straight from the database."""
+    rows = dataset.rows_dataset.equipment.order_by('id').values_list(*column_store.COLUMNS.values())
+    batch = []
+    for row in rows.iterator(chunk_size=chunk_rows()):
+        batch.append(row)
+        if len(batch) >= chunk_rows():
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _record_batches(dataset):
+    schema = column_store.schema()
+    table = column_store.read_table(dataset)
+    if table is not None:
+        yield from table.to_batches(max_chunksize=chunk_rows())
+        return
+    for batch in _row_batches(dataset):
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _csv_rows(dataset):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column_store.COLUMNS)
+    for batch in _row_batches(dataset):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _csv_batches(dataset):
+    header = True
+    for batch in _record_batches(dataset):
+        sink = pyarrow.BufferOutputStream()
+        pyarrow.csv.write_csv(batch, sink, pyarrow.csv.WriteOptions(include_header=header))
+        header = False
+        yield sink.getvalue().to_pybytes()
+    if header:
+        yield (','.join(column_store.COLUMNS) + '\n').encode()
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose written bytes are taken out as they are produced."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet(dataset):
+    # One row group per batch; the footer is written when the writer closes.
+    sink = _Drain()
+    with pyarrow.parquet.ParquetWriter(sink, column_store.schema(), compression='zstd') as writer:
+        for batch in _record_batches(dataset):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
@@ -0,0 +1,286 @@
+"""
+Streaming CSV ingestion for equipment uploads.
+
+The upload is parsed in fixed-size chunks so peak memory depends on the
+chunk size rather than on the size of the file. Each chunk is folded into
+a ``DatasetSketch`` (moments, quantile digests, per-type accumulators),
+its rows are bulk-inserted and, with the column store enabled, appended
+to the dataset's column file before the next chunk is read.
+
+``ingest_many`` ingests a batch of files. With ``INGEST_PROCESSES`` above
+1 each file is parsed, validated and sketched in a process pool, so files
+are parsed side by side. Workers spill the parsed chunks to a temporary
+file instead of sending them back, and the parent writes them to the
+database one chunk at a time, a file at a time, in the order the files
+finish parsing: neither side holds a whole file in memory.
+
+Rows are validated before they are written (see ``api.validation``): a bad
+header fails before any row is parsed, and rejected rows are dropped and
+recorded in the dataset's ``validation`` report.
+
+Uploads are hashed on the way in; one that repeats an earlier upload of
+the same user is linked to its rows instead of being stored again (see
+``api.dedup``).
+
+A ``progress(filename, rows, position)`` callback, if given, is called
+after every chunk written with the rows written so far and how far into
+the file the parser has read (None when unknown); ``api.events`` uses it to
+push upload progress to the client.
+"""
+import contextlib
+import os
+import pickle
+import tempfile
+from concurrent.futures import as_completed
+
+import django
+import pandas as pd
+from django.conf import settings
+
+from . import column_store, dedup
+from .bulk_writer import EquipmentBulkWriter
+from .models import DatasetStatistics, EquipmentDataset
+from .pools import get_pool
+from .sketches import DatasetSketch
+from .validation import (
+    ChunkValidator, Header, IngestionError, ValidationReport, is_required_column, read_header,
+)
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def get_chunk_size():
+    return getattr(settings, 'CSV_INGEST_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def ingest_processes():
+    return getattr(settings, 'INGEST_PROCESSES', 0)
+
+
+def iter_chunks(fileobj, chunk_size=None, report=None):
+    """
+    Yield the validated rows of ``fileobj`` in DataFrame chunks of at most
+    ``chunk_size`` rows, recording rejected rows in ``report``.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    report = report if report is not None else ValidationReport()
+    validator = None
+    try:
+        reader = pd.read_csv(
+            fileobj, chunksize=chunk_size, skipinitialspace=True, usecols=is_required_column,
+            dtype={'Equipment Name': 'str', 'Type': 'category'},
+        )
+        for chunk in reader:
+            if validator is None:
+                validator = ChunkValidator(Header(chunk.columns), report)
+            yield validator.validate(chunk)
+    except pd.errors.EmptyDataError:
+        raise IngestionError('The uploaded file is empty')
+    except pd.errors.ParserError as e:
+        raise IngestionError(f'Could not parse CSV: {e}')
+    except UnicodeDecodeError:
+        raise IngestionError('The uploaded file is not UTF-8 text')
+
+
+def ingest_csv(fileobj, user, filename, chunk_size=None, content_hash=None, progress=None):
+    """
+    Stream ``fileobj`` into a new ``EquipmentDataset`` owned by ``user``.
+
+    Everything happens in the bulk writer's transaction, so a file that
+    fails half-way leaves no partial dataset behind. The column file is
+    published only once that transaction has committed.
+
+    Identical bytes are recognised from ``content_hash`` before anything
+    is parsed, identical rows once the file has been read. ``fileobj`` is
+    read more than once, so it must be seekable unless ``content_hash`` is
+    given (and the header already checked with ``read_header``).
+    """
+    if content_hash is None:
+        start = fileobj.tell()
+        read_header(fileobj)
+        fileobj.seek(start)
+        content_hash = dedup.content_hash(fileobj)
+        fileobj.seek(start)
+    duplicate = dedup.find_duplicate(user, content_hash=content_hash)
+    if duplicate is not None:
+        return dedup.link_duplicate(duplicate, user, filename, content_hash)
+    report = ValidationReport()
+    if progress is not None:
+        progress = _file_progress(progress, filename, fileobj)
+    return _store(
+        iter_chunks(fileobj, chunk_size, report), user, filename, content_hash, report,
+        progress=progress,
+    )
+
+
+def parse_csv(path, chunk_size=None):
+    """
+    Parse the CSV file at ``path``, spilling its validated chunks to a
+    temporary file. Returns that file's path (see ``read_spilled``), the
+    ``to_dict()`` of the chunks' sketch, the file's content and rows hashes
+    and its ``ValidationReport``. Run in the ingestion pool's workers.
+    """
+    sketch = DatasetSketch()
+    rows = dedup.RowsHash()
+    report = ValidationReport()
+    spill = tempfile.NamedTemporaryFile(prefix='ingest-', suffix='.chunks', delete=False)
+    try:
+        with spill, open(path, 'rb') as fileobj:
+            read_header(fileobj)
+            fileobj.seek(0)
+            content_hash = dedup.content_hash(fileobj)
+            fileobj.seek(0)
+            for chunk in iter_chunks(fileobj, chunk_size, report):
+                if not chunk.empty:
+                    sketch.add_rows(chunk)
+                    rows.add_rows(chunk)
+                    pickle.dump(chunk, spill, pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        os.remove(spill.name)
+        raise
+    return spill.name, sketch.to_dict(), content_hash, rows.hexdigest(), report
+
+
+def read_spilled(path):
+    """Yield the chunks ``parse_csv`` spilled to ``path``, one at a time."""
+    with open(path, 'rb') as fileobj:
+        while True:
+            try:
+                yield pickle.load(fileobj)
+            except EOFError:
+                return
+
+
+def ingest_many(sources, user, progress=None):
+    """
+    Ingest ``(filename, path)`` pairs into new datasets owned by ``user``,
+    yielding ``(filename, dataset, error)`` for each file as it finishes.
+    ``error`` is the ``IngestionError`` (and ``dataset`` is None) for a
+    file that could not be ingested.
+    """
+    processes = ingest_processes()
+    if processes <= 1:
+        for filename, path in sources:
+            try:
+                with open(path, 'rb') as fileobj:
+                    dataset = ingest_csv(fileobj, user, filename, progress=progress)
+            except IngestionError as e:
+                yield filename, None, e
+            else:
+                yield filename, dataset, None
+        return
+
+    # Workers import the ORM with this module, so each one sets Django up first.
+    pool = get_pool('ingest', processes, initializer=django.setup)
+    futures = {pool.submit(parse_csv, path, get_chunk_size()): filename for filename, path in sources}
+    try:
+        for future in as_completed(futures):
+            filename = futures.pop(future)
+            try:
+                dataset = _store_parsed(future.result(), user, filename, progress)
+            except IngestionError as e:
+                yield filename, None, e
+            else:
+                yield filename, dataset, None
+    finally:
+        # Files left unread when the caller stops early.
+        for future in futures:
+            future.add_done_callback(_discard_parsed)
+
+
+def _discard_parsed(future):
+    if not future.cancelled() and future.exception() is None:
+        os.remove(future.result()[0])
+
+
+def _store_parsed(parsed, user, filename, progress=None):
+    """Store (or link) a file from what ``parse_csv`` returned, then remove its spill file."""
+    spilled, sketch, content_hash, rows_hash, report = parsed
+    try:
+        duplicate = dedup.find_duplicate(user, content_hash, rows_hash)
+        if duplicate is not None:
+            return dedup.link_duplicate(duplicate, user, filename, content_hash, report.to_dict())
+        return _store(
+            read_spilled(spilled), user, filename, content_hash, report,
+            DatasetSketch.from_dict(sketch), rows_hash,
+            progress=None if progress is None else _file_progress(progress, filename),
+        )
+    finally:
+        os.remove(spilled)
+
+
+class _DuplicateRows(Exception):
+    def __init__(self, dataset):
+        super().__init__()
+        self.dataset = dataset
+
+
+def _file_progress(progress, filename, fileobj=None):
+    """``progress`` for one file, as the ``progress(rows)`` callback ``_store`` takes."""
+    def callback(rows):
+        try:
+            position = fileobj.tell() if fileobj is not None else None
+        except (OSError, ValueError):
+            position = None
+        progress(filename, rows, position)
+    return callback
+
+
+def _store(chunks, user, filename, content_hash, report, sketch=None, rows_hash=None, progress=None):
+    """
+    Write ``chunks`` into a new dataset, with the ``ValidationReport`` they
+    were validated into. A ``sketch`` and ``rows_hash``
+    already computed from the same chunks are used as is. Otherwise both
+    are built as the chunks are written, and rows found to repeat an
+    earlier upload are rolled back in favour of a link to it.
+    ``progress(rows)`` is called after each chunk.
+    """
+    precomputed = sketch is not None
+    if not precomputed:
+        sketch = DatasetSketch()
+        rows = dedup.RowsHash()
+
+    try:
+        with contextlib.ExitStack() as stack:
+            with EquipmentBulkWriter() as writer:
+                dataset = EquipmentDataset.objects.create(user=user, filename=filename)
+                columns = None
+                if column_store.enabled():
+                    columns = stack.enter_context(column_store.ColumnFileWriter(dataset.pk))
+
+                for chunk in chunks:
+                    if chunk.empty:
+                        continue
+                    if not precomputed:
+                        sketch.add_rows(chunk)
+                        rows.add_rows(chunk)
+                    writer.write(dataset, chunk.itertuples(index=False, name=None))
+                    if columns is not None:
+                        columns.write(chunk)
+                    if progress is not None:
+                        progress(writer.rows_written)
+
+                if not sketch.count:
+                    raise IngestionError(
+                        'The uploaded file contains no valid equipment rows', report.to_dict()['errors']
+                    )
+
+                if not precomputed:
+                    rows_hash = rows.hexdigest()
+                    duplicate = dedup.find_duplicate(user, rows_hash=rows_hash)
+                    if duplicate is not None:
+                        raise _DuplicateRows(duplicate)
+
+                for field, value in sketch.as_dataset_fields().items():
+                    setattr(dataset, field, value)
+                dataset.content_hash, dataset.rows_hash = content_hash, rows_hash
+                dataset.validation = report.to_dict()
+                dataset.save()
+                DatasetStatistics.objects.create(dataset=dataset, sketch=sketch.to_dict())
+
+            if columns is not None:
+                columns.commit(dataset)
+    except _DuplicateRows as e:
+        return dedup.link_duplicate(e.dataset, user, filename, content_hash, report.to_dict())
+
+    return dataset
@@ -0,0 +1,110 @@
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.bulk_writer import EquipmentBulkWriter
+from api.management.commands.benchmark_bulk_writer import TYPES, generate_rows
+from api.models import Equipment, EquipmentDataset, ReportJob
+
+# Plan lines that read a whole table rather than an index range.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?P<table>\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)'),
+    'postgresql': re.compile(r'\bSeq Scan on (?P<table>\w+)'),
+}
+
+# Run before EXPLAIN so the planner only picks a full scan when no index fits,
+# not because a seeded table is small.
+PLANNER_SETUP = {
+    'postgresql': ['SET LOCAL enable_seqscan = off'],
+}
+
+
+def audited_queries(user, dataset):
+    """
+    The filtered access paths of the API and admin, as ``(label, queryset)``.
+
+    Keep this in step with views.py, columnar.py, aggregation.py and the
+    list filters in admin.py when adding a query that should use an index.
+    """
+    week_ago = timezone.now() - timedelta(days=7)
+    return [
+        ('api: dataset history', EquipmentDataset.objects.filter(user=user)[:5]),
+        ('api: dataset detail', EquipmentDataset.objects.filter(user=user, pk=dataset.pk)),
+        ('api: dataset rows', dataset.equipment.order_by('id')),
+        ('api: column page', dataset.equipment.filter(id__gt=0).order_by('id')[:10000]),
+        ('api: aggregate by name', Equipment.objects.filter(
+            dataset__in=EquipmentDataset.objects.filter(user=user).values('pk'), name__in=['Pump-0'],
+        )),
+        ('api: report job lookup', ReportJob.objects.filter(input_key='0' * 64)),
+        ('api: report queue', ReportJob.objects.filter(status=ReportJob.PENDING).order_by('created_at')[:10]),
+        ('admin: datasets by user', EquipmentDataset.objects.filter(user__id__exact=user.pk)),
+        ('admin: datasets by date', EquipmentDataset.objects.filter(upload_date__gte=week_ago)),
+        ('admin: equipment by dataset', Equipment.objects.filter(dataset__id__exact=dataset.pk).order_by('-pk')),
+        ('admin: equipment by type', Equipment.objects.filter(equipment_type__exact=TYPES[0]).order_by('-pk')[:100]),
+        ('admin: equipment by dataset and type', Equipment.objects.filter(
+            dataset__id__exact=dataset.pk, equipment_type__exact=TYPES[0],
+        )),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the API and admin queries on a seeded database and fail if any '
+        'of them falls back to a full table scan. Seed data is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000,
+                            help='Equipment rows to seed, spread over the seeded datasets.')
+        parser.add_argument('--datasets', type=int, default=20)
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan.')
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Query plan audit is not supported on {connection.vendor}')
+
+        failures = []
+        with transaction.atomic():
+            user, dataset = self.seed(options['rows'], options['datasets'], options['users'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                for statement in PLANNER_SETUP.get(connection.vendor, []):
+                    cursor.execute(statement)
+
+            for label, queryset in audited_queries(user, dataset):
+                plan = queryset.explain()
+                scans = sorted({match.group('table') for match in pattern.finditer(plan)})
+                if options['verbose_plans']:
+                    self.stdout.write(f'{label}\n    ' + plan.replace('\n', '\n    '))
+                if scans:
+                    failures.append(label)
+                    self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}: {", ".join(scans)}'))
+                else:
+                    self.stdout.write(f'ok         {label}')
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'{len(failures)} queries fall back to a full table scan')
+        self.stdout.write(self.style.SUCCESS('All audited queries use an index'))
+
+    def seed(self, rows, datasets, users):
+        owners = [
+            User.objects.create(username=f'query-plan-audit-{i}')
+            for i in range(max(users, 1))
+        ]
+        per_dataset = max(rows // max(datasets, 1), 1)
+        created = None
+        with EquipmentBulkWriter() as writer:
+            for i in range(max(datasets, 1)):
+                created = EquipmentDataset.objects.create(
+                    user=owners[i % len(owners)], filename=f'query-plan-audit-{i}.csv'
+                )
+                writer.write(created, generate_rows(per_dataset))
+        return created.user, created
@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from api.bulk_writer import BACKENDS, EquipmentBulkWriter
+from api.models import EquipmentDataset
+
+TYPES = ['Pump', 'Reactor', 'Heat Exchanger', 'Compressor', 'Column']
+
+
+def generate_rows(count):
+    for i in range(count):
+        equipment_type = TYPES[i % len(TYPES)]
+        yield (f'{equipment_type}-{i}', equipment_type, 100.0 + i % 150, 10.0 + i % 200, 50.0 + i % 400)
+
+
+class Command(BaseCommand):
+    help = 'Measure EquipmentBulkWriter throughput in rows/second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--backend', choices=BACKENDS, default=None)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bulk-writer-benchmark')
+
+        try:
+            for count in options['rows']:
+                writer = EquipmentBulkWriter(
+                    batch_size=options['batch_size'], backend=options['backend']
+                )
+                started = time.perf_counter()
+                with writer:
+                    dataset = EquipmentDataset.objects.create(user=user, filename=f'benchmark-{count}.csv')
+                    writer.write(dataset, generate_rows(count))
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{writer.backend:>10}  batch={writer.batch_size:<7} rows={count:<9} '
+                    f'{elapsed:8.2f}s  {count / elapsed:12,.0f} rows/s'
+                )
+        finally:
+            user.delete()
@@ -0,0 +1,71 @@
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+from api.management.commands.benchmark_statistics import generate_frame
+from api.report_engine import TABLE_HEADER, get_layout, page_ranges, pypdf, render_report
+from api.reports import styled_table
+from equipment_stats import PARAMETERS
+
+
+def generate_columns(count):
+    frame = generate_frame(count)
+    names = np.char.add(frame['Type'].to_numpy().astype(str), np.arange(count).astype(str)).astype(object)
+    return [names, frame['Type'].to_numpy(), *(frame[name].to_numpy() for name in PARAMETERS)]
+
+
+def story_report(columns):
+    """The single platypus Table the engine's table pages replace."""
+    rows = [list(TABLE_HEADER)]
+    for name, eq_type, flowrate, pressure, temperature in zip(*columns):
+        rows.append([name, eq_type, f'{flowrate:.2f}', f'{pressure:.2f}', f'{temperature:.2f}'])
+    doc = SimpleDocTemplate(_Sink())
+    doc.build([styled_table(rows, repeat_rows=1)])
+
+
+class _Sink:
+    def write(self, data):
+        return len(data)
+
+
+class Command(BaseCommand):
+    help = 'Measure PDF report rendering throughput in pages/second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--processes', type=int, nargs='+', default=[1, 4])
+        parser.add_argument('--story', action='store_true',
+                            help='Also time the single-Table story (slow above 100k rows).')
+
+    def handle(self, *args, **options):
+        layout = get_layout()
+        front = [Paragraph('Report benchmark', layout.styles['Title'])]
+        if pypdf is None and any(count > 1 for count in options['processes']):
+            self.stderr.write('pypdf is not installed; reports render in one process')
+
+        for count in options['rows']:
+            columns = generate_columns(count)
+            pages = len(page_ranges(count, layout.rows_per_page)) + 1
+
+            for processes in options['processes']:
+                with tempfile.TemporaryFile() as output:
+                    started = time.perf_counter()
+                    render_report(front, columns, 'benchmark', output, processes=processes)
+                    elapsed = time.perf_counter() - started
+                    size = output.tell()
+                self.stdout.write(
+                    f'engine x{processes:<3d} rows={count:<9d} pages={pages:<7d} {elapsed:8.2f}s '
+                    f'{pages / elapsed:10,.1f} pages/s  {size / 1e6:7.1f} MB'
+                )
+
+            if options['story']:
+                started = time.perf_counter()
+                story_report(columns)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{"story":>12} rows={count:<9d} pages~{pages:<7d} {elapsed:8.2f}s '
+                    f'{pages / elapsed:10,.1f} pages/s'
+                )
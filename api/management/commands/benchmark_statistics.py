@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from api.management.commands.benchmark_bulk_writer import TYPES
+from equipment_stats import PARAMETERS, summarize
+
+
+def generate_frame(count, seed=0):
+    rng = np.random.default_rng(seed)
+    types = np.array(TYPES, dtype=object)[rng.integers(0, len(TYPES), count)]
+    frame = pd.DataFrame({'Type': pd.Series(types, dtype=object)})
+    for offset, name in enumerate(PARAMETERS):
+        frame[name] = rng.normal(100.0 * (offset + 1), 15.0, count)
+    return frame
+
+
+def pandas_statistics(frame):
+    """The general-purpose pandas path the kernel replaces."""
+    grouped = frame.groupby('Type', sort=False)[PARAMETERS].agg(['count', 'mean', 'var', 'min', 'max'])
+    return {
+        'total_equipment': len(frame),
+        'means': [frame[name].mean() for name in PARAMETERS],
+        'type_distribution': frame['Type'].value_counts().to_dict(),
+        'by_type': grouped,
+    }
+
+
+def kernel_statistics(frame):
+    summary = summarize(frame)
+    return {
+        'total_equipment': summary.count,
+        'means': [summary.mean(name) for name in PARAMETERS],
+        'type_distribution': summary.type_distribution,
+        'by_type': summary.moments,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the NumPy statistics kernel with the pandas groupby path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 1000000, 10000000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for count in options['rows']:
+            frame = generate_frame(count)
+            categorical = frame.assign(Type=frame['Type'].astype('category'))
+            results = {}
+            for label, function, data in (
+                ('pandas', pandas_statistics, frame),
+                ('numpy', kernel_statistics, frame),
+                ('numpy+category', kernel_statistics, categorical),
+            ):
+                elapsed = min(self.time(function, data) for _ in range(options['repeat']))
+                results[label] = function(data)
+                self.stdout.write(
+                    f'{label:>15}  rows={count:<10d} {elapsed:8.4f}s {count / elapsed:14,.0f} rows/s'
+                )
+
+            expected, actual = results['pandas'], results['numpy']
+            if expected['type_distribution'] != actual['type_distribution'] or not np.allclose(
+                expected['means'], actual['means']
+            ):
+                self.stderr.write(f'Kernel results differ from pandas at {count} rows')
+
+    @staticmethod
+    def time(function, data):
+        started = time.perf_counter()
+        function(data)
+        return time.perf_counter() - started
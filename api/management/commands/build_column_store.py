@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import column_store
+from api.models import EquipmentDataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the column file of every dataset that has none for its current '
+        'version, and delete files left behind by deleted datasets.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', type=int, nargs='+', help='Only these dataset ids.')
+        parser.add_argument('--rebuild', action='store_true', help='Rewrite files that are already current.')
+
+    def handle(self, *args, **options):
+        if not column_store.enabled():
+            raise CommandError('The column store is disabled or pyarrow is not installed')
+
+        # Linked datasets read the file of the dataset holding their rows.
+        datasets = EquipmentDataset.objects.filter(rows_source__isnull=True).order_by('pk')
+        if options['dataset']:
+            datasets = datasets.filter(pk__in=options['dataset'])
+
+        built = 0
+        for dataset in datasets.iterator():
+            if options['rebuild'] or not os.path.exists(column_store.column_path(dataset)):
+                column_store.build_column_file(dataset)
+                built += 1
+                self.stdout.write(f'Built dataset {dataset.pk} ({dataset.total_equipment} rows)')
+
+        removed = 0
+        if not options['dataset'] and os.path.isdir(column_store.store_dir()):
+            existing = {str(pk) for pk in EquipmentDataset.objects.values_list('pk', flat=True)}
+            for name in os.listdir(column_store.store_dir()):
+                if name not in existing:
+                    column_store.delete_dataset_files(name)
+                    removed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Built {built} column files, removed {removed} orphaned'))
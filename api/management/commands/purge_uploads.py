@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.uploads import default_session_ttl, purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished chunked upload sessions and their stored parts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=float, default=None,
+                            help='Idle time before a session is purged (default UPLOAD_SESSION_TTL_HOURS).')
+
+    def handle(self, *args, **options):
+        hours = options['older_than_hours']
+        max_age = timedelta(hours=hours) if hours is not None else default_session_ttl()
+        count = purge_stale_sessions(max_age)
+        self.stdout.write(f'Purged {count} upload sessions')
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import ReportJob
+from api.reports import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued PDF report jobs. Run several workers to render in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--poll-interval', type=float, default=None)
+
+    def handle(self, *args, **options):
+        interval = options['poll_interval'] or getattr(settings, 'REPORT_WORKER_POLL_INTERVAL', 1.0)
+
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(interval)
+                continue
+
+            started = time.perf_counter()
+            run_job(job)
+            elapsed = time.perf_counter() - started
+            if job.status == ReportJob.DONE:
+                self.stdout.write(f'{job.pk}: done in {elapsed:.2f}s ({job.file.name})')
+            else:
+                self.stderr.write(f'{job.pk}: failed: {job.error}')
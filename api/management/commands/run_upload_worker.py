@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import events
+from api.ingestion import IngestionError
+from api.uploads import claim_next_session, ingest_session
+
+
+class Command(BaseCommand):
+    help = 'Ingest completed chunked uploads. Run several workers to ingest in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--poll-interval', type=float, default=None)
+
+    def handle(self, *args, **options):
+        interval = options['poll_interval'] or getattr(settings, 'UPLOAD_WORKER_POLL_INTERVAL', 1.0)
+
+        while True:
+            session = claim_next_session()
+            if session is None:
+                if options['once']:
+                    return
+                time.sleep(interval)
+                continue
+
+            started = time.perf_counter()
+            try:
+                dataset = ingest_session(session, events.ingest_progress(session.user_id, str(session.pk)))
+            except IngestionError:
+                self.stderr.write(f'{session.pk}: failed: {session.error}')
+            except Exception:
+                # ingest_session has reopened the session for the client to retry.
+                self.stderr.write(f'{session.pk}: {session.error}')
+            else:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{session.pk}: dataset {dataset.pk} in {elapsed:.2f}s')
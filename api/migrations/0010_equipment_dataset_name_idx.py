@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_dataset_validation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['dataset', 'name'], name='equipment_dataset_name_idx'),
+        ),
+    ]
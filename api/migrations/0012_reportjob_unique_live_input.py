@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+LIVE = ['pending', 'running', 'done']
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    """Keep the newest live job per input key, so the constraint can be added."""
+    ReportJob = apps.get_model('api', 'ReportJob')
+    seen = set()
+    duplicates = []
+    jobs = ReportJob.objects.filter(status__in=LIVE).order_by('-created_at')
+    for pk, key in jobs.values_list('pk', 'input_key'):
+        if key in seen:
+            duplicates.append(pk)
+        seen.add(key)
+    ReportJob.objects.filter(pk__in=duplicates).update(status='failed', error='Duplicate of a newer job')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_uploadsession_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running', 'done'])), fields=('input_key',), name='report_job_unique_live_input'),
+        ),
+    ]
@@ -1,3 +1,186 @@
+import uuid
+
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class EquipmentDataset(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='datasets')
+    filename = models.CharField(max_length=255)
+    upload_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    total_equipment = models.IntegerField(default=0)
+    avg_flowrate = models.FloatField(default=0.0)
+    avg_pressure = models.FloatField(default=0.0)
+    avg_temperature = models.FloatField(default=0.0)
+    type_distribution = models.JSONField(default=dict)
+    # SHA-256 of the uploaded bytes and of the validated rows (see api.dedup)
+    content_hash = models.CharField(max_length=64, blank=True)
+    rows_hash = models.CharField(max_length=64, blank=True)
+    # Set when the upload repeated an earlier one: its rows are read from there.
+    # Deleting that dataset hands the rows over first (api.dedup.hand_over_rows).
+    rows_source = models.ForeignKey(
+        'self', on_delete=models.DO_NOTHING, null=True, blank=True, related_name='linked_datasets'
+    )
+    # Rows read and rejected on upload, with the first row errors (see api.validation)
+    validation = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-upload_date']
+        indexes = [
+            # History and the per-user dataset list: WHERE user_id = ? ORDER BY upload_date DESC
+            models.Index(fields=['user', '-upload_date'], name='dataset_user_recent_idx'),
+            # Admin changelist ordering and date filters across all users
+            models.Index(fields=['-upload_date'], name='dataset_recent_idx'),
+            # Duplicate lookups on upload
+            models.Index(fields=['user', 'content_hash'], name='dataset_user_content_idx'),
+            models.Index(fields=['user', 'rows_hash'], name='dataset_user_rows_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.filename} ({self.user.username})'
+
+    @property
+    def rows_dataset(self):
+        """The dataset whose ``Equipment`` rows and column file hold this one's rows."""
+        return self.rows_source if self.rows_source_id else self
+
+
+class Equipment(models.Model):
+    dataset = models.ForeignKey(EquipmentDataset, on_delete=models.CASCADE, related_name='equipment')
+    name = models.CharField(max_length=255)
+    equipment_type = models.CharField(max_length=100)
+    flowrate = models.FloatField()
+    pressure = models.FloatField()
+    temperature = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # Row pages of one dataset, optionally of one type
+            models.Index(fields=['dataset', 'equipment_type'], name='equipment_dataset_type_idx'),
+            # Admin type filter and cross-dataset aggregation by type
+            models.Index(fields=['equipment_type'], name='equipment_type_idx'),
+            # Cross-dataset aggregation of named equipment
+            models.Index(fields=['name'], name='equipment_name_idx'),
+            # Rows of one dataset by name (delta uploads)
+            models.Index(fields=['dataset', 'name'], name='equipment_dataset_name_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.equipment_type})'
+
+
+class DatasetStatistics(models.Model):
+    """Serialized ``DatasetSketch`` used to serve extended statistics."""
+
+    dataset = models.OneToOneField(EquipmentDataset, on_delete=models.CASCADE, related_name='statistics')
+    sketch = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Statistics for {self.dataset.filename}'
+
+
+class ReportJob(models.Model):
+    """A queued PDF report render, processed by ``manage.py run_report_worker``."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_jobs')
+    dataset = models.ForeignKey(EquipmentDataset, on_delete=models.CASCADE, related_name='report_jobs')
+    template = models.CharField(max_length=50, default='standard')
+    input_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # One live job per dataset version and template (see api.reports.input_key).
+            models.UniqueConstraint(
+                fields=['input_key'], condition=models.Q(status__in=['pending', 'running', 'done']),
+                name='report_job_unique_live_input',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.template} report for {self.dataset.filename} ({self.status})'
+
+
+class UploadSession(models.Model):
+    """A chunked, resumable CSV upload whose parts are stored until it is completed."""
+
+    OPEN = 'open'
+    QUEUED = 'queued'
+    ASSEMBLING = 'assembling'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (QUEUED, 'Queued'),
+        (ASSEMBLING, 'Assembling'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    part_size = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    dataset = models.ForeignKey(
+        EquipmentDataset, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    error = models.TextField(blank=True)
+    # Row-level problems of a file that could not be ingested (see api.validation)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def part_count(self):
+        return max(-(-self.size // self.part_size), 1)
+
+    def expected_part_size(self, number):
+        if number < self.part_count:
+            return self.part_size
+        return self.size - self.part_size * (self.part_count - 1)
+
+    def __str__(self):
+        return f'{self.filename} upload ({self.status})'
+
+
+class UploadPart(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='parts')
+    number = models.PositiveIntegerField()
+    size = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+    uploaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['number']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'number'], name='upload_part_unique_number'),
+        ]
+
+    def __str__(self):
+        return f'Part {self.number} of {self.session}'
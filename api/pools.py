@@ -0,0 +1,28 @@
+"""
+Process pools for CPU-bound work (report table pages, CSV parsing).
+
+One pool per name is created on first use and kept for the life of the
+process. Workers are spawned rather than forked, so they never inherit the
+parent's database connections or threads; an ``initializer`` such as
+``django.setup`` prepares them for code that imports the ORM.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool(name, processes, initializer=None):
+    """The ``name`` pool with ``processes`` workers, replacing one of another size."""
+    with _lock:
+        pool, size = _pools.get(name, (None, 0))
+        if pool is None or size != processes:
+            if pool is not None:
+                pool.shutdown()
+            pool = ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context('spawn'), initializer=initializer,
+            )
+            _pools[name] = (pool, processes)
+        return pool
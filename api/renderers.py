@@ -0,0 +1,58 @@
+import io
+import json
+
+import numpy as np
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+
+class NpzRenderer(BaseRenderer):
+    """Render ``{'columns': {...}}`` as a NumPy ``.npz`` archive."""
+
+    media_type = 'application/x-npz'
+    format = 'npz'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **{name: np.asarray(values) for name, values in data['columns'].items()})
+        return buffer.getvalue()
+
+
+class ArrowRenderer(BaseRenderer):
+    """Render ``{'columns': {...}}`` as an Arrow IPC stream."""
+
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        table = pyarrow.table(data['columns'])
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets ``/api/events/`` accept ``text/event-stream``. The stream itself is
+    written by ``api.events``; this only renders errors, as one ``error`` event.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: error\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+COLUMNAR_RENDERERS = [NpzRenderer] + ([ArrowRenderer] if pyarrow is not None else [])
@@ -0,0 +1,286 @@
+"""
+ReportLab rendering engine for dataset reports.
+
+Everything that does not depend on a dataset (paragraph and table styles,
+font metrics, page and column geometry) is built once per process by
+``get_layout``. The equipment table is drawn natively on the
+canvas one page at a time: the story only holds a ``TablePage`` per page,
+which formats its slice of the column arrays when it is drawn, so a table
+with every row is never built. Charts are vector ``Drawing`` objects made
+of plain shapes, which the caller can cache and reuse between renders.
+
+With ``REPORT_RENDER_PROCESSES`` above 1 and pypdf installed, long tables
+are rendered in page ranges by a process pool and merged after the front
+matter. This module does not import the ORM, so pool workers stay light.
+"""
+import functools
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.graphics.shapes import Drawing, Group, String, UserNode
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import BaseDocTemplate, Flowable, Frame, PageTemplate, TableStyle
+
+from .pools import get_pool
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover - optional dependency
+    pypdf = None
+
+TABLE_HEADER = ('Name', 'Type', 'Flowrate', 'Pressure', 'Temperature')
+HEADER_COLOR = colors.HexColor('#36A2EB')
+BAR_COLORS = [colors.HexColor('#FF6384'), colors.HexColor('#36A2EB'), colors.HexColor('#4BC0C0')]
+PIE_COLORS = [colors.HexColor(c) for c in ('#1F77B4', '#FF7F0E', '#2CA02C', '#D62728', '#9467BD',
+                                           '#8C564B', '#E377C2', '#7F7F7F', '#BCBD22', '#17BECF')]
+
+DEFAULT_PAGES_PER_TASK = 200
+
+
+class ReportLayout:
+    """Page geometry, styles and font metrics shared by every render in a process."""
+
+    font = 'Helvetica'
+    bold_font = 'Helvetica-Bold'
+    font_size = 9
+    row_height = 14
+    caption_height = 24
+    cell_padding = 4
+
+    def __init__(self, pagesize=letter, margin=inch):
+        self.pagesize = pagesize
+        self.margin = margin
+        self.width = pagesize[0] - 2 * margin
+        self.height = pagesize[1] - 2 * margin
+        self.styles = getSampleStyleSheet()
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), HEADER_COLOR),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), self.bold_font),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ])
+
+        widths = [self.width * share for share in (0.32, 0.22, 0.15, 0.15, 0.16)]
+        self.column_edges = [self.margin]
+        for width in widths:
+            self.column_edges.append(self.column_edges[-1] + width)
+        self.text_widths = [width - 2 * self.cell_padding for width in widths]
+        # Widest Helvetica glyph, so most cells are known to fit without measuring.
+        self.max_glyph_width = stringWidth('@', self.font, self.font_size)
+        self.rows_per_page = int((self.height - self.caption_height) // self.row_height) - 1
+
+    def page_template(self, footer):
+        frame = Frame(
+            self.margin, self.margin, self.width, self.height,
+            leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0, id='body',
+        )
+        return PageTemplate(
+            id='report', frames=[frame],
+            onPage=lambda canvas, doc: self.draw_footer(canvas, canvas.getPageNumber(), footer),
+        )
+
+    def draw_footer(self, canvas, page, footer):
+        canvas.saveState()
+        canvas.setFont(self.font, 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(self.margin, self.margin / 2, footer)
+        canvas.drawRightString(self.margin + self.width, self.margin / 2, f'Page {page}')
+        canvas.restoreState()
+
+    def fit(self, text, column):
+        """Truncate ``text`` with an ellipsis to the width of ``column``."""
+        available = self.text_widths[column]
+        if len(text) * self.max_glyph_width <= available:
+            return text
+        if stringWidth(text, self.font, self.font_size) <= available:
+            return text
+        while text and stringWidth(text + '...', self.font, self.font_size) > available:
+            text = text[:-1]
+        return text + '...'
+
+    def draw_table_page(self, canvas, columns, start, stop, total, row_offset=0):
+        """Draw rows ``start:stop`` of ``columns`` as one table page in absolute page coordinates."""
+        top = self.margin + self.height
+        canvas.saveState()
+        canvas.setFont(self.bold_font, 12)
+        canvas.drawString(
+            self.margin, top - 14,
+            f'Equipment Data (rows {row_offset + start + 1}-{row_offset + stop} of {total})',
+        )
+
+        header_top = top - self.caption_height
+        row_lines = [header_top - i * self.row_height for i in range(stop - start + 2)]
+        canvas.setFillColor(HEADER_COLOR)
+        canvas.rect(self.margin, row_lines[1], self.width, self.row_height, stroke=0, fill=1)
+        canvas.setStrokeColor(colors.grey)
+        canvas.setLineWidth(0.5)
+        canvas.grid(self.column_edges, row_lines)
+
+        baseline = (self.row_height - self.font_size) / 2 + 1.5
+        canvas.setFillColor(colors.whitesmoke)
+        canvas.setFont(self.bold_font, self.font_size)
+        for edge, label in zip(self.column_edges, TABLE_HEADER):
+            canvas.drawString(edge + self.cell_padding, row_lines[1] + baseline, label)
+
+        # One text object per column, one line per row: far fewer operators
+        # (and Python calls) than positioning every cell separately.
+        canvas.setFillColor(colors.black)
+        names, types, *values = columns
+        cells = [
+            [self.fit(str(name), 0) for name in names[start:stop]],
+            [self.fit(str(eq_type), 1) for eq_type in types[start:stop]],
+            *([f'{value:.2f}' for value in column[start:stop]] for column in values),
+        ]
+        for edge, lines in zip(self.column_edges, cells):
+            text = canvas.beginText(edge + self.cell_padding, row_lines[2] + baseline)
+            text.setFont(self.font, self.font_size, self.row_height)
+            text.textLines(lines)
+            canvas.drawText(text)
+        canvas.restoreState()
+
+
+@functools.lru_cache(maxsize=None)
+def get_layout():
+    return ReportLayout()
+
+
+class TablePage(Flowable):
+    """One full page of the equipment table, formatted from the column arrays when drawn."""
+
+    def __init__(self, layout, columns, start, stop, total):
+        super().__init__()
+        self.layout = layout
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+        self.total = total
+
+    def wrap(self, available_width, available_height):
+        return self.layout.width, self.layout.height
+
+    def draw(self):
+        # The frame has no padding, so the flowable's origin is the page margin.
+        self.canv.translate(-self.layout.margin, -self.layout.margin)
+        self.layout.draw_table_page(self.canv, self.columns, self.start, self.stop, self.total)
+
+
+def page_ranges(total, rows_per_page):
+    return [(start, min(start + rows_per_page, total)) for start in range(0, total, rows_per_page)]
+
+
+def chart_drawing(labels, counts, parameters, means):
+    """
+    Vector drawing of the type distribution pie and the parameter averages.
+
+    Chart widgets are expanded into plain shapes, so the drawing can be
+    pickled into a cache and drawn again by later renders.
+    """
+    layout = get_layout()
+    drawing = Drawing(layout.width, 210)
+    drawing.add(String(95, 195, 'Equipment Type Distribution', fontName=layout.bold_font,
+                       fontSize=10, textAnchor='middle'))
+    drawing.add(String(345, 195, 'Average Parameters', fontName=layout.bold_font,
+                       fontSize=10, textAnchor='middle'))
+
+    if sum(counts):
+        pie = Pie()
+        pie.x, pie.y = 35, 25
+        pie.width = pie.height = 130
+        pie.data = list(counts)
+        pie.labels = [str(label) for label in labels]
+        pie.sideLabels = True
+        pie.slices.strokeColor = colors.white
+        pie.slices.fontName = layout.font
+        pie.slices.fontSize = 8
+        for index in range(len(counts)):
+            pie.slices[index].fillColor = PIE_COLORS[index % len(PIE_COLORS)]
+        drawing.add(pie)
+
+    bars = VerticalBarChart()
+    bars.x, bars.y = 270, 30
+    bars.width, bars.height = 170, 150
+    bars.data = [[float(mean or 0) for mean in means]]
+    bars.categoryAxis.categoryNames = list(parameters)
+    bars.categoryAxis.labels.fontName = bars.valueAxis.labels.fontName = layout.font
+    bars.categoryAxis.labels.fontSize = bars.valueAxis.labels.fontSize = 8
+    bars.valueAxis.valueMin = 0
+    for index in range(len(means)):
+        bars.bars[(0, index)].fillColor = BAR_COLORS[index % len(BAR_COLORS)]
+    drawing.add(bars)
+    return _expand(drawing)
+
+
+def _expand(group):
+    """Replace the widgets in ``group`` by the shapes they draw, at every depth."""
+    for index, node in enumerate(group.contents):
+        while isinstance(node, UserNode):
+            node = node.provideNode()
+        if isinstance(node, Group):
+            _expand(node)
+        group.contents[index] = node
+    return group
+
+
+def render_processes():
+    return getattr(settings, 'REPORT_RENDER_PROCESSES', 0)
+
+
+def render_report(front, columns, footer, output, processes=None):
+    """
+    Render ``front`` flowables followed by the equipment table of ``columns``
+    (arrays in ``TABLE_HEADER`` order) as a PDF written to the file ``output``.
+    """
+    layout = get_layout()
+    total = len(columns[0])
+    pages = page_ranges(total, layout.rows_per_page)
+    if processes is None:
+        processes = render_processes()
+    per_task = getattr(settings, 'REPORT_PAGES_PER_TASK', DEFAULT_PAGES_PER_TASK)
+
+    if processes > 1 and pypdf is not None and len(pages) > per_task:
+        buffer = BytesIO()
+        doc = BaseDocTemplate(buffer, pagesize=layout.pagesize, pageTemplates=[layout.page_template(footer)])
+        doc.build(list(front))
+        parts = _render_parallel(columns, total, pages, doc.page + 1, footer, processes, per_task)
+        merge_pdfs([buffer.getvalue(), *parts], output)
+        return
+
+    doc = BaseDocTemplate(output, pagesize=layout.pagesize, pageTemplates=[layout.page_template(footer)])
+    doc.build([*front, *(TablePage(layout, columns, start, stop, total) for start, stop in pages)])
+
+
+def render_table_pages(columns, row_offset, total, first_page, footer):
+    """Render ``columns`` (a slice starting at row ``row_offset``) as standalone table pages."""
+    layout = get_layout()
+    buffer = BytesIO()
+    canvas = Canvas(buffer, pagesize=layout.pagesize)
+    for page, (start, stop) in enumerate(page_ranges(len(columns[0]), layout.rows_per_page), first_page):
+        layout.draw_footer(canvas, page, footer)
+        layout.draw_table_page(canvas, columns, start, stop, total, row_offset)
+        canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
+
+
+def _render_parallel(columns, total, pages, first_page, footer, processes, per_task):
+    tasks = []
+    for index in range(0, len(pages), per_task):
+        start, stop = pages[index][0], pages[min(index + per_task, len(pages)) - 1][1]
+        tasks.append(([column[start:stop] for column in columns], start, total,
+                      first_page + index, footer))
+    return list(get_pool('reports', processes).map(render_table_pages, *zip(*tasks)))
+
+
+def merge_pdfs(parts, output):
+    writer = pypdf.PdfWriter()
+    for part in parts:
+        writer.append(pypdf.PdfReader(BytesIO(part)))
+    writer.write(output)
@@ -0,0 +1,189 @@
+"""
+PDF report rendering and the background report job queue.
+
+Reports are rendered by a worker process (``manage.py run_report_worker``)
+from ``ReportJob`` rows, so slow renders never hold a request worker.
+Finished PDFs are stored under ``MEDIA_ROOT/reports/`` named by the SHA-256
+of their content, and a job whose dataset version and template match an
+earlier one reuses that job's file instead of rendering again. Rendering
+itself is done by ``api.report_engine``.
+"""
+import hashlib
+import tempfile
+from datetime import timedelta
+
+import django.dispatch
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from reportlab.platypus import Paragraph, Spacer, Table
+
+from . import cache
+from .columnar import fetch_columns
+from .models import ReportJob
+from .report_engine import chart_drawing, get_layout, render_report
+from .sketches import PARAMETERS
+
+DEFAULT_TEMPLATE = 'standard'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Sent with ``job`` once a report job has finished or failed.
+report_finished = django.dispatch.Signal()
+
+
+def render_standard_report(dataset, output, processes=None):
+    styles = get_layout().styles
+    story = [
+        Paragraph('Chemical Equipment Analysis Report', styles['Title']),
+        Paragraph(f'Dataset: {dataset.filename}', styles['Normal']),
+        Paragraph(f'Uploaded: {dataset.upload_date:%Y-%m-%d %H:%M}', styles['Normal']),
+        Spacer(1, 12),
+        Paragraph('Summary Statistics', styles['Heading2']),
+    ]
+
+    summary = [
+        ['Metric', 'Value'],
+        ['Total Equipment', str(dataset.total_equipment)],
+        ['Average Flowrate', f'{dataset.avg_flowrate:.2f}'],
+        ['Average Pressure', f'{dataset.avg_pressure:.2f}'],
+        ['Average Temperature', f'{dataset.avg_temperature:.2f}'],
+    ]
+    story += [styled_table(summary), Spacer(1, 12)]
+
+    story.append(Paragraph('Equipment Type Distribution', styles['Heading2']))
+    distribution = [['Type', 'Count']] + [
+        [eq_type, str(count)] for eq_type, count in dataset.type_distribution.items()
+    ]
+    story += [styled_table(distribution), Spacer(1, 12)]
+    story += [report_charts(dataset), Spacer(1, 12)]
+
+    # The equipment table is drawn page by page from the columns by the engine.
+    columns, _ = fetch_columns(dataset)
+    render_report(story, list(columns.values()), dataset.filename, output, processes)
+
+
+def styled_table(data, repeat_rows=0):
+    table = Table(data, repeatRows=repeat_rows)
+    table.setStyle(get_layout().table_style)
+    return table
+
+
+def report_charts(dataset):
+    """The dataset's chart drawing, built once per dataset version."""
+    distribution = dataset.type_distribution
+    means = [dataset.avg_flowrate, dataset.avg_pressure, dataset.avg_temperature]
+    return cache.cached(
+        cache.dataset_key(dataset.pk, f'report-charts-{dataset.updated_at.timestamp():.6f}'), 'chart',
+        lambda: chart_drawing(list(distribution), list(distribution.values()), PARAMETERS, means),
+    )
+
+
+TEMPLATES = {
+    'standard': render_standard_report,
+}
+
+
+def render_pdf(dataset, output, template=DEFAULT_TEMPLATE):
+    """Write ``dataset``'s report rendered with ``template`` to the file ``output``."""
+    TEMPLATES[template](dataset, output)
+
+
+def render_stored_pdf(dataset, template=DEFAULT_TEMPLATE):
+    """Render through a temporary file into storage; return ``(sha256, storage name)``."""
+    with tempfile.TemporaryFile() as output:
+        render_pdf(dataset, output, template)
+        return store_pdf(output)
+
+
+def input_key(dataset, template):
+    """Hash of everything a report depends on: dataset version and template."""
+    source = f'{dataset.pk}:{dataset.updated_at.isoformat()}:{template}'
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def submit_report(dataset, template=DEFAULT_TEMPLATE):
+    """
+    Return a job for ``dataset`` rendered with ``template``.
+
+    A pending, running or finished job for the same inputs is returned as
+    is, so repeated submissions never render twice; a unique constraint
+    settles concurrent ones.
+    """
+    if template not in TEMPLATES:
+        raise ValueError(f'Unknown report template: {template}')
+
+    key = input_key(dataset, template)
+    existing = _live_job(key)
+    if existing is not None:
+        return existing
+
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(
+                user=dataset.user, dataset=dataset, template=template, input_key=key
+            )
+    except IntegrityError:
+        # Another request created the job in the meantime.
+        return _live_job(key)
+    if getattr(settings, 'REPORT_JOBS_EAGER', False):
+        if claim_job(job):
+            run_job(job)
+    return job
+
+
+def _live_job(key):
+    return ReportJob.objects.filter(
+        input_key=key, status__in=[ReportJob.PENDING, ReportJob.RUNNING, ReportJob.DONE]
+    ).order_by('-created_at').first()
+
+
+def claim_job(job):
+    """Atomically move ``job`` from pending to running; False if already taken."""
+    claimed = ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+        status=ReportJob.RUNNING, started_at=timezone.now()
+    )
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def claim_next_job():
+    """Claim the oldest pending job, requeueing jobs orphaned by a dead worker."""
+    timeout = getattr(settings, 'REPORT_JOB_TIMEOUT', 600)
+    ReportJob.objects.filter(
+        status=ReportJob.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=ReportJob.PENDING, started_at=None)
+
+    for job in ReportJob.objects.filter(status=ReportJob.PENDING).order_by('created_at')[:10]:
+        if claim_job(job):
+            return job
+    return None
+
+
+def store_pdf(fileobj):
+    """Store the PDF in ``fileobj`` content-addressed and return ``(sha256, storage name)``."""
+    sha256 = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(HASH_BLOCK_SIZE), b''):
+        sha256.update(block)
+    digest = sha256.hexdigest()
+    name = f'reports/{digest[:2]}/{digest}.pdf'
+    if not default_storage.exists(name):
+        fileobj.seek(0)
+        name = default_storage.save(name, File(fileobj))
+    return digest, name
+
+
+def run_job(job):
+    try:
+        job.content_hash, job.file.name = render_stored_pdf(job.dataset, job.template)
+        job.status = ReportJob.DONE
+    except Exception as e:
+        job.status = ReportJob.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save()
+    report_finished.send(sender=ReportJob, job=job)
+    return job
@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+from .columnar import fetch_columns
+from .models import DatasetStatistics, Equipment, EquipmentDataset, ReportJob, UploadPart, UploadSession
+from .sketches import DatasetSketch, build_statistics
+
+
+class UserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'email']
+
+
+class EquipmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Equipment
+        fields = ['id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
+
+
+class EquipmentDatasetSerializer(serializers.ModelSerializer):
+    statistics = serializers.SerializerMethodField()
+    raw_data = serializers.SerializerMethodField()
+
+    class Meta:
+        model = EquipmentDataset
+        fields = [
+            'id', 'filename', 'upload_date', 'updated_at', 'total_equipment',
+            'avg_flowrate', 'avg_pressure', 'avg_temperature',
+            'type_distribution', 'rows_source', 'validation', 'statistics', 'raw_data',
+        ]
+
+    def get_statistics(self, obj):
+        try:
+            statistics = obj.statistics
+        except DatasetStatistics.DoesNotExist:
+            statistics = build_statistics(obj)
+        return DatasetSketch.from_dict(statistics.sketch).summary()
+
+    def get_raw_data(self, obj):
+        request = self.context.get('request')
+        columns, _ = fetch_columns(obj)
+        if request is not None and request.query_params.get('layout') == 'columns':
+            return columns
+
+        names = list(columns)
+        values = [column.tolist() if hasattr(column, 'tolist') else column for column in columns.values()]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+
+class EquipmentDatasetListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EquipmentDataset
+        fields = [
+            'id', 'filename', 'upload_date', 'updated_at', 'total_equipment',
+            'avg_flowrate', 'avg_pressure', 'avg_temperature',
+            'type_distribution', 'rows_source', 'validation',
+        ]
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'dataset', 'template', 'status', 'content_hash', 'error',
+            'created_at', 'started_at', 'finished_at', 'download_url',
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.DONE:
+            return None
+        return reverse('report-download', args=[obj.pk], request=self.context.get('request'))
+
+
+class UploadPartSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadPart
+        fields = ['number', 'size', 'sha256']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    parts = UploadPartSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'size', 'part_size', 'part_count', 'status',
+            'parts', 'dataset', 'error', 'errors', 'created_at',
+        ]
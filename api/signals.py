@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import events
+from .cache import invalidate_dataset
+from .column_store import delete_dataset_files
+from .dedup import hand_over_rows
+from .models import EquipmentDataset, ReportJob, UploadSession
+from .reports import report_finished
+from .serializers import ReportJobSerializer, UploadSessionSerializer
+from .uploads import upload_finished
+
+
+@receiver(post_save, sender=EquipmentDataset)
+@receiver(post_delete, sender=EquipmentDataset)
+def invalidate_dataset_cache(sender, instance, **kwargs):
+    # Wait for the commit so a concurrent read cannot re-cache stale data
+    transaction.on_commit(lambda: invalidate_dataset(instance.pk, instance.user_id))
+
+
+@receiver(pre_delete, sender=EquipmentDataset)
+def keep_linked_rows(sender, instance, **kwargs):
+    hand_over_rows(instance)
+
+
+@receiver(post_delete, sender=EquipmentDataset)
+def delete_column_files(sender, instance, **kwargs):
+    dataset_id = instance.pk
+    transaction.on_commit(lambda: delete_dataset_files(dataset_id))
+
+
+@receiver(post_save, sender=EquipmentDataset)
+def publish_new_dataset(sender, instance, created, **kwargs):
+    if created:
+        events.dataset_changed('dataset_created', instance)
+
+
+@receiver(post_delete, sender=EquipmentDataset)
+def publish_deleted_dataset(sender, instance, **kwargs):
+    dataset_id = instance.pk
+    events.publish_on_commit(instance.user_id, 'dataset_deleted', lambda: {'id': dataset_id})
+
+
+@receiver(upload_finished, sender=UploadSession)
+def publish_finished_upload(sender, session, **kwargs):
+    events.publish(session.user_id, 'upload_finished', {'upload': UploadSessionSerializer(session).data})
+
+
+@receiver(report_finished, sender=ReportJob)
+def publish_finished_report(sender, job, **kwargs):
+    events.publish(job.user_id, 'report_finished', {'job': ReportJobSerializer(job).data})
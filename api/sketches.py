@@ -0,0 +1,528 @@
+"""
+Mergeable statistics sketches for equipment datasets.
+
+A ``DatasetSketch`` is built once while a CSV is ingested and stored on
+``DatasetStatistics``. It holds, for every numeric parameter, Welford
+moments (count, mean, M2, min, max) and a t-digest for quantiles, plus
+per-type moments. Sketches merge chunk by chunk and can be updated when
+rows are appended to or removed from a dataset, so the detail endpoint
+serves rich statistics without reading ``Equipment`` rows.
+
+Moments also keep the few lowest and highest values as candidates for the
+min and max, so removing the current extreme moves to the next candidate;
+rows are read again only once a removal has used them all up.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import Max, Min
+from equipment_stats import encode_types, summarize
+
+from .models import DatasetStatistics, Equipment
+
+PARAMETERS = ['Flowrate', 'Pressure', 'Temperature']
+PARAMETER_FIELDS = {'Flowrate': 'flowrate', 'Pressure': 'pressure', 'Temperature': 'temperature'}
+PERCENTILES = [5, 25, 50, 75, 95]
+
+DEFAULT_COMPRESSION = 100
+EXTREME_CANDIDATES = 8
+
+
+def _lowest(values, size=EXTREME_CANDIDATES):
+    """The ``size`` lowest of a float array, ascending."""
+    if values.size > size:
+        values = np.partition(values, size - 1)[:size]
+    return np.sort(values).tolist()
+
+
+def _bound(candidates, count, extreme):
+    """
+    How far ``candidates`` (the lowest values of ``count`` values whose
+    minimum is ``extreme``) are known to be complete: every value below the
+    bound is among them.
+    """
+    if len(candidates) >= count:
+        return math.inf
+    return candidates[-1] if candidates else extreme
+
+
+def _merge_lowest(first, first_count, first_min, second, second_count, second_min):
+    bound = min(_bound(first, first_count, first_min), _bound(second, second_count, second_min))
+    return sorted(value for value in first + second if value <= bound)[:EXTREME_CANDIDATES]
+
+
+def _remove_lowest(candidates, removed, removed_count, removed_min):
+    candidates = list(candidates)
+    for value in removed:
+        try:
+            candidates.remove(value)
+        except ValueError:
+            pass
+    # Removed values past ``removed``'s bound are unknown, and so is whether
+    # they took any of the remaining candidates from there on.
+    bound = _bound(removed, removed_count, removed_min)
+    return [value for value in candidates if value < bound]
+
+
+def _negated(values):
+    return [-value for value in values]
+
+
+def _negated_extreme(value):
+    return None if value is None else -value
+
+
+class Moments:
+    """
+    Welford/Chan running moments that support merge and removal.
+
+    ``low`` and ``high`` hold up to ``EXTREME_CANDIDATES`` of the lowest
+    (ascending) and highest (descending) values. Removals shrink them, so
+    they may hold fewer, but every value beyond the last candidate is known
+    to be further from the extreme.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=None, maximum=None, low=None, high=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+        self.low = list(low or [])
+        self.high = list(high or [])
+
+    @classmethod
+    def from_values(cls, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return cls()
+        mean = float(values.mean())
+        return cls(
+            count=int(values.size),
+            mean=mean,
+            m2=float(((values - mean) ** 2).sum()),
+            minimum=float(values.min()),
+            maximum=float(values.max()),
+            low=_lowest(values),
+            high=_negated(_lowest(-values)),
+        )
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            self.low, self.high = list(other.low), list(other.high)
+            return self
+
+        self.low = _merge_lowest(self.low, self.count, self.min, other.low, other.count, other.min)
+        self.high = _negated(_merge_lowest(
+            _negated(self.high), self.count, _negated_extreme(self.max),
+            _negated(other.high), other.count, _negated_extreme(other.max),
+        ))
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def remove(self, other):
+        """
+        Subtract ``other`` from these moments.
+
+        Returns True when the removed values took ``min`` or ``max`` and no
+        candidate is left to replace it, in which case the caller has to
+        refresh the extremes.
+        """
+        if not other.count:
+            return False
+        remaining = self.count - other.count
+        if remaining <= 0:
+            self.__init__()
+            return False
+
+        mean = (self.count * self.mean - other.count * other.mean) / remaining
+        delta = other.mean - mean
+        self.m2 = max(self.m2 - other.m2 - delta * delta * remaining * other.count / self.count, 0.0)
+        self.mean = mean
+        self.count = remaining
+
+        self.low = _remove_lowest(self.low, other.low, other.count, other.min)
+        self.high = _negated(_remove_lowest(
+            _negated(self.high), _negated(other.high), other.count, _negated_extreme(other.max),
+        ))
+        if other.min > self.min and other.max < self.max:
+            return False
+        if not self.low or not self.high:
+            return True
+        self.min, self.max = self.low[0], self.high[0]
+        return False
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    def to_dict(self):
+        return [self.count, self.mean, self.m2, self.min, self.max, self.low, self.high]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*data)
+
+
+class TDigest:
+    """
+    Merging t-digest (k1 scale function) with approximate deletion.
+
+    Deletion subtracts unit weights from the nearest centroids, which keeps
+    quantiles accurate as long as removals are small relative to the data.
+    """
+
+    def __init__(self, compression=DEFAULT_COMPRESSION, means=None, weights=None):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * np.arcsin(2 * np.clip(q, 0.0, 1.0) - 1)
+
+    def _q(self, k):
+        k = min(k, self.compression / 4)
+        return (math.sin(2 * math.pi * k / self.compression) + 1) / 2
+
+    @property
+    def total(self):
+        return float(self.weights.sum())
+
+    def add(self, values):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        if not values.size:
+            return self
+        # Bucket the sorted batch by integer k so each centroid spans at most
+        # one unit of the scale function, then fold it into the digest.
+        q = (np.arange(values.size) + 0.5) / values.size
+        buckets = np.floor(self._k(q))
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.diff(np.r_[starts, values.size]).astype(np.float64)
+        means = np.add.reduceat(values, starts) / counts
+        return self.merge(TDigest(self.compression, means, counts))
+
+    def merge(self, other):
+        self.means = np.concatenate([self.means, other.means])
+        self.weights = np.concatenate([self.weights, other.weights])
+        self._compress()
+        return self
+
+    def remove(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size or not self.means.size:
+            return self
+        last = self.means.size - 1
+        right = np.clip(np.searchsorted(self.means, values), 0, last)
+        left = np.clip(right - 1, 0, last)
+        nearest = np.where(
+            np.abs(values - self.means[left]) <= np.abs(self.means[right] - values), left, right
+        )
+        np.subtract.at(self.weights, nearest, 1.0)
+        keep = self.weights > 0
+        self.means, self.weights = self.means[keep], self.weights[keep]
+        return self
+
+    def _compress(self):
+        if self.means.size <= 1:
+            return
+        order = np.argsort(self.means, kind='mergesort')
+        means, weights = self.means[order], self.weights[order]
+        total = weights.sum()
+
+        merged_means, merged_weights = [], []
+        current_mean, current_weight = means[0], weights[0]
+        so_far = 0.0
+        limit = total * self._q(self._k(0.0) + 1)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if so_far + current_weight + weight <= limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                so_far += current_weight
+                merged_means.append(current_mean)
+                merged_weights.append(current_weight)
+                limit = total * self._q(float(self._k(so_far / total)) + 1)
+                current_mean, current_weight = mean, weight
+        merged_means.append(current_mean)
+        merged_weights.append(current_weight)
+
+        self.means = np.array(merged_means)
+        self.weights = np.array(merged_weights)
+
+    def quantile(self, q, minimum, maximum):
+        if not self.means.size:
+            return None
+        total = self.total
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.r_[0.0, centers, total]
+        ys = np.r_[minimum, self.means, maximum]
+        return float(np.interp(q * total, xs, ys))
+
+    def to_dict(self):
+        return {
+            'compression': self.compression,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['compression'], data['means'], data['weights'])
+
+
+def _with_candidates(moments, values):
+    """``moments`` of ``values`` (computed from them when None) with their extreme candidates."""
+    if moments is None:
+        return Moments.from_values(values)
+    moments.low, moments.high = _lowest(values), _negated(_lowest(-values))
+    return moments
+
+
+def _type_candidates(values, codes, groups):
+    """``(low, high)`` candidates of ``values`` for each of ``groups`` type codes."""
+    order = np.lexsort((values, codes))
+    ordered = values[order]
+    bounds = np.searchsorted(codes[order], np.arange(groups + 1))
+    return [
+        (ordered[start:end][:EXTREME_CANDIDATES].tolist(),
+         ordered[start:end][::-1][:EXTREME_CANDIDATES].tolist())
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+class ParameterSketch:
+    def __init__(self, moments=None, digest=None):
+        self.moments = moments or Moments()
+        self.digest = digest or TDigest()
+
+    def add(self, values, moments=None):
+        self.moments.merge(_with_candidates(moments, values))
+        self.digest.add(values)
+
+    def remove(self, values, moments=None):
+        self.digest.remove(values)
+        return self.moments.remove(_with_candidates(moments, values))
+
+    def summary(self):
+        summary = self.moments.summary()
+        for p in PERCENTILES:
+            summary[f'p{p:02d}'] = self.digest.quantile(p / 100, self.moments.min, self.moments.max)
+        return summary
+
+    def to_dict(self):
+        return {'moments': self.moments.to_dict(), 'digest': self.digest.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(Moments.from_dict(data['moments']), TDigest.from_dict(data['digest']))
+
+
+class DatasetSketch:
+    """Per-parameter sketches plus per-type moments for one dataset."""
+
+    def __init__(self, parameters=None, by_type=None):
+        self.parameters = parameters or {name: ParameterSketch() for name in PARAMETERS}
+        self.by_type = by_type or {}
+
+    @property
+    def count(self):
+        return self.parameters[PARAMETERS[0]].moments.count
+
+    def add_rows(self, frame):
+        """Fold a DataFrame with ``Type`` and the parameter columns."""
+        summary = summarize(frame, PARAMETERS)
+        codes, _ = encode_types(frame['Type'])
+        for name in PARAMETERS:
+            grouped = summary.moments[name]
+            values = frame[name].to_numpy(dtype=np.float64)
+            self.parameters[name].add(values, Moments(*grouped.total()))
+            candidates = _type_candidates(values, codes, len(summary.types))
+            for index, eq_type in enumerate(summary.types):
+                if not grouped.count[index]:
+                    continue
+                accumulators = self.by_type.setdefault(eq_type, {n: Moments() for n in PARAMETERS})
+                accumulators[name].merge(Moments(*grouped.group(index), *candidates[index]))
+
+    def remove_rows(self, frame):
+        """
+        Subtract a DataFrame of removed rows.
+
+        Returns the set of types whose min/max may now be stale (``None``
+        stands for the dataset-wide extremes).
+        """
+        stale = set()
+        summary = summarize(frame, PARAMETERS)
+        codes, _ = encode_types(frame['Type'])
+        for name in PARAMETERS:
+            grouped = summary.moments[name]
+            values = frame[name].to_numpy(dtype=np.float64)
+            if self.parameters[name].remove(values, Moments(*grouped.total())):
+                stale.add(None)
+            candidates = _type_candidates(values, codes, len(summary.types))
+            for index, eq_type in enumerate(summary.types):
+                accumulators = self.by_type.get(eq_type)
+                if accumulators is None or not grouped.count[index]:
+                    continue
+                if accumulators[name].remove(Moments(*grouped.group(index), *candidates[index])):
+                    stale.add(eq_type)
+        for eq_type in summary.types:
+            accumulators = self.by_type.get(eq_type)
+            if accumulators is not None and not accumulators[PARAMETERS[0]].count:
+                del self.by_type[eq_type]
+        return stale
+
+    def as_dataset_fields(self):
+        """Values for the summary columns stored on ``EquipmentDataset``."""
+        return {
+            'total_equipment': self.count,
+            'avg_flowrate': self.parameters['Flowrate'].moments.mean,
+            'avg_pressure': self.parameters['Pressure'].moments.mean,
+            'avg_temperature': self.parameters['Temperature'].moments.mean,
+            'type_distribution': {
+                eq_type: accumulators[PARAMETERS[0]].count
+                for eq_type, accumulators in self.by_type.items()
+            },
+        }
+
+    def summary(self):
+        return {
+            'parameters': {name: sketch.summary() for name, sketch in self.parameters.items()},
+            'by_type': {
+                eq_type: {
+                    'count': accumulators[PARAMETERS[0]].count,
+                    **{name: moments.summary() for name, moments in accumulators.items()},
+                }
+                for eq_type, accumulators in self.by_type.items()
+            },
+        }
+
+    def to_dict(self):
+        return {
+            'parameters': {name: sketch.to_dict() for name, sketch in self.parameters.items()},
+            'by_type': {
+                eq_type: {name: moments.to_dict() for name, moments in accumulators.items()}
+                for eq_type, accumulators in self.by_type.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            {name: ParameterSketch.from_dict(sketch) for name, sketch in data['parameters'].items()},
+            {
+                eq_type: {name: Moments.from_dict(moments) for name, moments in accumulators.items()}
+                for eq_type, accumulators in data['by_type'].items()
+            },
+        )
+
+
+def _refresh_extremes(sketch, dataset, stale):
+    """
+    Re-read min/max from the database for the accumulators in ``stale``,
+    whose candidates have run out. They start over from those two values,
+    so call this once every added row is in the database and in ``sketch``.
+    """
+    aggregates = {}
+    for name, field in PARAMETER_FIELDS.items():
+        aggregates[f'{field}_min'] = Min(field)
+        aggregates[f'{field}_max'] = Max(field)
+
+    rows = Equipment.objects.filter(dataset=dataset.rows_dataset)
+    if None in stale:
+        extremes = rows.aggregate(**aggregates)
+        for name, field in PARAMETER_FIELDS.items():
+            _set_extremes(sketch.parameters[name].moments, extremes[f'{field}_min'], extremes[f'{field}_max'])
+
+    types = [eq_type for eq_type in stale if eq_type is not None and eq_type in sketch.by_type]
+    if types:
+        grouped = rows.filter(equipment_type__in=types).values('equipment_type').annotate(**aggregates)
+        for extremes in grouped:
+            accumulators = sketch.by_type[extremes['equipment_type']]
+            for name, field in PARAMETER_FIELDS.items():
+                _set_extremes(accumulators[name], extremes[f'{field}_min'], extremes[f'{field}_max'])
+
+
+def _set_extremes(moments, minimum, maximum):
+    moments.min, moments.max = minimum, maximum
+    moments.low, moments.high = [minimum], [maximum]
+
+
+def build_statistics(dataset, chunk_size=50000):
+    """Build and store the sketch for a dataset that predates ``DatasetStatistics``."""
+    sketch = DatasetSketch()
+    rows = Equipment.objects.filter(dataset=dataset.rows_dataset).order_by('id').values_list(
+        'equipment_type', 'flowrate', 'pressure', 'temperature'
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            sketch.add_rows(pd.DataFrame(batch, columns=['Type', *PARAMETERS]))
+            batch = []
+    if batch:
+        sketch.add_rows(pd.DataFrame(batch, columns=['Type', *PARAMETERS]))
+
+    statistics, _ = DatasetStatistics.objects.update_or_create(
+        dataset=dataset, defaults={'sketch': sketch.to_dict()}
+    )
+    return statistics
+
+
+def update_statistics(dataset, added=None, removed=None):
+    """
+    Apply appended and/or removed rows to a dataset's stored statistics.
+
+    ``added`` and ``removed`` are DataFrames with ``Type`` and the parameter
+    columns. Call this after the rows have been written to or deleted from
+    the database; only extremes touched by a removal are re-read.
+    """
+    with transaction.atomic():
+        statistics = DatasetStatistics.objects.select_for_update().filter(dataset=dataset).first()
+        if statistics is None:
+            statistics = build_statistics(dataset)
+            sketch = DatasetSketch.from_dict(statistics.sketch)
+        else:
+            sketch = DatasetSketch.from_dict(statistics.sketch)
+            stale = set()
+            if removed is not None and not removed.empty:
+                stale = sketch.remove_rows(removed)
+            if added is not None and not added.empty:
+                sketch.add_rows(added)
+            # The database already holds the added rows, so refreshing before
+            # adding them would count them as candidates twice.
+            if stale:
+                _refresh_extremes(sketch, dataset, stale)
+            statistics.sketch = sketch.to_dict()
+            statistics.save(update_fields=['sketch', 'updated_at'])
+
+        fields = sketch.as_dataset_fields()
+        for field, value in fields.items():
+            setattr(dataset, field, value)
+        dataset.save(update_fields=[*fields, 'updated_at'])
+
+    return statistics
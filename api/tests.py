@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test.client import encode_multipart
+from django.utils import timezone
+from equipment_stats import summarize
+from reportlab.graphics.shapes import UserNode
+from reportlab.platypus import Paragraph
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import admin, charts, column_store, events, exports, renderers, report_engine, reports, uploads
+from .bulk_writer import EquipmentBulkWriter
+from .management.commands import audit_query_plans
+from .cache import cached, dataset_key, history_key
+from .models import DatasetStatistics, Equipment, EquipmentDataset, ReportJob, UploadSession
+from .sketches import PARAMETER_FIELDS, PARAMETERS, DatasetSketch, Moments
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover - optional dependency
+    pypdf = None
+
+HEADER = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+TYPES = ['Pump', 'Valve', 'Reactor', 'Compressor']
+
+
+def equipment_rows(count, seed=0, prefix='Unit'):
+    """``count`` valid ``(name, type, flowrate, pressure, temperature)`` rows."""
+    rng = np.random.default_rng(seed)
+    return [
+        (
+            f'{prefix}-{i}', TYPES[i % len(TYPES)],
+            round(float(rng.uniform(10, 500)), 3),
+            round(float(rng.uniform(1, 80)), 3),
+            round(float(rng.uniform(20, 400)), 3),
+        )
+        for i in range(count)
+    ]
+
+
+class PickleCounter:
+    """Counts how many times an instance is pickled."""
+
+    pickled = 0
+
+    def __reduce__(self):
+        type(self).pickled += 1
+        return PickleCounter, ()
+
+
+def csv_bytes(rows, header=HEADER):
+    lines = [','.join(header)] + [','.join(str(value) for value in row) for row in rows]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class ApiTestCase(TestCase):
+    """Authenticated API client, an empty cache and a throwaway media directory."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='secret')
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(
+            MEDIA_ROOT=media, COLUMN_STORE_DIR=os.path.join(media, 'columns'), INGEST_PROCESSES=0,
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, filename='plant.csv'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/api/datasets/upload_csv/',
+                {'file': SimpleUploadedFile(filename, content, content_type='text/csv')},
+                format='multipart',
+            )
+
+
+class IngestionTests(ApiTestCase):
+    @override_settings(CSV_INGEST_CHUNK_SIZE=7)
+    def test_ingests_the_file_chunk_by_chunk(self):
+        rows = equipment_rows(50)
+        response = self.upload(csv_bytes(rows))
+
+        self.assertEqual(response.status_code, 201)
+        dataset = EquipmentDataset.objects.get(pk=response.data['id'])
+        frame = pd.DataFrame(rows, columns=HEADER)
+        self.assertEqual(dataset.total_equipment, 50)
+        self.assertEqual(
+            list(dataset.equipment.order_by('id').values_list('name', flat=True)),
+            frame['Equipment Name'].tolist(),
+        )
+        self.assertAlmostEqual(dataset.avg_flowrate, frame['Flowrate'].mean())
+        self.assertAlmostEqual(dataset.avg_temperature, frame['Temperature'].mean())
+        self.assertEqual(dataset.type_distribution, frame['Type'].value_counts().to_dict())
+
+    def test_response_is_the_summary_without_rows(self):
+        response = self.upload(csv_bytes(equipment_rows(20)))
+
+        self.assertEqual(response.data['total_equipment'], 20)
+        self.assertNotIn('raw_data', response.data)
+        self.assertNotIn('statistics', response.data)
+
+    def test_missing_columns_are_rejected(self):
+        response = self.upload(b'Equipment Name,Type,Flowrate\nPump-1,Pump,1\n')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Missing required columns: Pressure, Temperature')
+        self.assertFalse(EquipmentDataset.objects.exists())
+
+    @override_settings(CSV_INGEST_CHUNK_SIZE=2)
+    def test_invalid_rows_are_skipped_and_reported(self):
+        rows = [
+            ('Pump-1', 'Pump', 10, 5, 80),
+            ('Pump-2', 'Pump', 'fast', 5, 80),
+            ('Pump-3', 'Pump', -4, 5, 80),
+            ('Pump-1', 'Valve', 12, 5, 80),
+            ('Pump-4', '', 12, 5, 80),
+            ('Pump-5', 'Pump', 11, 6, 90),
+        ]
+        response = self.upload(csv_bytes(rows))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_equipment'], 2)
+        validation = response.data['validation']
+        self.assertEqual((validation['rows'], validation['rejected']), (6, 4))
+        self.assertEqual(
+            [(error['row'], error['column']) for error in validation['errors']],
+            [(2, 'Flowrate'), (3, 'Flowrate'), (4, 'Equipment Name'), (5, 'Type')],
+        )
+
+    def test_missing_type_is_rejected_alongside_types_needing_a_strip(self):
+        rows = [('Pump-1', 'Pump ', 10, 5, 80), ('Pump-2', 'Pump', 11, 5, 80), ('Pump-3', '', 12, 5, 80)]
+        response = self.upload(csv_bytes(rows))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_equipment'], 2)
+        self.assertEqual(
+            [(error['row'], error['column']) for error in response.data['validation']['errors']], [(3, 'Type')],
+        )
+        self.assertEqual(EquipmentDataset.objects.get().type_distribution, {'Pump': 2})
+
+    def test_file_without_valid_rows_is_rejected(self):
+        response = self.upload(csv_bytes([('Pump-1', 'Pump', 'x', 1, 1), ('Pump-2', 'Pump', 1, 'y', 1)]))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'The uploaded file contains no valid equipment rows')
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2])
+        self.assertFalse(EquipmentDataset.objects.exists())
+
+    def test_converts_units_to_canonical(self):
+        header = ['Equipment Name', 'Type', 'Flowrate', 'Pressure (psi)', 'Temperature']
+        response = self.upload(csv_bytes([('Pump-1', 'Pump', '10 l/s', 100, '212 F')], header))
+
+        self.assertEqual(response.status_code, 201)
+        row = EquipmentDataset.objects.get().equipment.get()
+        self.assertAlmostEqual(row.flowrate, 36.0)
+        self.assertAlmostEqual(row.pressure, 6.89475729)
+        self.assertAlmostEqual(row.temperature, 100.0)
+
+
+class BulkWriterTests(ApiTestCase):
+    def backends(self):
+        return ['orm', *([connection.vendor] if connection.vendor in ('sqlite', 'postgresql') else [])]
+
+    def test_writes_every_row_in_batches(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                rows = equipment_rows(50, prefix=backend)
+                with EquipmentBulkWriter(batch_size=7, backend=backend) as writer:
+                    dataset = EquipmentDataset.objects.create(user=self.user, filename=f'{backend}.csv')
+                    written = writer.write(dataset, iter(rows))
+
+                self.assertEqual((written, writer.rows_written), (50, 50))
+                self.assertEqual(
+                    list(dataset.equipment.order_by('id').values_list(
+                        'name', 'equipment_type', 'flowrate', 'pressure', 'temperature',
+                    )),
+                    rows,
+                )
+
+    def test_counts_rows_across_writes(self):
+        with EquipmentBulkWriter(batch_size=8) as writer:
+            dataset = EquipmentDataset.objects.create(user=self.user, filename='two.csv')
+            writer.write(dataset, equipment_rows(20))
+            writer.write(dataset, equipment_rows(13, prefix='More'))
+
+        self.assertEqual(writer.rows_written, 33)
+        self.assertEqual(dataset.equipment.count(), 33)
+
+    def test_failure_rolls_back_every_batch(self):
+        with self.assertRaises(RuntimeError):
+            with EquipmentBulkWriter(batch_size=5) as writer:
+                dataset = EquipmentDataset.objects.create(user=self.user, filename='failed.csv')
+                writer.write(dataset, equipment_rows(12))
+                raise RuntimeError('interrupted')
+
+        self.assertFalse(EquipmentDataset.objects.exists())
+        self.assertFalse(Equipment.objects.exists())
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            EquipmentBulkWriter(backend='oracle')
+
+
+def equipment_frame(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Type': pd.Categorical(rng.choice(TYPES, count)),
+        'Flowrate': rng.lognormal(4, 0.6, count),
+        'Pressure': rng.normal(40, 12, count),
+        'Temperature': rng.uniform(20, 400, count),
+    })
+
+
+def sketch_of(frame, chunk_size=700):
+    sketch = DatasetSketch()
+    for start in range(0, len(frame), chunk_size):
+        sketch.add_rows(frame.iloc[start:start + chunk_size])
+    return sketch
+
+
+class SketchTests(SimpleTestCase):
+    def assertMomentsMatch(self, summary, values):
+        self.assertEqual(summary['count'], len(values))
+        self.assertAlmostEqual(summary['mean'], values.mean(), places=9)
+        self.assertAlmostEqual(summary['std'], values.std(ddof=1), places=9)
+        self.assertEqual((summary['min'], summary['max']), (values.min(), values.max()))
+
+    def test_moments_match_numpy(self):
+        frame = equipment_frame(5000)
+        summary = sketch_of(frame).summary()
+
+        for name in PARAMETERS:
+            self.assertMomentsMatch(summary['parameters'][name], frame[name].to_numpy())
+        for eq_type, group in frame.groupby('Type', observed=True):
+            self.assertEqual(summary['by_type'][eq_type]['count'], len(group))
+            for name in PARAMETERS:
+                self.assertMomentsMatch(summary['by_type'][eq_type][name], group[name].to_numpy())
+
+    def test_quantiles_are_close_to_numpy(self):
+        frame = equipment_frame(20000, seed=1)
+        summary = sketch_of(frame, chunk_size=3000).summary()
+
+        for name in PARAMETERS:
+            values = frame[name].to_numpy()
+            for p in (5, 25, 50, 75, 95):
+                # Within half a percentile of the exact value.
+                low, high = np.percentile(values, [p - 0.5, p + 0.5])
+                self.assertTrue(low <= summary['parameters'][name][f'p{p:02d}'] <= high, (name, p))
+
+    def test_removing_rows_matches_a_sketch_of_the_rest(self):
+        frame = equipment_frame(3000, seed=2)
+        # The removed rows include every parameter's current min and max.
+        extremes = {index for name in PARAMETERS for index in (frame[name].idxmin(), frame[name].idxmax())}
+        removed = frame.loc[sorted(extremes | set(range(0, 3000, 7)))]
+        sketch = sketch_of(frame)
+
+        stale = sketch.remove_rows(removed)
+
+        self.assertEqual(stale, set())
+        rest = frame.drop(removed.index)
+        summary = sketch.summary()
+        for name in PARAMETERS:
+            self.assertMomentsMatch(summary['parameters'][name], rest[name].to_numpy())
+        for eq_type, group in rest.groupby('Type', observed=True):
+            self.assertMomentsMatch(summary['by_type'][eq_type]['Flowrate'], group['Flowrate'].to_numpy())
+
+    def test_extremes_are_stale_once_the_candidates_run_out(self):
+        values = np.arange(100, dtype=np.float64)
+        moments = Moments.from_values(values)
+
+        self.assertFalse(moments.remove(Moments.from_values(values[:5])))
+        self.assertEqual(moments.min, 5.0)
+        self.assertTrue(moments.remove(Moments.from_values(values[5:20])))
+
+    def test_sketch_round_trips_through_a_dict(self):
+        sketch = sketch_of(equipment_frame(1000, seed=3))
+
+        self.assertEqual(DatasetSketch.from_dict(sketch.to_dict()).summary(), sketch.summary())
+
+    def test_summarize_matches_pandas_groupby(self):
+        frame = equipment_frame(2000, seed=4)
+        summary = summarize(frame)
+
+        grouped = frame.groupby('Type', observed=True)['Pressure']
+        self.assertEqual(summary.type_distribution, grouped.size().to_dict())
+        for index, eq_type in enumerate(summary.types):
+            count, mean, m2, minimum, maximum = summary.moments['Pressure'].group(index)
+            self.assertAlmostEqual(mean, grouped.mean()[eq_type], places=9)
+            self.assertAlmostEqual(m2 / (count - 1), grouped.var()[eq_type], places=6)
+            self.assertEqual((minimum, maximum), (grouped.min()[eq_type], grouped.max()[eq_type]))
+
+
+class ColumnPaginationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = equipment_rows(45)
+        self.dataset_id = self.upload(csv_bytes(self.rows)).data['id']
+
+    def columns(self, **params):
+        return self.client.get(f'/api/datasets/{self.dataset_id}/columns/', params, HTTP_ACCEPT='application/json')
+
+    def read_all(self, **params):
+        names, flowrates, pages = [], [], 0
+        cursor = None
+        while True:
+            response = self.columns(**params, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            names += body['columns']['Equipment Name']
+            flowrates += body['columns']['Flowrate']
+            pages += 1
+            cursor = body['next_cursor']
+            if cursor is None:
+                return names, flowrates, pages
+
+    def test_pages_cover_every_row_once(self):
+        for enabled in (True, False):
+            with self.subTest(column_store=enabled), self.settings(COLUMN_STORE_ENABLED=enabled):
+                names, flowrates, pages = self.read_all(limit=20, fields='Equipment Name,Flowrate')
+
+                self.assertEqual(pages, 3)
+                self.assertEqual(names, [row[0] for row in self.rows])
+                self.assertEqual(flowrates, [row[2] for row in self.rows])
+
+    def test_every_format_carries_the_next_cursor_header(self):
+        url = f'/api/datasets/{self.dataset_id}/columns/'
+        formats = ['json', 'npz'] + (['arrow'] if renderers.pyarrow is not None else [])
+        for fmt in formats:
+            with self.subTest(format=fmt):
+                cursors, params = [], {'limit': 20, 'format': fmt}
+                while True:
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 200)
+                    cursor = response.get('X-Next-Cursor')
+                    if cursor is None:
+                        break
+                    cursors.append(cursor)
+                    params['cursor'] = cursor
+                    if fmt == 'json':
+                        self.assertEqual(response.json()['next_cursor'], cursor)
+
+                self.assertEqual(len(cursors), 2)
+
+    def test_only_requested_fields_are_returned(self):
+        body = self.columns(limit=5, fields='Type').json()
+
+        self.assertEqual(list(body['columns']), ['Type'])
+        self.assertEqual(body['count'], 5)
+
+    def test_cursor_from_an_older_version_is_rejected(self):
+        cursor = self.columns(limit=20).json()['next_cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/datasets/{self.dataset_id}/delta/', {'delete': ['Unit-0']}, format='json')
+
+        response = self.columns(limit=20, cursor=cursor)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'The dataset has changed since this cursor was issued')
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'fields': 'Colour'}, {'limit': '0'}, {'cursor': '!!'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.columns(**params).status_code, 400)
+
+
+class ConditionalResponseTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dataset_id = self.upload(csv_bytes(equipment_rows(30))).data['id']
+        self.url = f'/api/datasets/{self.dataset_id}/'
+
+    def change_dataset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.url}delta/', {'delete': ['Unit-0']}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unchanged_dataset_revalidates_with_304(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+        )
+
+    def test_changed_dataset_is_sent_again(self):
+        etag = self.client.get(self.url)['ETag']
+        self.change_dataset()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['total_equipment'], 29)
+
+    def test_layouts_have_their_own_etags(self):
+        rows = self.client.get(self.url)['ETag']
+        columns = self.client.get(self.url, {'layout': 'columns'})['ETag']
+
+        self.assertNotEqual(rows, columns)
+        self.assertEqual(self.client.get(self.url, {'layout': 'columns'}, HTTP_IF_NONE_MATCH=rows).status_code, 200)
+
+    def test_change_invalidates_the_cached_detail(self):
+        self.client.get(self.url)
+        self.assertIsNotNone(cache.get(dataset_key(self.dataset_id, 'detail-rows')))
+
+        self.change_dataset()
+
+        self.assertIsNone(cache.get(dataset_key(self.dataset_id, 'detail-rows')))
+        self.assertEqual(self.client.get(self.url).data['total_equipment'], 29)
+
+    def test_new_upload_invalidates_the_history(self):
+        self.assertEqual(len(self.client.get('/api/datasets/history/').data), 1)
+        self.assertIsNotNone(cache.get(history_key(self.user.pk)))
+
+        self.upload(csv_bytes(equipment_rows(5, prefix='Other')), 'other.csv')
+
+        self.assertIsNone(cache.get(history_key(self.user.pk)))
+        self.assertEqual(len(self.client.get('/api/datasets/history/').data), 2)
+
+    def test_values_over_the_entry_limit_are_not_cached(self):
+        with self.settings(API_CACHE_MAX_ENTRY_BYTES=1024):
+            self.assertEqual(len(cached('api:test:large', 'detail', lambda: {'rows': list(range(1000))})['rows']), 1000)
+            cached('api:test:small', 'detail', lambda: {'rows': [1, 2]})
+
+        self.assertIsNone(cache.get('api:test:large'))
+        self.assertEqual(pickle.loads(cache.get('api:test:small')), {'rows': [1, 2]})
+
+    def test_a_miss_pickles_the_value_once(self):
+        PickleCounter.pickled = 0
+        value = cached('api:test:once', 'detail', lambda: {'counter': PickleCounter()})
+
+        self.assertEqual(PickleCounter.pickled, 1)
+        self.assertIsInstance(value['counter'], PickleCounter)
+        self.assertIsInstance(cached('api:test:once', 'detail', lambda: None)['counter'], PickleCounter)
+
+
+class UploadSessionTests(ApiTestCase):
+    PART_SIZE = 256
+
+    def setUp(self):
+        super().setUp()
+        self.content = csv_bytes(equipment_rows(40))
+
+    def start(self, content=None, filename='big.csv'):
+        content = content or self.content
+        response = self.client.post(
+            '/api/uploads/', {'filename': filename, 'size': len(content), 'part_size': self.PART_SIZE},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def put_part(self, session, number, content=None, sha256=None):
+        content = content or self.content
+        part = content[(number - 1) * self.PART_SIZE:number * self.PART_SIZE]
+        return self.client.put(
+            f"/api/uploads/{session['id']}/parts/{number}/", part,
+            content_type='application/octet-stream',
+            HTTP_X_CONTENT_SHA256=sha256 or hashlib.sha256(part).hexdigest(),
+        )
+
+    def put_all(self, session, content=None):
+        for number in range(1, session['part_count'] + 1):
+            self.assertEqual(self.put_part(session, number, content).status_code, 200)
+
+    def complete(self, session):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f"/api/uploads/{session['id']}/complete/")
+
+    def run_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_upload_worker', once=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_completed_upload_is_queued_then_ingested(self):
+        session = self.start()
+        self.put_all(session)
+
+        response = self.complete(session)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], UploadSession.QUEUED)
+        self.assertTrue(response['Location'].endswith(f"/api/uploads/{session['id']}/"))
+        self.assertFalse(EquipmentDataset.objects.exists())
+
+        self.run_worker()
+
+        session = self.client.get(f"/api/uploads/{session['id']}/").data
+        self.assertEqual(session['status'], UploadSession.COMPLETE)
+        dataset = EquipmentDataset.objects.get(pk=session['dataset'])
+        self.assertEqual((dataset.filename, dataset.total_equipment), ('big.csv', 40))
+
+    def test_session_lists_received_parts_for_resuming(self):
+        session = self.start()
+        self.put_part(session, 1)
+        self.put_part(session, 3)
+
+        parts = self.client.get(f"/api/uploads/{session['id']}/").data['parts']
+        self.assertEqual([part['number'] for part in parts], [1, 3])
+
+        response = self.complete(session)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('2', response.data['error'])
+
+        self.put_all(session)
+        self.assertEqual(self.complete(session).status_code, 202)
+
+    def test_part_with_a_wrong_checksum_is_rejected(self):
+        session = self.start()
+
+        response = self.put_part(session, 1, sha256='0' * 64)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Checksum mismatch for part 1')
+        self.assertEqual(self.client.get(f"/api/uploads/{session['id']}/").data['parts'], [])
+
+    def test_invalid_file_fails_the_session(self):
+        content = csv_bytes([('Pump-1', 'Pump', 'x', 1, 1)] * 30)
+        session = self.start(content)
+        self.put_all(session, content)
+        self.complete(session)
+
+        self.run_worker()
+
+        session = self.client.get(f"/api/uploads/{session['id']}/").data
+        self.assertEqual(session['status'], UploadSession.FAILED)
+        self.assertEqual(session['error'], 'The uploaded file contains no valid equipment rows')
+        self.assertEqual(session['errors'][0]['column'], 'Flowrate')
+
+    @override_settings(UPLOAD_INGEST_TIMEOUT=60)
+    def test_only_sessions_without_a_heartbeat_are_requeued(self):
+        session = self.start()
+        self.put_all(session)
+        self.complete(session)
+        claimed = uploads.claim_next_session()
+        heartbeat = uploads.Heartbeat(claimed)
+        stale = timezone.now() - timedelta(seconds=120)
+
+        UploadSession.objects.filter(pk=claimed.pk).update(updated_at=stale)
+        heartbeat('big.csv', 10, 100)
+        self.assertIsNone(uploads.claim_next_session())
+
+        UploadSession.objects.filter(pk=claimed.pk).update(updated_at=stale)
+        self.assertEqual(uploads.claim_next_session().pk, claimed.pk)
+
+    @override_settings(UPLOAD_INGEST_EAGER=True)
+    def test_eager_mode_ingests_in_the_request(self):
+        session = self.start()
+        self.put_all(session)
+
+        response = self.complete(session)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_equipment'], 40)
+        self.assertNotIn('raw_data', response.data)
+
+
+class CompressionTests(ApiTestCase):
+    BOUNDARY = 'equipment-boundary'
+
+    def post_gzipped(self, body, content_type):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/api/datasets/upload_csv/', body, content_type=content_type, HTTP_CONTENT_ENCODING='gzip',
+            )
+
+    def multipart(self, content, filename='plant.csv'):
+        body = encode_multipart(self.BOUNDARY, {
+            'file': SimpleUploadedFile(filename, content, content_type='text/csv'),
+        })
+        return body, f'multipart/form-data; boundary={self.BOUNDARY}'
+
+    def test_gzipped_upload_is_decoded(self):
+        body, content_type = self.multipart(csv_bytes(equipment_rows(50)))
+
+        response = self.post_gzipped(gzip.compress(body), content_type)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_equipment'], 50)
+
+    def test_corrupt_gzip_body_is_rejected(self):
+        body, content_type = self.multipart(csv_bytes(equipment_rows(50)))
+
+        response = self.post_gzipped(gzip.compress(body)[:-40] + b'x' * 40, content_type)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['error'].startswith('Invalid gzip request body'))
+        self.assertFalse(EquipmentDataset.objects.exists())
+
+    def test_unknown_encoding_is_unsupported(self):
+        response = self.client.post(
+            '/api/datasets/upload_csv/', b'data', content_type='text/csv', HTTP_CONTENT_ENCODING='br',
+        )
+
+        self.assertEqual(response.status_code, 415)
+        self.assertIn('gzip', response['Accept-Encoding'])
+
+    def test_large_responses_are_compressed_when_accepted(self):
+        dataset_id = self.upload(csv_bytes(equipment_rows(60))).data['id']
+        url = f'/api/datasets/{dataset_id}/'
+
+        plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=1, identity;q=0.5')
+
+        self.assertGreaterEqual(len(plain.content), 1024)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed['ETag'], f"W/{plain['ETag']}")
+
+    def test_small_responses_are_left_alone(self):
+        response = self.client.get('/api/datasets/history/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertLess(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class DeduplicationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = equipment_rows(30)
+        self.source_id = self.upload(csv_bytes(self.rows), 'first.csv').data['id']
+
+    def test_repeated_upload_links_to_the_stored_rows(self):
+        response = self.upload(csv_bytes(self.rows), 'second.csv')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['rows_source'], self.source_id)
+        self.assertEqual(response.data['total_equipment'], 30)
+        self.assertEqual(Equipment.objects.count(), 30)
+        self.assertEqual(Equipment.objects.filter(dataset_id=response.data['id']).count(), 0)
+
+    def test_same_rows_in_another_layout_are_linked(self):
+        header = ['Temperature', 'Type', 'Equipment Name', 'Pressure', 'Flowrate']
+        rows = [(t, eq_type, name, p, f) for name, eq_type, f, p, t in self.rows]
+        content = csv_bytes(rows, header).replace(b'\n', b'\r\n')
+
+        response = self.upload(content, 'reordered.csv')
+
+        self.assertEqual(response.data['rows_source'], self.source_id)
+        self.assertEqual(Equipment.objects.count(), 30)
+
+    def test_delta_on_a_linked_dataset_detaches_it(self):
+        linked_id = self.upload(csv_bytes(self.rows), 'second.csv').data['id']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/datasets/{linked_id}/delta/', {'delete': ['Unit-0']}, format='json',
+            )
+
+        self.assertEqual(response.status_code, 200)
+        linked = EquipmentDataset.objects.get(pk=linked_id)
+        self.assertIsNone(linked.rows_source_id)
+        self.assertEqual((linked.content_hash, linked.rows_hash), ('', ''))
+        self.assertEqual(linked.equipment.count(), 29)
+        self.assertEqual(Equipment.objects.filter(dataset_id=self.source_id).count(), 30)
+
+    def test_deleting_the_source_hands_the_rows_to_a_linked_dataset(self):
+        heir_id = self.upload(csv_bytes(self.rows), 'second.csv').data['id']
+        other_id = self.upload(csv_bytes(self.rows), 'third.csv').data['id']
+        self.assertEqual(self.client.get(f'/api/datasets/{heir_id}/').data['rows_source'], self.source_id)
+        source = EquipmentDataset.objects.get(pk=self.source_id)
+        column_store.read_table(source)
+        self.assertTrue(os.path.exists(column_store.column_path(source)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            EquipmentDataset.objects.get(pk=self.source_id).delete()
+
+        # The source's column file is moved under the heir's new version
+        # (checked before any read could rebuild it from the rows).
+        self.assertTrue(os.path.exists(column_store.column_path(EquipmentDataset.objects.get(pk=heir_id))))
+        self.assertEqual(Equipment.objects.filter(dataset_id=heir_id).count(), 30)
+        self.assertIsNone(self.client.get(f'/api/datasets/{heir_id}/').data['rows_source'])
+        self.assertEqual(self.client.get(f'/api/datasets/{other_id}/').data['rows_source'], heir_id)
+
+
+def delta_row(name, eq_type, flowrate, pressure, temperature):
+    """A delta ``upsert`` row object."""
+    return dict(zip(HEADER, (name, eq_type, flowrate, pressure, temperature)))
+
+
+class DeltaTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dataset_id = self.upload(csv_bytes(equipment_rows(40))).data['id']
+
+    def delta(self, data, format='json'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/datasets/{self.dataset_id}/delta/', data, format=format)
+
+    def stored_rows(self):
+        return pd.DataFrame(
+            Equipment.objects.filter(dataset_id=self.dataset_id).order_by('id')
+            .values_list('name', 'equipment_type', 'flowrate', 'pressure', 'temperature'),
+            columns=HEADER,
+        )
+
+    def test_upserts_and_deletes_by_name(self):
+        response = self.delta({
+            'upsert': [delta_row('Unit-1', 'Valve', 1.5, 2, 30), delta_row('Extra-1', 'Pump', 9, 8, 70)],
+            'delete': ['Unit-2', 'Unit-3', 'Missing'],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['inserted'], response.data['updated'], response.data['deleted']), (1, 1, 2)
+        )
+        self.assertEqual(response.data['not_found'], ['Missing'])
+        self.assertEqual(response.data['dataset']['total_equipment'], 39)
+        rows = self.stored_rows().set_index('Equipment Name')
+        self.assertEqual(tuple(rows.loc['Unit-1']), ('Valve', 1.5, 2.0, 30.0))
+        self.assertNotIn('Unit-2', rows.index)
+        self.assertIn('Extra-1', rows.index)
+
+    def test_statistics_match_the_rows_after_a_delta(self):
+        upsert = [delta_row(f'Unit-{i}', 'Reactor', 1000 + i, 0.5, 20) for i in range(0, 40, 3)]
+        self.delta({'upsert': upsert, 'delete': [f'Unit-{i}' for i in range(1, 40, 5)]})
+
+        stored = DatasetStatistics.objects.get(dataset_id=self.dataset_id).sketch
+        summary = DatasetSketch.from_dict(stored).summary()
+        rows = self.stored_rows()
+        expected = sketch_of(rows.drop(columns='Equipment Name')).summary()
+        for name in PARAMETERS:
+            for field in ('count', 'min', 'max'):
+                self.assertEqual(summary['parameters'][name][field], expected['parameters'][name][field])
+            for field in ('mean', 'std'):
+                self.assertAlmostEqual(summary['parameters'][name][field], expected['parameters'][name][field])
+        self.assertEqual(
+            {eq_type: values['count'] for eq_type, values in summary['by_type'].items() if values['count']},
+            rows['Type'].value_counts().to_dict(),
+        )
+
+    def test_extremes_stay_exact_across_deltas(self):
+        rows = [(f'U{i}', 'Pump', float(i), float(i), float(i)) for i in range(1, 11)]
+        self.dataset_id = self.upload(csv_bytes(rows), 'small.csv').data['id']
+        self.delta({
+            'upsert': [delta_row('U2', 'Pump', 100, 100, 100)],
+            'delete': [f'U{i}' for i in range(3, 11)],
+        })
+        self.delta({'delete': ['U2']})
+
+        summary = DatasetSketch.from_dict(
+            DatasetStatistics.objects.get(dataset_id=self.dataset_id).sketch
+        ).summary()
+        for name, field in PARAMETER_FIELDS.items():
+            extremes = Equipment.objects.filter(dataset_id=self.dataset_id).aggregate(Min(field), Max(field))
+            self.assertEqual(
+                (summary['parameters'][name]['min'], summary['parameters'][name]['max']),
+                (extremes[f'{field}__min'], extremes[f'{field}__max']),
+            )
+            self.assertEqual(summary['by_type']['Pump'][name]['max'], 1.0)
+
+    def test_column_file_is_patched_to_match_the_rows(self):
+        dataset = EquipmentDataset.objects.get(pk=self.dataset_id)
+        column_store.read_table(dataset)
+        previous = column_store.column_path(dataset)
+
+        self.delta({
+            'upsert': [delta_row('Unit-5', 'Pump', 7, 6, 50), delta_row('New-1', 'Valve', 3, 2, 25)],
+            'delete': ['Unit-0'],
+        })
+
+        dataset.refresh_from_db()
+        path = column_store.column_path(dataset)
+        self.assertNotEqual(path, previous)
+        self.assertTrue(os.path.exists(path))
+        table = column_store.read_table(dataset).to_pandas()
+        pd.testing.assert_frame_equal(
+            table.astype({'Type': str}), self.stored_rows(), check_dtype=False,
+        )
+
+    def test_row_both_upserted_and_deleted_is_rejected(self):
+        response = self.delta({
+            'upsert': [delta_row('Unit-1', 'Pump', 1, 1, 1)],
+            'delete': ['Unit-1'],
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unit-1', response.data['error'])
+        self.assertEqual(Equipment.objects.filter(dataset_id=self.dataset_id).count(), 40)
+
+    def test_invalid_row_fails_the_whole_delta(self):
+        response = self.delta({
+            'upsert': [
+                delta_row('Unit-1', 'Pump', 1, 1, 1),
+                delta_row('Unit-2', 'Pump', 'fast', 1, 1),
+            ],
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['column'], 'Flowrate')
+        self.assertNotEqual(self.stored_rows().set_index('Equipment Name').loc['Unit-1', 'Flowrate'], 1)
+
+    def test_csv_delta_file(self):
+        content = csv_bytes([('Unit-4', 'Valve', 11, 12, 13), ('Fresh-1', 'Pump', 1, 2, 3)])
+
+        response = self.delta({'file': SimpleUploadedFile('delta.csv', content, content_type='text/csv')},
+                              format='multipart')
+
+        self.assertEqual((response.data['inserted'], response.data['updated']), (1, 1))
+
+
+class EventTests(ApiTestCase):
+    def test_poll_returns_new_events_in_order(self):
+        subscription = events.Subscription(self.user.pk)
+        events.publish(self.user.pk, 'first', {'n': 1})
+        events.publish(self.user.pk, 'second', {'n': 2})
+        events.publish(self.user.pk + 1, 'other', {})
+
+        polled = subscription.poll()
+
+        self.assertEqual([(kind, json.loads(data)) for _, kind, data in polled],
+                         [('first', {'n': 1}), ('second', {'n': 2})])
+        self.assertEqual(subscription.poll(), [])
+
+    def test_subscription_resumes_after_an_event_id(self):
+        first = events.publish(self.user.pk, 'first', {})
+        events.publish(self.user.pk, 'second', {})
+
+        polled = events.Subscription(self.user.pk, after=first).poll()
+
+        self.assertEqual([kind for _, kind, _ in polled], ['second'])
+
+    def test_unknown_event_id_starts_from_new_events(self):
+        events.publish(self.user.pk, 'first', {})
+
+        self.assertEqual(events.Subscription(self.user.pk, after=99).poll(), [])
+
+    def test_upload_publishes_dataset_created_on_commit(self):
+        subscription = events.Subscription(self.user.pk)
+
+        dataset_id = self.upload(csv_bytes(equipment_rows(10))).data['id']
+
+        published = {kind: json.loads(data) for _, kind, data in subscription.poll()}
+        self.assertEqual(published['dataset_created']['dataset']['id'], dataset_id)
+        self.assertEqual(published['ingest_progress']['rows'], 10)
+
+    def test_wsgi_stream_sends_the_backlog_and_ends(self):
+        after = events.publish(self.user.pk, 'first', {})
+        events.publish(self.user.pk, 'second', {'n': 2})
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+
+        response = client.get('/api/events/', {'token': token.key}, HTTP_LAST_EVENT_ID=str(after))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = b''.join(response.streaming_content).decode().split('\n\n')
+        self.assertEqual(frames[0], f'retry: {events.RECONNECT_MS}\nid: {after}')
+        self.assertEqual(frames[1], f'id: {after + 1}\nevent: second\ndata: {{"n":2}}')
+        self.assertEqual(frames[2:], [''])
+
+    def test_stream_requires_authentication(self):
+        self.assertEqual(APIClient().get('/api/events/', {'token': 'nope'}).status_code, 401)
+
+
+class BatchUploadTests(ApiTestCase):
+    def post_batch(self, files):
+        uploads = [SimpleUploadedFile(name, content, content_type='text/csv') for name, content in files]
+        response = self.client.post('/api/datasets/upload_batch/', {'files': uploads}, format='multipart')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return {line['filename']: line for line in lines}
+
+    def spill_files(self):
+        return {name for name in os.listdir(tempfile.gettempdir()) if name.startswith('ingest-')}
+
+    def batch(self, run):
+        # Names differ between runs, so no file is a repeat of an earlier one.
+        files = [
+            (f'plant-{i}.csv', csv_bytes(equipment_rows(30 + i, seed=i, prefix=f'{run}-{i}')))
+            for i in range(3)
+        ]
+        return files + [('broken.csv', b'Name,Kind\nx,y\n')]
+
+    def test_parallel_ingest_matches_sequential(self):
+        spilled = self.spill_files()
+
+        results = {}
+        for processes in (0, 2):
+            files = self.batch(f'run{processes}')
+            with self.subTest(processes=processes), self.settings(INGEST_PROCESSES=processes):
+                with self.captureOnCommitCallbacks(execute=True):
+                    results[processes] = self.post_batch(files)
+                self.assertIn('error', results[processes]['broken.csv'])
+                for i in range(3):
+                    dataset = results[processes][f'plant-{i}.csv']['dataset']
+                    self.assertEqual(dataset['total_equipment'], 30 + i)
+
+        for i in range(3):
+            sequential = EquipmentDataset.objects.get(pk=results[0][f'plant-{i}.csv']['dataset']['id'])
+            parallel = EquipmentDataset.objects.get(pk=results[2][f'plant-{i}.csv']['dataset']['id'])
+            self.assertIsNone(parallel.rows_source_id)
+            self.assertEqual(parallel.statistics.sketch, sequential.statistics.sketch)
+        self.assertEqual(self.spill_files(), spilled)
+
+
+class ReportJobTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dataset = EquipmentDataset.objects.get(pk=self.upload(csv_bytes(equipment_rows(30))).data['id'])
+
+    def generate_pdf(self):
+        return self.client.get(f'/api/datasets/{self.dataset.pk}/generate_pdf/')
+
+    def run_worker(self):
+        call_command('run_report_worker', once=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_report_is_queued_rendered_by_the_worker_then_served(self):
+        response = self.generate_pdf()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], ReportJob.PENDING)
+        job_url = response['Location']
+        self.assertEqual(self.client.get(job_url).data['status'], ReportJob.PENDING)
+        self.assertEqual(self.generate_pdf().data['id'], response.data['id'])
+
+        self.run_worker()
+
+        job = self.client.get(job_url).data
+        self.assertEqual(job['status'], ReportJob.DONE)
+        self.assertEqual(len(job['content_hash']), 64)
+        pdf = self.generate_pdf()
+        self.assertEqual(pdf.status_code, 200)
+        self.assertEqual(pdf['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(pdf.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    def test_new_dataset_version_gets_a_new_job(self):
+        first = self.generate_pdf().data['id']
+        self.run_worker()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/datasets/{self.dataset.pk}/delta/', {'delete': ['Unit-0']}, format='json')
+
+        response = self.generate_pdf()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.data['id'], first)
+
+    def test_failed_render_is_recorded(self):
+        job_id = self.generate_pdf().data['id']
+
+        with mock.patch.object(reports, 'render_stored_pdf', side_effect=RuntimeError('no fonts')):
+            self.run_worker()
+
+        job = self.client.get(f'/api/reports/{job_id}/').data
+        self.assertEqual((job['status'], job['error']), (ReportJob.FAILED, 'no fonts'))
+        self.assertEqual(self.client.get(f'/api/reports/{job_id}/download/').status_code, 409)
+
+    @override_settings(REPORT_JOBS_EAGER=True)
+    def test_eager_mode_renders_in_the_request(self):
+        response = self.generate_pdf()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ReportJob.objects.get().status, ReportJob.DONE)
+
+    def test_concurrent_submission_returns_the_job_created_first(self):
+        first = reports.submit_report(self.dataset)
+
+        # As if another request created ``first`` after this one looked.
+        with mock.patch.object(reports, '_live_job', side_effect=[None, first]):
+            second = reports.submit_report(self.dataset)
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    def test_failed_job_can_be_submitted_again(self):
+        first = reports.submit_report(self.dataset)
+        ReportJob.objects.filter(pk=first.pk).update(status=ReportJob.FAILED)
+
+        second = reports.submit_report(self.dataset)
+
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(second.status, ReportJob.PENDING)
+
+
+@unittest.skipIf(pypdf is None, 'pypdf is not installed')
+class ReportEngineTests(SimpleTestCase):
+    def setUp(self):
+        rows = equipment_rows(400)
+        self.columns = [np.array([row[i] for row in rows]) for i in range(len(HEADER))]
+        self.layout = report_engine.get_layout()
+
+    def render(self, processes):
+        front = [Paragraph('Equipment report', self.layout.styles['Title'])]
+        output = io.BytesIO()
+        report_engine.render_report(front, self.columns, 'plant.csv', output, processes)
+        return pypdf.PdfReader(io.BytesIO(output.getvalue()))
+
+    @override_settings(REPORT_PAGES_PER_TASK=3)
+    def test_parallel_pages_merge_into_the_sequential_report(self):
+        sequential = self.render(processes=0)
+        with mock.patch.object(report_engine, 'merge_pdfs', wraps=report_engine.merge_pdfs) as merge:
+            parallel = self.render(processes=2)
+
+        merge.assert_called_once()
+        # Front matter, then one part per three table pages.
+        table_pages = len(report_engine.page_ranges(400, self.layout.rows_per_page))
+        self.assertEqual(len(merge.call_args.args[0]), 1 + -(-table_pages // 3))
+        self.assertEqual(len(parallel.pages), len(sequential.pages))
+        for page, (expected, merged) in enumerate(zip(sequential.pages, parallel.pages)):
+            self.assertEqual(merged.extract_text(), expected.extract_text(), page)
+
+    def test_table_pages_cover_every_row_once(self):
+        lines = [line for page in self.render(processes=0).pages for line in page.extract_text().splitlines()]
+
+        names = [line for line in lines if line.startswith('Unit-')]
+        self.assertEqual(names, list(self.columns[0]))
+
+    def test_chart_drawing_survives_the_cache(self):
+        drawing = report_engine.chart_drawing(['Pump', 'Valve'], [3, 5], PARAMETERS, [10.0, 2.0, 300.0])
+
+        restored = pickle.loads(pickle.dumps(drawing))
+
+        self.assertEqual(len(restored.contents), len(drawing.contents))
+        self.assertFalse(any(isinstance(node, UserNode) for node in restored.getContents()))
+
+
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = equipment_rows(45)
+        self.dataset_id = self.upload(csv_bytes(self.rows)).data['id']
+        self.expected = pd.DataFrame(self.rows, columns=HEADER)
+
+    def export(self, file_format):
+        response = self.client.get(f'/api/datasets/{self.dataset_id}/export/{file_format}/')
+        if response.status_code != 200:
+            return response, None
+        self.assertTrue(response.streaming)
+        return response, list(response.streaming_content)
+
+    @override_settings(EXPORT_CHUNK_ROWS=20)
+    def test_csv_export_streams_the_rows_in_upload_format(self):
+        variants = {
+            'column store': {'COLUMN_STORE_ENABLED': True},
+            'database': {'COLUMN_STORE_ENABLED': False},
+        }
+        for name, options in variants.items():
+            with self.subTest(name), self.settings(**options):
+                response, chunks = self.export('csv')
+
+                self.assertEqual(response['Content-Type'], 'text/csv')
+                self.assertEqual(response['Content-Disposition'], 'attachment; filename="plant.csv"')
+                self.assertGreaterEqual(len(chunks), 3)
+                pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(b''.join(chunks))), self.expected)
+
+    def test_csv_export_without_pyarrow(self):
+        with mock.patch.object(exports, 'pyarrow', None):
+            _, chunks = self.export('csv')
+
+        pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(b''.join(chunks))), self.expected)
+
+    def test_exported_csv_uploads_as_the_same_rows(self):
+        _, chunks = self.export('csv')
+
+        response = self.upload(b''.join(chunks), 'export.csv')
+
+        self.assertEqual(response.data['rows_source'], self.dataset_id)
+
+    @unittest.skipIf(exports.pyarrow is None, 'pyarrow is not installed')
+    @override_settings(EXPORT_CHUNK_ROWS=20)
+    def test_parquet_export_has_a_row_group_per_batch(self):
+        response, chunks = self.export('parquet')
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        parquet = exports.pyarrow.parquet.ParquetFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(parquet.num_row_groups, 3)
+        frame = parquet.read().to_pandas().astype({'Type': str})
+        pd.testing.assert_frame_equal(frame, self.expected, check_dtype=False)
+
+    def test_unknown_format_is_rejected(self):
+        response, _ = self.export('xlsx')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Export format must be one of: csv, parquet')
+
+    def test_parquet_without_pyarrow_is_rejected(self):
+        with mock.patch.object(exports, 'pyarrow', None):
+            response, _ = self.export('parquet')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class AggregationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = equipment_rows(40, seed=1, prefix='A')
+        self.second = equipment_rows(30, seed=2, prefix='B')
+        self.first_id = self.upload(csv_bytes(self.first), 'first.csv').data['id']
+        self.second_id = self.upload(csv_bytes(self.second), 'second.csv').data['id']
+
+    def aggregate(self, **params):
+        return self.client.get('/api/datasets/aggregate/', params)
+
+    def test_groups_by_type_across_datasets(self):
+        frame = pd.DataFrame(self.first + self.second, columns=HEADER)
+
+        body = self.aggregate(group_by='type').data
+
+        self.assertFalse(body['truncated'])
+        self.assertEqual([row['key'] for row in body['results']], sorted(TYPES))
+        for row in body['results']:
+            group = frame[frame['Type'] == row['key']]
+            self.assertEqual((row['count'], row['datasets'], row['bucket']), (len(group), 2, None))
+            for name in PARAMETERS:
+                values = row['parameters'][name]
+                self.assertAlmostEqual(values['mean'], group[name].mean())
+                self.assertAlmostEqual(values['std'], group[name].std(ddof=0))
+                self.assertEqual((values['min'], values['max']), (group[name].min(), group[name].max()))
+
+    def test_keys_and_datasets_filter_the_rows(self):
+        body = self.aggregate(group_by='name', keys='A-1,A-2,B-1', datasets=str(self.first_id)).data
+
+        self.assertEqual([(row['key'], row['count']) for row in body['results']], [('A-1', 1), ('A-2', 1)])
+
+    def test_shared_rows_are_counted_once(self):
+        self.upload(csv_bytes(self.first), 'again.csv')
+
+        body = self.aggregate(group_by='type').data
+
+        self.assertEqual(sum(row['count'] for row in body['results']), 70)
+        self.assertEqual({row['datasets'] for row in body['results']}, {2})
+
+    def test_buckets_and_date_range_follow_the_upload_date(self):
+        EquipmentDataset.objects.filter(pk=self.first_id).update(
+            upload_date=timezone.make_aware(datetime(2026, 1, 15, 12))
+        )
+        EquipmentDataset.objects.filter(pk=self.second_id).update(
+            upload_date=timezone.make_aware(datetime(2026, 3, 2, 8))
+        )
+
+        body = self.aggregate(group_by='type', bucket='month', keys='Pump').data
+        self.assertEqual(
+            [(row['bucket'][:10], row['count']) for row in body['results']],
+            [('2026-01-01', 10), ('2026-03-01', 8)],
+        )
+
+        body = self.aggregate(group_by='type', keys='Pump', since='2026-02-01').data
+        self.assertEqual([row['count'] for row in body['results']], [8])
+
+    @override_settings(AGGREGATE_MAX_ROWS=3)
+    def test_results_are_capped(self):
+        body = self.aggregate(group_by='type').data
+
+        self.assertTrue(body['truncated'])
+        self.assertEqual(len(body['results']), 3)
+
+    def test_other_users_rows_are_excluded(self):
+        other = User.objects.create_user('bob')
+        client = APIClient()
+        client.force_authenticate(other)
+
+        self.assertEqual(client.get('/api/datasets/aggregate/').data['results'], [])
+
+    def test_invalid_parameters_are_rejected(self):
+        cases = {
+            'group_by': ('owner', 'group_by must be one of: name, type'),
+            'bucket': ('hour', 'bucket must be one of: day, week, month, quarter, year'),
+            'datasets': ('1,x', 'datasets must be a comma-separated list of ids'),
+            'since': ('yesterday', 'since must be an ISO 8601 date or datetime'),
+        }
+        for name, (value, error) in cases.items():
+            with self.subTest(name):
+                response = self.aggregate(**{name: value})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], error)
+
+
+def reference_lttb(x, y, threshold):
+    """Textbook Largest-Triangle-Three-Buckets, one point at a time."""
+    n = len(y)
+    every = (n - 2) / (threshold - 2)
+    selected, a = [0], 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        areas = [
+            abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) for j in range(start, end)
+        ]
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    return selected + [n - 1]
+
+
+class DownsamplingTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.x = np.sort(rng.uniform(0, 100, 5000))
+        self.y = np.cumsum(rng.normal(0, 1, 5000))
+
+    def test_lttb_matches_the_reference_algorithm(self):
+        for threshold in (3, 10, 257, 1000):
+            with self.subTest(threshold=threshold):
+                self.assertEqual(charts.lttb(self.x, self.y, threshold).tolist(),
+                                 reference_lttb(self.x, self.y, threshold))
+
+    def test_lttb_keeps_an_isolated_spike(self):
+        y = np.zeros(1000)
+        y[637] = 50.0
+
+        selected = charts.lttb(np.arange(1000.0), y, 20)
+
+        self.assertIn(637, selected)
+        self.assertEqual((selected[0], selected[-1], len(selected)), (0, 999, 20))
+
+    def test_minmax_keeps_every_bucket_extreme(self):
+        points = 102
+        selected = charts.minmax(self.y, points)
+
+        self.assertLessEqual(len(selected), points)
+        self.assertEqual(selected.tolist(), sorted(set(selected.tolist())))
+        self.assertTrue({0, 4999, int(self.y.argmin()), int(self.y.argmax())} <= set(selected.tolist()))
+        for bucket in np.array_split(np.arange(5000), 50):
+            values = self.y[bucket]
+            self.assertIn(bucket[values.argmin()], selected)
+            self.assertIn(bucket[values.argmax()], selected)
+
+    def test_short_series_are_returned_whole(self):
+        self.assertEqual(charts.lttb(self.x[:10], self.y[:10], 50).tolist(), list(range(10)))
+        self.assertEqual(charts.minmax(self.y[:10], 50).tolist(), list(range(10)))
+
+
+class ChartDataTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = equipment_rows(400)
+        self.frame = pd.DataFrame(self.rows, columns=HEADER)
+        self.dataset_id = self.upload(csv_bytes(self.rows)).data['id']
+
+    def chart(self, **params):
+        return self.client.get(f'/api/datasets/{self.dataset_id}/chart_data/', params)
+
+    def test_types_chart_comes_from_the_statistics(self):
+        body = self.chart(chart='types').data
+
+        counts = dict(zip(body['labels'], body['counts']))
+        self.assertEqual(counts, self.frame['Type'].value_counts().to_dict())
+        self.assertAlmostEqual(body['overall']['Pressure'], self.frame['Pressure'].mean())
+
+    def test_histogram_counts_every_row_of_the_type(self):
+        body = self.chart(chart='histogram', field='Flowrate', bins=12, type='Valve').data
+
+        valves = self.frame.loc[self.frame['Type'] == 'Valve', 'Flowrate']
+        expected, edges = np.histogram(valves, bins=12)
+        self.assertEqual((body['total'], body['counts']), (len(valves), expected.tolist()))
+        self.assertEqual(len(body['edges']), 13)
+
+    def test_line_chart_is_downsampled_in_row_order(self):
+        body = self.chart(chart='line', y='Temperature', points=50).data
+
+        self.assertEqual((body['total'], body['method'], len(body['y'])), (400, 'lttb', 50))
+        indices = [int(x) for x in body['x']]
+        self.assertEqual(indices, sorted(indices))
+        self.assertEqual(body['y'], self.frame['Temperature'].to_numpy()[indices].tolist())
+
+    def test_scatter_chart_is_ordered_by_x(self):
+        body = self.chart(chart='scatter', x='Pressure', y='Flowrate', points=40).data
+
+        self.assertEqual(body['method'], 'minmax')
+        self.assertLessEqual(len(body['x']), 40)
+        self.assertEqual(body['x'], sorted(body['x']))
+        pairs = set(zip(self.frame['Pressure'], self.frame['Flowrate']))
+        self.assertTrue(set(zip(body['x'], body['y'])) <= pairs)
+
+    def test_invalid_queries_are_rejected(self):
+        cases = [
+            ({'chart': 'pie'}, 'chart must be one of: types, histogram, line, scatter'),
+            ({'chart': 'histogram'}, 'field is required'),
+            ({'chart': 'line', 'y': 'Speed'}, 'y must be one of: Flowrate, Pressure, Temperature'),
+            ({'chart': 'line', 'y': 'Flowrate', 'points': '2'}, 'points must be at least 3'),
+            ({'chart': 'line', 'y': 'Flowrate', 'method': 'mean'}, 'method must be one of: lttb, minmax'),
+        ]
+        for params, error in cases:
+            with self.subTest(**params):
+                response = self.chart(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], error)
+
+
+class QueryPlanAuditTests(TestCase):
+    def audit(self):
+        stdout = io.StringIO()
+        call_command('audit_query_plans', rows=2000, datasets=4, users=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_every_audited_query_uses_an_index(self):
+        output = self.audit()
+
+        self.assertIn('All audited queries use an index', output)
+        self.assertNotIn('FULL SCAN', output)
+        # The seed data is rolled back.
+        self.assertFalse(User.objects.filter(username__startswith='query-plan-audit').exists())
+        self.assertFalse(EquipmentDataset.objects.exists())
+
+    def test_query_without_an_index_fails_the_audit(self):
+        audited = audit_query_plans.audited_queries
+
+        def queries(user, dataset):
+            return [*audited(user, dataset), ('unindexed', Equipment.objects.filter(flowrate__gt=100))]
+
+        with mock.patch.object(audit_query_plans, 'audited_queries', side_effect=queries):
+            with self.assertRaisesMessage(CommandError, '1 queries fall back to a full table scan'):
+                self.audit()
+
+    def test_full_scan_patterns(self):
+        sqlite = audit_query_plans.FULL_SCAN_PATTERNS['sqlite']
+        self.assertEqual(sqlite.search('SCAN api_equipment').group('table'), 'api_equipment')
+        self.assertIsNone(sqlite.search('SCAN api_equipment USING INDEX equipment_dataset_idx'))
+        self.assertIsNone(sqlite.search('SCAN api_equipment USING COVERING INDEX equipment_type_idx'))
+        self.assertIsNone(sqlite.search('SEARCH api_equipment USING INDEX equipment_dataset_idx (dataset_id=?)'))
+        postgresql = audit_query_plans.FULL_SCAN_PATTERNS['postgresql']
+        self.assertEqual(postgresql.search('Seq Scan on api_reportjob').group('table'), 'api_reportjob')
+        self.assertIsNone(postgresql.search('Index Scan using reportjob_input_key on api_reportjob'))
+
+
+class AdminTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = User.objects.create_superuser('root', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        self.admin_client = Client()
+        self.admin_client.force_login(self.staff)
+
+    def changelist(self, query=''):
+        response = self.admin_client.get(f'/admin/api/equipment/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_keyset_pages_cover_every_row_once_newest_first(self):
+        self.upload(csv_bytes(equipment_rows(7)))
+        seen, query = [], ''
+        with mock.patch.object(admin.EquipmentAdmin, 'list_per_page', 3):
+            while query is not None:
+                cl = self.changelist(query)
+                self.assertTrue(cl.keyset)
+                self.assertEqual(cl.first_page_url is None, query == '')
+                seen += [equipment.pk for equipment in cl.result_list]
+                query = cl.next_page_url
+
+        self.assertEqual(seen, list(Equipment.objects.order_by('-pk').values_list('pk', flat=True)))
+
+    def test_explicit_ordering_falls_back_to_page_numbers(self):
+        self.upload(csv_bytes(equipment_rows(7)))
+        with mock.patch.object(admin.EquipmentAdmin, 'list_per_page', 3):
+            cl = self.changelist('?o=1&after=999999')
+
+        self.assertFalse(cl.keyset)
+        self.assertIsNone(cl.next_page_url)
+        self.assertEqual(len(cl.result_list), 3)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.upload(csv_bytes(equipment_rows(3)))
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        self.upload(csv_bytes(equipment_rows(30, seed=1, prefix='More')), 'more.csv')
+        with CaptureQueriesContext(connection) as many:
+            self.changelist()
+
+        self.assertEqual(len(many), len(few))
+
+    def test_paginator_counts_exactly_up_to_the_limit(self):
+        self.upload(csv_bytes(equipment_rows(7)))
+        paginator = admin.EstimatedCountPaginator(Equipment.objects.order_by('-pk'), 3)
+        paginator.exact_limit = 10
+
+        self.assertEqual(paginator.count, 7)
+        self.assertFalse(paginator.is_estimate)
+        self.assertFalse(paginator.is_lower_bound)
+
+    def test_paginator_without_an_estimate_reports_a_lower_bound(self):
+        self.upload(csv_bytes(equipment_rows(7)))
+        paginator = admin.EstimatedCountPaginator(Equipment.objects.filter(flowrate__gt=0).order_by('-pk'), 3)
+        paginator.exact_limit = 5
+
+        self.assertEqual(paginator.count, 6)
+        self.assertTrue(paginator.is_lower_bound)
+        self.assertFalse(paginator.is_estimate)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'reads sqlite_stat1')
+    def test_paginator_uses_the_analyzed_row_count_beyond_the_limit(self):
+        self.upload(csv_bytes(equipment_rows(7)))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = admin.EstimatedCountPaginator(Equipment.objects.order_by('-pk'), 3)
+        paginator.exact_limit = 5
+
+        self.assertEqual(paginator.count, 7)
+        self.assertTrue(paginator.is_estimate)
+
+    def test_dataset_filter_lists_recent_datasets_and_the_selected_one(self):
+        for i in range(3):
+            self.upload(csv_bytes(equipment_rows(2, seed=i, prefix=f'Set{i}')), f'set{i}.csv')
+        oldest, *recent = EquipmentDataset.objects.order_by('upload_date')
+        with mock.patch.object(admin.RecentDatasetFilter, 'limit', 2):
+            unfiltered = self.changelist()
+            filtered = self.changelist(f'?dataset={oldest.pk}')
+
+        def choices(cl):
+            spec, = [spec for spec in cl.filter_specs if isinstance(spec, admin.RecentDatasetFilter)]
+            return {int(pk) for pk, _ in spec.lookup_choices}
+
+        self.assertEqual(choices(unfiltered), {dataset.pk for dataset in recent})
+        self.assertEqual(choices(filtered), {dataset.pk for dataset in [oldest, *recent]})
+        self.assertEqual({equipment.dataset_id for equipment in filtered.result_list}, {oldest.pk})
+
+    def test_dataset_changelist_links_to_its_rows(self):
+        dataset_id = self.upload(csv_bytes(equipment_rows(2))).data['id']
+        response = self.admin_client.get('/admin/api/equipmentdataset/')
+
+        self.assertContains(response, f'href="/admin/api/equipment/?dataset={dataset_id}">View rows</a>')
+
+    def test_dataset_autocomplete(self):
+        dataset_id = self.upload(csv_bytes(equipment_rows(2))).data['id']
+        response = self.admin_client.get('/admin/autocomplete/', {
+            'app_label': 'api', 'model_name': 'equipment', 'field_name': 'dataset', 'term': 'plant',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [str(dataset_id)])
@@ -0,0 +1,344 @@
+"""
+Chunked, resumable CSV uploads.
+
+A client opens an ``UploadSession`` with the file's name and size, then
+PUTs numbered parts (1-based, ``part_size`` bytes each except the last)
+with their SHA-256 in the ``X-Content-SHA256`` header. Parts are written to
+``MEDIA_ROOT/uploads/<session>/`` and may be sent in parallel, retried or
+resent after an interruption. Completing the session queues it; an
+upload worker (``manage.py run_upload_worker``) then streams the parts, in
+order, into the regular CSV ingestion and deletes them, so no request waits
+on a multi-gigabyte ingest. ``upload_finished`` is sent with the session
+once it is complete or has failed.
+"""
+import hashlib
+import io
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+import django.dispatch
+from django.conf import settings
+from django.db import IntegrityError, connections, router
+from django.utils import timezone
+
+from . import dedup
+from .ingestion import IngestionError, ingest_csv
+from .models import UploadPart, UploadSession
+from .validation import read_header
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+READ_BLOCK = 256 * 1024
+DEFAULT_INGEST_TIMEOUT = 60 * 60
+
+# Sent with ``session`` once a queued upload has been ingested or has failed.
+upload_finished = django.dispatch.Signal()
+
+
+class UploadError(ValueError):
+    """Raised when an upload request cannot be honoured."""
+
+
+def upload_dir(session):
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', str(session.pk))
+
+
+def part_path(session, number):
+    return os.path.join(upload_dir(session), f'{number:06d}.part')
+
+
+def create_session(user, filename, size, part_size=None):
+    if not filename or not filename.lower().endswith('.csv'):
+        raise UploadError('Only CSV files are supported')
+    try:
+        size = int(size)
+        part_size = int(part_size or getattr(settings, 'UPLOAD_PART_SIZE', DEFAULT_PART_SIZE))
+    except (TypeError, ValueError):
+        raise UploadError('size and part_size must be integers')
+    if size < 1:
+        raise UploadError('The file is empty')
+    if size > getattr(settings, 'MAX_CHUNKED_UPLOAD_SIZE', DEFAULT_MAX_SIZE):
+        raise UploadError('File too large')
+    part_size = min(max(part_size, 1), getattr(settings, 'UPLOAD_MAX_PART_SIZE', MAX_PART_SIZE))
+
+    return UploadSession.objects.create(
+        user=user, filename=os.path.basename(filename), size=size, part_size=part_size
+    )
+
+
+def write_part(session, number, stream, sha256):
+    """
+    Store part ``number`` read from ``stream`` and verify it against ``sha256``.
+
+    The part is written to a temporary file and moved into place only once
+    its size and checksum match, so a failed or repeated PUT never leaves a
+    corrupt part behind.
+    """
+    if session.status != UploadSession.OPEN:
+        raise UploadError(f'Upload is {session.status}')
+    if not 1 <= number <= session.part_count:
+        raise UploadError(f'Part number must be between 1 and {session.part_count}')
+    if not sha256:
+        raise UploadError('Missing X-Content-SHA256 header')
+
+    expected_size = session.expected_part_size(number)
+    os.makedirs(upload_dir(session), exist_ok=True)
+    path = part_path(session, number)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, 'wb') as f:
+            while True:
+                block = stream.read(min(READ_BLOCK, expected_size + 1 - size))
+                if not block:
+                    break
+                size += len(block)
+                if size > expected_size:
+                    raise UploadError(f'Part {number} must be {expected_size} bytes')
+                digest.update(block)
+                f.write(block)
+        if size != expected_size:
+            raise UploadError(f'Part {number} must be {expected_size} bytes, got {size}')
+        if digest.hexdigest() != sha256.lower():
+            raise UploadError(f'Checksum mismatch for part {number}')
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    # Single-statement writes rather than update_or_create, whose read-then-write
+    # transaction SQLite fails at once, without waiting, while another upload
+    # holds the write lock.
+    fields = {'size': size, 'sha256': digest.hexdigest()}
+    parts = UploadPart.objects.filter(session=session, number=number)
+    if not parts.update(**fields):
+        try:
+            UploadPart.objects.create(session=session, number=number, **fields)
+        except IntegrityError:
+            # A concurrent retry of the same part won the insert; its file is identical.
+            pass
+    session.save(update_fields=['updated_at'])
+    return parts.get()
+
+
+def missing_parts(session):
+    received = set(session.parts.values_list('number', flat=True))
+    return [number for number in range(1, session.part_count + 1) if number not in received]
+
+
+class PartsReader(io.RawIOBase):
+    """Read-only stream over a session's part files in order."""
+
+    def __init__(self, session):
+        self._paths = [part_path(session, number) for number in range(1, session.part_count + 1)]
+        self._file = None
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        while True:
+            if self._file is None:
+                if not self._paths:
+                    return 0
+                self._file = open(self._paths.pop(0), 'rb')
+            count = self._file.readinto(buffer)
+            if count:
+                self._position += count
+                return count
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def complete_session(session, progress=None):
+    """
+    Queue a fully uploaded session for ingestion and return it.
+
+    Only one request can move a session from open to queued, so a repeated
+    ``complete`` call cannot ingest the file twice. With
+    ``UPLOAD_INGEST_EAGER`` the session is ingested at once, in the calling
+    request, passing ``progress`` on to ``ingest_csv``.
+    """
+    if session.status != UploadSession.OPEN:
+        raise UploadError(f'Upload is {session.status}')
+    missing = missing_parts(session)
+    if missing:
+        shown = ', '.join(str(number) for number in missing[:20])
+        raise UploadError(f'Missing parts: {shown}{" ..." if len(missing) > 20 else ""}')
+
+    queued = UploadSession.objects.filter(pk=session.pk, status=UploadSession.OPEN).update(
+        status=UploadSession.QUEUED, error='', errors=[], updated_at=timezone.now()
+    )
+    session.refresh_from_db()
+    if not queued:
+        raise UploadError(f'Upload is {session.status}')
+
+    if getattr(settings, 'UPLOAD_INGEST_EAGER', False) and claim_session(session):
+        ingest_session(session, progress)
+    return session
+
+
+def claim_session(session):
+    """Atomically move ``session`` from queued to assembling; False if already taken."""
+    claimed = UploadSession.objects.filter(pk=session.pk, status=UploadSession.QUEUED).update(
+        status=UploadSession.ASSEMBLING, updated_at=timezone.now()
+    )
+    if claimed:
+        session.refresh_from_db()
+    return bool(claimed)
+
+
+class Heartbeat:
+    """
+    Keeps a claimed session's ``updated_at`` fresh while it is ingested, so
+    ``claim_next_session`` requeues it only once its worker stops making
+    progress. Called as a ``progress`` callback, it beats and then passes
+    the call on to ``progress``.
+
+    Inside the ingest's transaction an update would stay hidden until the
+    commit, so it goes through a connection of its own; except on SQLite,
+    whose write lock keeps any other worker from requeueing the session
+    until that commit anyway.
+    """
+
+    def __init__(self, session, progress=None):
+        self.session = session
+        self.progress = progress
+        self.alias = router.db_for_write(UploadSession)
+        self._depth = len(connections[self.alias].atomic_blocks)
+        self._connection = None
+
+    def __call__(self, *args):
+        self.beat()
+        if self.progress is not None:
+            self.progress(*args)
+
+    def beat(self):
+        now = timezone.now()
+        connection = connections[self.alias]
+        if len(connection.atomic_blocks) <= self._depth:
+            UploadSession.objects.using(self.alias).filter(
+                pk=self.session.pk, status=UploadSession.ASSEMBLING
+            ).update(updated_at=now)
+        elif connection.vendor != 'sqlite':
+            self._execute(now)
+
+    def _execute(self, now):
+        if self._connection is None:
+            self._connection = connections.create_connection(self.alias)
+        connection = self._connection
+        quote = connection.ops.quote_name
+        fields = {name: UploadSession._meta.get_field(name) for name in ('id', 'status', 'updated_at')}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote(UploadSession._meta.db_table)} SET {quote(fields["updated_at"].column)} = %s '
+                f'WHERE {quote(fields["id"].column)} = %s AND {quote(fields["status"].column)} = %s',
+                [
+                    fields['updated_at'].get_db_prep_value(now, connection),
+                    fields['id'].get_db_prep_value(self.session.pk, connection),
+                    UploadSession.ASSEMBLING,
+                ],
+            )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def claim_next_session():
+    """
+    Claim the oldest queued session, requeueing sessions orphaned by a dead
+    worker: those with no ``Heartbeat`` for ``UPLOAD_INGEST_TIMEOUT`` seconds.
+    """
+    timeout = getattr(settings, 'UPLOAD_INGEST_TIMEOUT', DEFAULT_INGEST_TIMEOUT)
+    UploadSession.objects.filter(
+        status=UploadSession.ASSEMBLING, updated_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=UploadSession.QUEUED)
+
+    for session in UploadSession.objects.filter(status=UploadSession.QUEUED).order_by('updated_at')[:10]:
+        if claim_session(session):
+            return session
+    return None
+
+
+def ingest_session(session, progress=None):
+    """
+    Ingest a claimed session into a new dataset and return it. A file that
+    cannot be ingested fails the session (``IngestionError`` is re-raised);
+    any other error reopens it, so the client can ``complete`` it again.
+    """
+    heartbeat = Heartbeat(session, progress)
+    try:
+        with PartsReader(session) as parts:
+            read_header(parts)
+        with PartsReader(session) as parts:
+            content_hash = dedup.content_hash(parts)
+        heartbeat.beat()
+        with io.BufferedReader(PartsReader(session), buffer_size=READ_BLOCK) as stream:
+            dataset = ingest_csv(
+                stream, session.user, session.filename, content_hash=content_hash, progress=heartbeat,
+            )
+    except IngestionError as e:
+        session.status = UploadSession.FAILED
+        session.error = str(e)
+        session.errors = e.errors
+        session.save(update_fields=['status', 'error', 'errors', 'updated_at'])
+        discard_parts(session)
+        upload_finished.send(sender=UploadSession, session=session)
+        raise
+    except Exception as e:
+        # Not the file's fault: reopen so the client can retry ``complete``.
+        session.status = UploadSession.OPEN
+        session.error = f'Ingestion was interrupted: {e}'
+        session.save(update_fields=['status', 'error', 'updated_at'])
+        upload_finished.send(sender=UploadSession, session=session)
+        raise
+    finally:
+        heartbeat.close()
+
+    session.status = UploadSession.COMPLETE
+    session.dataset = dataset
+    session.save(update_fields=['status', 'dataset', 'updated_at'])
+    discard_parts(session)
+    upload_finished.send(sender=UploadSession, session=session)
+    return dataset
+
+
+def discard_parts(session):
+    shutil.rmtree(upload_dir(session), ignore_errors=True)
+    session.parts.all().delete()
+
+
+def purge_stale_sessions(max_age):
+    """Delete unfinished sessions (and their parts) idle for longer than ``max_age``."""
+    stale = UploadSession.objects.filter(
+        status__in=[UploadSession.OPEN, UploadSession.FAILED],
+        updated_at__lt=timezone.now() - max_age,
+    )
+    count = 0
+    for session in stale:
+        discard_parts(session)
+        session.delete()
+        count += 1
+    return count
+
+
+def default_session_ttl():
+    return timedelta(hours=getattr(settings, 'UPLOAD_SESSION_TTL_HOURS', 24))
@@ -0,0 +1,17 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from . import views
+
+router = DefaultRouter()
+router.register(r'datasets', views.EquipmentDatasetViewSet, basename='dataset')
+router.register(r'reports', views.ReportJobViewSet, basename='report')
+router.register(r'uploads', views.UploadSessionViewSet, basename='upload')
+
+urlpatterns = [
+    path('auth/register/', views.register, name='register'),
+    path('auth/login/', views.login, name='login'),
+    path('cache/stats/', views.cache_stats, name='cache-stats'),
+    path('events/', views.event_stream, name='events'),
+    path('', include(router.urls)),
+]
@@ -0,0 +1,312 @@
+"""
+Schema validation for equipment CSV uploads.
+
+The header is checked on its own first (``read_header``), so a file
+without the required columns is rejected before a single row is parsed.
+Every chunk of rows is then validated in one vectorized pass before it is
+written (``ChunkValidator``):
+
+* columns get explicit dtypes: text names, categorical types and float64
+  parameters;
+* parameters given in another unit, for a whole column (``Pressure (psi)``)
+  or per value (``30 psi``), are converted to ``CANONICAL_UNITS``;
+* missing or non-numeric values, parameters outside
+  ``CSV_PARAMETER_RANGES`` and repeated equipment names are rejected.
+
+Rejected rows are dropped and counted in a ``ValidationReport``, which
+keeps the first ``CSV_MAX_ROW_ERRORS`` row-level errors.
+"""
+import csv
+import re
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+
+CANONICAL_UNITS = {'Flowrate': 'm3/h', 'Pressure': 'bar', 'Temperature': 'C'}
+
+# Unit (lower case, without spaces, degree signs or a "deg" prefix) ->
+# (scale, offset) so that canonical = value * scale + offset.
+UNITS = {
+    'Flowrate': {
+        'm3/h': (1.0, 0.0), 'm3/hr': (1.0, 0.0), 'm3/s': (3600.0, 0.0), 'm3/min': (60.0, 0.0),
+        'l/s': (3.6, 0.0), 'l/min': (0.06, 0.0), 'l/h': (0.001, 0.0), 'gpm': (0.227124707, 0.0),
+    },
+    'Pressure': {
+        'bar': (1.0, 0.0), 'mbar': (0.001, 0.0), 'pa': (1e-5, 0.0), 'kpa': (0.01, 0.0),
+        'mpa': (10.0, 0.0), 'psi': (0.0689475729, 0.0), 'atm': (1.01325, 0.0),
+    },
+    'Temperature': {
+        'c': (1.0, 0.0), 'k': (1.0, -273.15), 'f': (5 / 9, -160 / 9),
+    },
+}
+
+# In canonical units; None leaves that side open.
+DEFAULT_PARAMETER_RANGES = {
+    'Flowrate': (0.0, None),
+    'Pressure': (0.0, None),
+    'Temperature': (-273.15, None),
+}
+DEFAULT_MAX_ROW_ERRORS = 50
+MAX_HEADER_BYTES = 64 * 1024
+
+HEADER_UNIT = re.compile(r'^(?P<name>.*?)\s*[(\[](?P<unit>[^)\]]*)[)\]]$')
+VALUE_UNIT = r'^\s*(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?P<unit>[^\d\s].*?)?\s*$'
+
+
+class IngestionError(ValueError):
+    """Raised when an uploaded CSV cannot be ingested; ``errors`` lists row-level problems."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+    def __reduce__(self):
+        # Keep ``errors`` when raised in an ingestion pool worker.
+        return type(self), (str(self), self.errors)
+
+
+def parameter_ranges():
+    return getattr(settings, 'CSV_PARAMETER_RANGES', DEFAULT_PARAMETER_RANGES)
+
+
+def max_row_errors():
+    return getattr(settings, 'CSV_MAX_ROW_ERRORS', DEFAULT_MAX_ROW_ERRORS)
+
+
+def _unit_key(unit):
+    key = unit.strip().lower().replace('°', '').replace('³', '3').replace(' ', '')
+    return key.removeprefix('deg')
+
+
+def _column_name(raw):
+    """The required column and unit a header cell names, e.g. ``('Pressure', 'psi')``."""
+    name = str(raw).strip()
+    match = HEADER_UNIT.match(name)
+    if match and match['name'] in NUMERIC_COLUMNS:
+        return match['name'], match['unit']
+    return name, None
+
+
+def is_required_column(raw):
+    return _column_name(raw)[0] in REQUIRED_COLUMNS
+
+
+class Header:
+    """Which raw column holds each required one, and the unit of each parameter column."""
+
+    def __init__(self, names):
+        self.columns = {}
+        self.units = {}
+        for raw in names:
+            name, unit = _column_name(raw)
+            if name not in REQUIRED_COLUMNS:
+                continue
+            if name in self.columns:
+                raise IngestionError(f'Column {name} appears more than once')
+            self.columns[name] = raw
+            if unit is not None:
+                conversion = UNITS[name].get(_unit_key(unit))
+                if conversion is None:
+                    raise IngestionError(
+                        f'Unknown unit "{unit}" for {name}; use one of: {", ".join(UNITS[name])}'
+                    )
+                self.units[name] = conversion
+
+        missing = [c for c in REQUIRED_COLUMNS if c not in self.columns]
+        if missing:
+            raise IngestionError(f'Missing required columns: {", ".join(missing)}')
+
+
+def read_header(stream):
+    """Check the header at the start of binary ``stream``, reading nothing past it."""
+    for _ in range(100):
+        line = stream.readline(MAX_HEADER_BYTES)
+        if not line or line.strip():
+            break
+    if not line.strip():
+        raise IngestionError('The uploaded file is empty')
+    try:
+        text = line.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise IngestionError('The uploaded file is not UTF-8 text')
+    return Header(next(csv.reader([text], skipinitialspace=True), []))
+
+
+class ValidationReport:
+    """Counts of read and rejected rows, and the first row-level errors."""
+
+    def __init__(self, max_errors=None):
+        self.max_errors = max_row_errors() if max_errors is None else max_errors
+        self.rows = 0
+        self.rejected = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add(self, rows, mask, column, message, values):
+        """
+        Record ``message`` for the ``rows`` (1-based numbers) selected by
+        ``mask``, showing the offending entries of the Series ``values``.
+        """
+        count = int(np.count_nonzero(mask))
+        if not count:
+            return
+        self.error_count += count
+        room = self.max_errors - len(self.errors)
+        if room <= 0:
+            return
+        positions = np.flatnonzero(mask)[:room]
+        for row, value in zip(rows[positions].tolist(), values.iloc[positions].tolist()):
+            self.errors.append({
+                'row': row,
+                'column': column,
+                'value': None if pd.isna(value) else str(value),
+                'message': message,
+            })
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'truncated': self.error_count > len(self.errors),
+        }
+
+
+class ChunkValidator:
+    """
+    Validates the chunks of one file in order, so row numbers and repeated
+    names carry over from one chunk to the next.
+    """
+
+    def __init__(self, header, report):
+        self.header = header
+        self.report = report
+        self._rows = 0
+        # 64-bit hashes of the names seen so far, not the names themselves.
+        self._names = set()
+
+    def validate(self, chunk):
+        """The valid rows of ``chunk`` with just ``REQUIRED_COLUMNS``, in canonical units."""
+        size = len(chunk)
+        rows = np.arange(self._rows + 1, self._rows + size + 1)
+        self._rows += size
+        report = self.report
+        invalid = np.zeros(size, dtype=bool)
+
+        raw_names = chunk[self.header.columns['Equipment Name']]
+        names = raw_names.astype('str').str.strip()
+        missing = (raw_names.isna() | (names == '')).to_numpy()
+        report.add(rows, missing, 'Equipment Name', 'missing value', raw_names)
+        invalid |= missing
+
+        types = _strip_categories(chunk[self.header.columns['Type']])
+        missing = (types.isna() | (types == '')).to_numpy()
+        report.add(rows, missing, 'Type', 'missing value', types)
+        invalid |= missing
+
+        parameters = {}
+        for name in NUMERIC_COLUMNS:
+            parameters[name] = self._parameter(chunk[self.header.columns[name]], name, rows, invalid)
+
+        candidates = np.flatnonzero(~invalid)
+        keys = pd.util.hash_array(names.to_numpy(dtype=object)[candidates], categorize=False)
+        seen = self._names
+        repeated = pd.Series(keys).duplicated().to_numpy()
+        if seen:
+            repeated = repeated | np.fromiter((key in seen for key in keys.tolist()), dtype=bool, count=len(keys))
+        seen.update(keys.tolist())
+        duplicate = np.zeros(size, dtype=bool)
+        duplicate[candidates[repeated]] = True
+        report.add(rows, duplicate, 'Equipment Name', 'duplicate equipment name', raw_names)
+        invalid |= duplicate
+
+        valid = ~invalid
+        report.rows += size
+        report.rejected += int(np.count_nonzero(invalid))
+        return pd.DataFrame({
+            'Equipment Name': names[valid].array,
+            'Type': _strip_categories(types[valid]).array,
+            **{name: values[valid] for name, values in parameters.items()},
+        })
+
+    def _parameter(self, column, name, rows, invalid):
+        """``column`` as float64 in the canonical unit; bad rows are marked in ``invalid``."""
+        report = self.report
+        scale, offset = self.header.units.get(name, (1.0, 0.0))
+        missing = column.isna().to_numpy()
+
+        if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+            values = column.to_numpy(dtype='float64', na_value=np.nan)
+            if (scale, offset) != (1.0, 0.0):
+                values = values * scale + offset
+            unparsed = np.zeros(len(column), dtype=bool)
+        else:
+            # Anything but plain numbers: split off per-value units.
+            parts = column.astype('str').str.extract(VALUE_UNIT)
+            numbers = pd.to_numeric(parts['number'], errors='coerce')
+            numbers = numbers.to_numpy(dtype='float64', na_value=np.nan)
+            units = (
+                parts['unit'].str.strip().str.lower()
+                .str.replace('°', '', regex=False).str.replace('³', '3', regex=False)
+                .str.replace(' ', '', regex=False).str.removeprefix('deg')
+            )
+            known = UNITS[name]
+            has_unit = units.notna().to_numpy()
+            row_scale = units.map({unit: conversion[0] for unit, conversion in known.items()})
+            row_offset = units.map({unit: conversion[1] for unit, conversion in known.items()})
+            row_scale = row_scale.to_numpy(dtype='float64', na_value=np.nan)
+            row_offset = row_offset.to_numpy(dtype='float64', na_value=np.nan)
+            unknown = has_unit & np.isnan(row_scale) & ~missing
+            report.add(rows, unknown, name, 'unknown unit', column)
+            values = np.where(has_unit, numbers * row_scale + row_offset, numbers * scale + offset)
+            unparsed = ~missing & ~unknown & np.isnan(numbers)
+            report.add(rows, unparsed, name, 'not a number', column)
+            unparsed |= unknown
+
+        report.add(rows, missing, name, 'missing value', column)
+        bad = missing | unparsed
+        with np.errstate(invalid='ignore'):
+            out_of_range = ~bad & ~np.isfinite(values)
+            low, high = parameter_ranges().get(name, (None, None))
+            if low is not None:
+                out_of_range |= ~bad & (values < low)
+            if high is not None:
+                out_of_range |= ~bad & (values > high)
+        report.add(rows, out_of_range, name, _range_message(name, low, high), column)
+        invalid |= bad | out_of_range
+        return values
+
+
+def _range_message(name, low, high):
+    unit = CANONICAL_UNITS[name]
+    if low is not None and high is not None:
+        return f'outside the allowed range {low:g} to {high:g} {unit}'
+    if low is not None:
+        return f'below the minimum of {low:g} {unit}'
+    if high is not None:
+        return f'above the maximum of {high:g} {unit}'
+    return 'not a finite number'
+
+
+def _strip_categories(column):
+    """
+    Strip ``Type`` values, keeping the column categorical for the statistics
+    kernel with categories in order of first appearance. Missing values stay
+    missing rather than becoming the string ``'nan'``.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        stripped = column.cat.categories.astype(str).str.strip()
+        if stripped.is_unique:
+            column = column.cat.rename_categories(stripped)
+        else:
+            column = column.astype(str).str.strip().where(column.notna()).astype('category')
+    else:
+        column = column.astype('str').str.strip().where(column.notna()).astype('category')
+    column = column.cat.remove_unused_categories()
+    order = pd.unique(column.cat.codes.to_numpy())
+    order = order[order >= 0]
+    return column.cat.reorder_categories(column.cat.categories[order])
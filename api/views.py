@@ -1,3 +1,487 @@
-from django.shortcuts import render
+import io
+import os
+from calendar import timegm
 
-# Create your views here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import mixins, status, viewsets
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import (
+    action, api_view, authentication_classes, permission_classes, renderer_classes,
+)
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+from . import cache, events
+from .authentication import QueryTokenAuthentication
+from .aggregation import AggregationQueryError, aggregate, parse_query
+from .batch_uploads import BatchUpload, BatchUploadError
+from .charts import ChartQueryError, chart_data, query_key
+from .charts import parse_query as parse_chart_query
+from .columnar import ColumnarQueryError, decode_cursor, fetch_columns, parse_fields, parse_limit
+from .deltas import apply_delta, parse_deletes, row_chunks
+from .exports import CONTENT_TYPES, ExportError, export_chunks
+from .ingestion import IngestionError, ingest_csv, iter_chunks
+from .models import EquipmentDataset, ReportJob, UploadSession
+from .renderers import COLUMNAR_RENDERERS, EventStreamRenderer
+from .reports import TEMPLATES, submit_report
+from .serializers import (
+    EquipmentDatasetListSerializer,
+    EquipmentDatasetSerializer,
+    ReportJobSerializer,
+    UploadSessionSerializer,
+    UserSerializer,
+)
+from .uploads import UploadError, complete_session, create_session, discard_parts, write_part
+from .validation import ValidationReport, read_header
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def register(request):
+    username = request.data.get('username')
+    password = request.data.get('password')
+    email = request.data.get('email', '')
+
+    if not username or not password:
+        return Response({'error': 'Username and password are required'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if User.objects.filter(username=username).exists():
+        return Response({'error': 'Username already exists'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    user = User.objects.create_user(username=username, password=password, email=email)
+    token, _ = Token.objects.get_or_create(user=user)
+    return Response({'token': token.key, 'user': UserSerializer(user).data},
+                    status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def login(request):
+    user = authenticate(username=request.data.get('username'),
+                        password=request.data.get('password'))
+
+    if user is None:
+        return Response({'error': 'Invalid credentials'},
+                        status=status.HTTP_401_UNAUTHORIZED)
+
+    token, _ = Token.objects.get_or_create(user=user)
+    return Response({'token': token.key, 'user': UserSerializer(user).data})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(cache.stats())
+
+
+@api_view(['GET'])
+@authentication_classes([QueryTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def event_stream(request):
+    """
+    Server-Sent Events for the user's uploads, datasets and reports (see
+    ``api.events``), resuming after the ``Last-Event-ID`` header or the
+    ``last_event_id`` parameter. ``EventSource`` clients, which cannot set
+    headers, authenticate with ``?token=``.
+    """
+    after = events.parse_event_id(
+        request.headers.get('Last-Event-ID', request.query_params.get('last_event_id'))
+    )
+    subscription = events.Subscription(request.user.pk, after)
+    # Under ASGI an async body waits between polls without holding a thread;
+    # Django would buffer a sync one there (and an async one under WSGI).
+    # Under WSGI the stream is short (see events.stream) so it frees the worker.
+    if isinstance(request._request, ASGIRequest):
+        body = events.astream(subscription)
+    else:
+        body = events.stream(subscription)
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class EquipmentDatasetViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = EquipmentDatasetSerializer
+
+    def get_queryset(self):
+        return EquipmentDataset.objects.filter(user=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'history'):
+            return EquipmentDatasetListSerializer
+        return EquipmentDatasetSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        dataset = self.get_object()
+        layout = 'columns' if request.query_params.get('layout') == 'columns' else 'rows'
+        variant = f'detail-{layout}'
+        return _conditional_response(
+            request, dataset, variant,
+            lambda: Response(cache.cached(
+                cache.dataset_key(dataset.pk, variant), 'detail',
+                lambda: self.get_serializer(dataset).data,
+            )),
+        )
+
+    @action(detail=False, methods=['post'])
+    def upload_csv(self, request):
+        upload = request.FILES.get('file')
+
+        if upload is None:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not upload.name.lower().endswith('.csv'):
+            return Response({'error': 'Only CSV files are supported'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if upload.size > settings.MAX_UPLOAD_SIZE:
+            return Response({'error': 'File too large'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            dataset = ingest_csv(
+                upload, request.user, upload.name, progress=events.ingest_progress(request.user.pk),
+            )
+        except IngestionError as e:
+            return Response(_error_body(e), status=status.HTTP_400_BAD_REQUEST)
+
+        # The summary only: the rows are read from the detail or ``columns``.
+        serializer = EquipmentDatasetListSerializer(dataset, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def upload_batch(self, request):
+        """
+        Ingest several CSV files (or zip archives of them) posted as ``files``.
+        The response is NDJSON with one line per CSV, written as each file is
+        ingested: ``{"filename", "dataset"}`` or ``{"filename", "error"}``,
+        with the first row-level ``errors`` of a file that had no valid rows.
+        """
+        try:
+            batch = BatchUpload(request.FILES.getlist('files'))
+        except BatchUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        results = batch.results(request.user, events.ingest_progress(request.user.pk))
+        return _batch_response(results, self.get_serializer_context())
+
+    @action(detail=True, methods=['post'])
+    def delta(self, request, pk=None):
+        """
+        Insert, update and delete rows by ``Equipment Name``: rows to upsert
+        come as a CSV ``file`` or a JSON ``upsert`` list of row objects, names
+        to remove as ``delete``. Responds with the updated dataset, the
+        ``inserted``/``updated``/``deleted`` counts and the ``not_found``
+        names to delete.
+        """
+        dataset = self.get_object()
+        upload = request.FILES.get('file')
+        report = ValidationReport()
+        try:
+            if hasattr(request.data, 'getlist'):
+                deletes = parse_deletes(request.data.getlist('delete'))
+            else:
+                deletes = parse_deletes(request.data.get('delete', []))
+            if upload is not None:
+                if upload.size > settings.MAX_UPLOAD_SIZE:
+                    return Response({'error': 'File too large'}, status=status.HTTP_400_BAD_REQUEST)
+                read_header(upload)
+                upload.seek(0)
+                chunks = iter_chunks(upload, report=report)
+            elif request.data.get('upsert') or deletes:
+                chunks = row_chunks(request.data.get('upsert', []), report)
+            else:
+                return Response({'error': 'Nothing to upsert or delete'}, status=status.HTTP_400_BAD_REQUEST)
+            dataset, summary = apply_delta(dataset, chunks, report, deletes)
+        except IngestionError as e:
+            return Response(_error_body(e), status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = EquipmentDatasetListSerializer(dataset, context=self.get_serializer_context())
+        return Response({'dataset': serializer.data, **summary})
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        data = cache.cached(
+            cache.history_key(request.user.pk), 'history',
+            lambda: self.get_serializer(self.get_queryset()[:5], many=True).data,
+        )
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def aggregate(self, request):
+        """
+        Aggregate Flowrate/Pressure/Temperature across all of the user's datasets.
+
+        Query parameters: ``group_by`` (``name`` or ``type``), ``bucket``
+        (``day``, ``week``, ``month``, ``quarter`` or ``year`` of the upload
+        date), ``keys`` (comma-separated names or types), ``datasets``
+        (comma-separated ids), ``since`` and ``until``.
+        """
+        try:
+            query = parse_query(request.query_params)
+        except AggregationQueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, truncated = aggregate(request.user, **query)
+        return Response({
+            'group_by': query['group_by'],
+            'bucket': query['bucket'],
+            'results': rows,
+            'truncated': truncated,
+        })
+
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, *COLUMNAR_RENDERERS])
+    def columns(self, request, pk=None):
+        """
+        Page through a dataset's rows as column arrays.
+
+        Query parameters: ``fields`` (comma-separated column names),
+        ``cursor`` (from the previous page's ``next_cursor``) and ``limit``.
+        Use ``?format=npz`` or ``?format=arrow`` for binary encodings. Every
+        format also carries the next cursor in the ``X-Next-Cursor`` header.
+        """
+        dataset = self.get_object()
+
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+            after = decode_cursor(request.query_params.get('cursor'))
+            limit = parse_limit(request.query_params.get('limit'))
+            columns, next_cursor = fetch_columns(dataset, fields, after, limit)
+        except ColumnarQueryError as e:
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        count = len(next(iter(columns.values()))) if columns else 0
+        response = Response({'columns': columns, 'count': count, 'next_cursor': next_cursor})
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+    @action(detail=True, methods=['get'])
+    def chart_data(self, request, pk=None):
+        """
+        Plot-ready data for one chart, pre-binned or downsampled on the server.
+
+        Query parameters: ``chart`` (``types``, ``histogram``, ``line`` or
+        ``scatter``), ``field`` and ``bins`` for histograms, ``y``, ``x``,
+        ``points`` and ``method`` (``lttb`` or ``minmax``) for series, and
+        ``type`` to restrict row-based charts to one equipment type.
+        """
+        dataset = self.get_object()
+        try:
+            query = parse_chart_query(request.query_params)
+        except ChartQueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        variant = f'chart-{query_key(query)}'
+        version = f'{dataset.updated_at.timestamp():.6f}'
+        return _conditional_response(
+            request, dataset, variant,
+            lambda: Response(cache.cached(
+                cache.dataset_key(dataset.pk, f'{variant}-{version}'), 'chart',
+                lambda: chart_data(dataset, **query),
+            )),
+        )
+
+    @action(detail=True, methods=['get'])
+    def generate_pdf(self, request, pk=None):
+        """
+        The dataset's standard PDF report. It is rendered by the report job
+        queue, never in the request: until the report for the current version
+        is ready this answers 202 with the job and its status URL (Location),
+        and once it is ready it streams the file.
+        """
+        dataset = self.get_object()
+        job = submit_report(dataset)
+        if job.status == ReportJob.DONE:
+            return _conditional_response(request, dataset, 'pdf', lambda: _pdf_response(dataset, job))
+
+        serializer = ReportJobSerializer(job, context=self.get_serializer_context())
+        response = Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('report-detail', args=[job.pk], request=request)
+        response['Retry-After'] = '1'
+        return response
+
+    @action(detail=True, methods=['get'], url_path=r'export/(?P<file_format>[a-z]+)')
+    def export(self, request, pk=None, file_format=None):
+        """Stream the dataset's rows as ``export/csv/`` or ``export/parquet/``."""
+        dataset = self.get_object()
+        try:
+            chunks = export_chunks(dataset, file_format)
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return _conditional_response(
+            request, dataset, f'export-{file_format}',
+            lambda: _export_response(dataset, file_format, chunks),
+        )
+
+    @action(detail=True, methods=['post'])
+    def reports(self, request, pk=None):
+        """
+        Queue a PDF report for this dataset and return the job.
+
+        Answers 202 while the job is pending or running and 200 when an
+        identical report (same dataset version and template) already exists.
+        """
+        dataset = self.get_object()
+        template = request.data.get('template', 'standard')
+        if template not in TEMPLATES:
+            return Response({'error': f'Unknown report template: {template}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        job = submit_report(dataset, template)
+        serializer = ReportJobSerializer(job, context=self.get_serializer_context())
+        code = status.HTTP_200_OK if job.status == ReportJob.DONE else status.HTTP_202_ACCEPTED
+        return Response(serializer.data, status=code)
+
+
+class ReportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = ReportJobSerializer
+
+    def get_queryset(self):
+        return ReportJob.objects.filter(user=self.request.user).select_related('dataset')
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ReportJob.DONE:
+            return Response({'error': f'Report is {job.status}'}, status=status.HTTP_409_CONFLICT)
+
+        response = FileResponse(
+            job.file.open('rb'), as_attachment=True,
+            filename=f'report_{job.dataset.filename}.pdf', content_type='application/pdf',
+        )
+        # Report files are content-addressed, so a job's bytes never change.
+        response['ETag'] = quote_etag(job.content_hash)
+        patch_cache_control(response, private=True, max_age=86400)
+        return response
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Chunked, resumable uploads: create a session, PUT its parts to
+    ``parts/<number>/`` with an ``X-Content-SHA256`` header, then POST
+    ``complete/`` to queue the file for ingestion. GET the session to see
+    which parts have arrived and, once completed, whether it has been
+    ingested (``status`` and ``dataset``).
+    """
+    serializer_class = UploadSessionSerializer
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).prefetch_related('parts')
+
+    def create(self, request, *args, **kwargs):
+        try:
+            session = create_session(
+                request.user, request.data.get('filename'),
+                request.data.get('size'), request.data.get('part_size'),
+            )
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<number>[0-9]+)')
+    def parts(self, request, pk=None, number=None):
+        session = self.get_object()
+        try:
+            part = write_part(
+                session, int(number), request.stream or io.BytesIO(),
+                request.headers.get('X-Content-SHA256'),
+            )
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'number': part.number, 'size': part.size, 'sha256': part.sha256})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """
+        Queue the session for ingestion: 202 with the session and its status
+        URL (Location). When uploads are ingested eagerly, 201 with the new
+        dataset's summary (as in the history list) instead.
+        """
+        session = self.get_object()
+        try:
+            session = complete_session(session, events.ingest_progress(request.user.pk, str(session.pk)))
+        except (UploadError, IngestionError) as e:
+            return Response(_error_body(e), status=status.HTTP_400_BAD_REQUEST)
+
+        if session.status == UploadSession.COMPLETE:
+            serializer = EquipmentDatasetListSerializer(session.dataset, context=self.get_serializer_context())
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        response = Response(self.get_serializer(session).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('upload-detail', args=[session.pk], request=request)
+        response['Retry-After'] = '1'
+        return response
+
+    def perform_destroy(self, instance):
+        discard_parts(instance)
+        instance.delete()
+
+
+def _conditional_response(request, dataset, variant, build_response):
+    """
+    Answer with 304 when the client's ETag/Last-Modified still matches
+    ``dataset``, otherwise call ``build_response``. Both carry validators.
+    """
+    version = dataset.updated_at
+    etag = quote_etag(f'{dataset.pk}-{version.timestamp():.6f}-{variant}')
+    last_modified = timegm(version.utctimetuple())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_response()
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _pdf_response(dataset, job):
+    # The finished job's file, rendered once per dataset version by the queue.
+    return FileResponse(
+        job.file.open('rb'), as_attachment=True,
+        filename=f'report_{dataset.filename}.pdf', content_type='application/pdf',
+    )
+
+
+def _error_body(error):
+    """The 400 body for ``error``, with row-level ``errors`` when it has them."""
+    body = {'error': str(error)}
+    if getattr(error, 'errors', None):
+        body['errors'] = error.errors
+    return body
+
+
+def _batch_response(results, context):
+    def lines():
+        renderer = JSONRenderer()
+        for filename, dataset, error in results:
+            if dataset is None:
+                line = {'filename': filename, **_error_body(error)}
+            else:
+                line = {'filename': filename,
+                        'dataset': EquipmentDatasetListSerializer(dataset, context=context).data}
+            yield renderer.render(line) + b'\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+def _export_response(dataset, file_format, chunks):
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+    stem = os.path.splitext(dataset.filename)[0]
+    response['Content-Disposition'] = f'attachment; filename="{stem}.{file_format}"'
+    return response
@@ -2,6 +2,9 @@
 ASGI config for chemical_equipment_viz project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn chemical_equipment_viz.asgi:application``)
+to push events: each open /api/events/ stream then waits on the event loop
+instead of holding a worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
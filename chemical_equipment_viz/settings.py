@@ -1,34 +1,16 @@
 """
 Django settings for chemical_equipment_viz project.
-
-Generated by 'django-admin startproject' using Django 4.2.7.
-
-For more information on this file, see
-https://docs.djangoproject.com/en/4.2/topics/settings/
-
-For the full list of settings and their values, see
-https://docs.djangoproject.com/en/4.2/ref/settings/
 """
-
+import os
 from pathlib import Path
 
-# Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+SECRET_KEY = 'django-insecure-change-this-in-production-12345'
 
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
-
-# SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-y^k7_!x9g65il@t8&c_en9575&(!gib(0_&d6nu78*un_r0gcz'
-
-# SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
-ALLOWED_HOSTS = []
-
-
-# Application definition
+ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -37,11 +19,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'corsheaders',
+    'api',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.ResponseCompressionMiddleware',
+    'api.compression.RequestDecompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -69,55 +58,157 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'chemical_equipment_viz.wsgi.application'
 
-
-# Database
-# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
-
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a write waits for another one's lock, e.g. during concurrent uploads
+        'OPTIONS': {'timeout': 30},
     }
 }
 
-
-# Password validation
-# https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
-
 AUTH_PASSWORD_VALIDATORS = [
-    {
-        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
-    },
+    {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
+    {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
+    {'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator'},
+    {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
-
-# Internationalization
-# https://docs.djangoproject.com/en/4.2/topics/i18n/
-
 LANGUAGE_CODE = 'en-us'
-
 TIME_ZONE = 'UTC'
-
 USE_I18N = True
-
 USE_TZ = True
 
-
-# Static files (CSS, JavaScript, Images)
-# https://docs.djangoproject.com/en/4.2/howto/static-files/
-
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Default primary key field type
-# https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Cache backend: 'locmem' (default), 'file' or 'redis' (CACHE_BACKEND env var)
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chemical-equipment-viz',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')],
+}
+
+# API response cache (dataset detail, history and chart data)
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 60 * 60
+API_CACHE_MAX_ENTRY_BYTES = 5 * 1024 * 1024
+
+# CORS Settings
+CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_CREDENTIALS = True
+
+# REST Framework Settings
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+}
+
+# File Upload Settings
+MAX_UPLOAD_SIZE = 10485760  # 10MB
+
+# Chunked uploads (/api/uploads/) for files above MAX_UPLOAD_SIZE
+MAX_CHUNKED_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_PART_SIZE = 64 * 1024 * 1024
+UPLOAD_SESSION_TTL_HOURS = 24
+# Completed chunked uploads are ingested by `manage.py run_upload_worker`. Set
+# UPLOAD_INGEST_EAGER=1 to ingest in the `complete` request (no worker needed).
+# Sessions whose worker has written nothing for UPLOAD_INGEST_TIMEOUT seconds
+# are requeued.
+UPLOAD_INGEST_EAGER = os.environ.get('UPLOAD_INGEST_EAGER', '0') == '1'
+UPLOAD_WORKER_POLL_INTERVAL = 1.0
+UPLOAD_INGEST_TIMEOUT = 60 * 60
+
+# Request bodies may be sent gzip- or zstd-encoded (zstd needs the zstandard
+# package); this caps their size once decoded.
+MAX_DECODED_REQUEST_SIZE = 128 * 1024 * 1024
+
+# Text/JSON responses at least this large are compressed per Accept-Encoding
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+
+# PDF report jobs are rendered by `manage.py run_report_worker`. Set
+# REPORT_JOBS_EAGER=1 to render inline on submit (no worker needed).
+REPORT_JOBS_EAGER = os.environ.get('REPORT_JOBS_EAGER', '0') == '1'
+REPORT_WORKER_POLL_INTERVAL = 1.0
+REPORT_JOB_TIMEOUT = 600
+# Render long equipment tables in page ranges on this many processes (needs
+# pypdf to merge them); 0 or 1 renders in the calling process.
+REPORT_RENDER_PROCESSES = int(os.environ.get('REPORT_RENDER_PROCESSES', '0'))
+REPORT_PAGES_PER_TASK = 200
+# Rows parsed per chunk when streaming CSV uploads into the database
+CSV_INGEST_CHUNK_SIZE = 50000
+# Parse and validate the files of a batch upload (/api/datasets/upload_batch/)
+# on this many processes; 0 or 1 ingests them one after another in the request.
+INGEST_PROCESSES = int(os.environ.get('INGEST_PROCESSES', min(4, os.cpu_count() or 1)))
+MAX_BATCH_UPLOAD_FILES = 100
+# Upload validation: allowed parameter ranges in m3/h, bar and C (None leaves a
+# side open) and how many row errors a dataset's validation report keeps.
+CSV_PARAMETER_RANGES = {
+    'Flowrate': (0.0, None),
+    'Pressure': (0.0, None),
+    'Temperature': (-273.15, None),
+}
+CSV_MAX_ROW_ERRORS = 50
+
+# Equipment bulk writer: rows per batch and backend ('auto', 'orm', 'sqlite', 'postgresql')
+EQUIPMENT_BULK_BATCH_SIZE = 10000
+EQUIPMENT_BULK_BACKEND = 'auto'
+
+# Columnar raw data endpoint (/datasets/{id}/columns/) page sizes
+COLUMNAR_PAGE_SIZE = 10000
+COLUMNAR_MAX_PAGE_SIZE = 100000
+
+# Each dataset's rows are also kept as a memory-mapped Arrow file (needs
+# pyarrow) for raw_data, column pages and reports. None = uncompressed,
+# zero-copy reads; 'lz4' or 'zstd' = smaller files, decompressed per column.
+COLUMN_STORE_ENABLED = True
+COLUMN_STORE_DIR = MEDIA_ROOT / 'columns'
+COLUMN_STORE_COMPRESSION = 'lz4'
+
+# Rows per batch streamed by /api/datasets/{id}/export/<csv|parquet>/
+EXPORT_CHUNK_ROWS = 50000
+
+# Upper limits for /api/datasets/{id}/chart_data/ histograms and series
+CHART_MAX_BINS = 200
+CHART_MAX_POINTS = 10000
+
+# Maximum number of grouped rows returned by /api/datasets/aggregate/
+AGGREGATE_MAX_ROWS = 10000
+
+# Push events (/api/events/, Server-Sent Events). The event log lives in this
+# cache (None = API_CACHE_ALIAS), which every process must share: use the file
+# or redis backend with more than one process, e.g. the report worker. Streams
+# poll it every EVENTS_POLL_INTERVAL seconds and end after EVENTS_STREAM_SECONDS
+# (clients reconnect with Last-Event-ID). Serve with an ASGI server (asgi.py)
+# so open streams do not each hold a worker thread: under WSGI a stream ends
+# after EVENTS_WSGI_STREAM_SECONDS (0: after one poll) and clients poll instead.
+EVENTS_CACHE_ALIAS = None
+EVENTS_TTL = 5 * 60
+EVENTS_POLL_INTERVAL = 0.25
+EVENTS_KEEPALIVE = 15
+EVENTS_STREAM_SECONDS = 5 * 60
+EVENTS_WSGI_STREAM_SECONDS = int(os.environ.get('EVENTS_WSGI_STREAM_SECONDS', '0'))
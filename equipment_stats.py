@@ -0,0 +1,106 @@
+"""
+Vectorised summary statistics for equipment tables.
+
+Shared by the API (``api.sketches``) and the desktop client (``main.py``),
+so it depends on NumPy and pandas only. ``Type`` is encoded once as integer
+codes (free when the column is already categorical), after which every
+per-type aggregate is a single ``np.bincount`` or ``ufunc.at`` pass over a
+float64 array; no Python-level grouping happens whatever the row count.
+"""
+import numpy as np
+import pandas as pd
+
+PARAMETERS = ['Flowrate', 'Pressure', 'Temperature']
+
+
+def encode_types(types):
+    """Return ``(codes, categories)`` for a column of equipment types."""
+    if isinstance(getattr(types, 'dtype', None), pd.CategoricalDtype):
+        return np.asarray(types.cat.codes, dtype=np.intp), [str(c) for c in types.cat.categories]
+    codes, categories = pd.factorize(np.asarray(types), sort=False)
+    return codes.astype(np.intp, copy=False), [str(c) for c in categories]
+
+
+class GroupedMoments:
+    """Count, mean, M2 (sum of squared deviations), min and max per group, as arrays."""
+
+    def __init__(self, count, mean, m2, minimum, maximum):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+
+    def group(self, index):
+        """``(count, mean, m2, min, max)`` of one group as Python scalars."""
+        return (
+            int(self.count[index]), float(self.mean[index]), float(self.m2[index]),
+            float(self.min[index]), float(self.max[index]),
+        )
+
+    def total(self):
+        """Combine all groups into ``(count, mean, m2, min, max)``."""
+        present = self.count > 0
+        count = int(self.count.sum())
+        if not count:
+            return 0, 0.0, 0.0, None, None
+        mean = float((self.count * self.mean).sum() / count)
+        deviation = self.mean[present] - mean
+        m2 = float(self.m2.sum() + (self.count[present] * deviation * deviation).sum())
+        return count, mean, m2, float(self.min[present].min()), float(self.max[present].max())
+
+
+def grouped_moments(values, codes, groups):
+    """
+    Moments of ``values`` for each of ``groups`` integer codes.
+
+    Sums are taken around the first value rather than zero, which keeps the
+    single-pass ``M2 = S2 - S1**2 / n`` free of catastrophic cancellation
+    for data far from the origin.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    count = np.bincount(codes, minlength=groups)
+    shift = values[0] if values.size else 0.0
+    shifted = values - shift
+    s1 = np.bincount(codes, weights=shifted, minlength=groups)
+    s2 = np.bincount(codes, weights=shifted * shifted, minlength=groups)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shifted_mean = np.where(count > 0, s1 / count, 0.0)
+    m2 = np.maximum(s2 - s1 * shifted_mean, 0.0)
+
+    minimum = np.full(groups, np.inf)
+    maximum = np.full(groups, -np.inf)
+    np.minimum.at(minimum, codes, values)
+    np.maximum.at(maximum, codes, values)
+    return GroupedMoments(count, shifted_mean + shift, m2, minimum, maximum)
+
+
+class TableSummary:
+    """Per-type and overall moments of every parameter of an equipment table."""
+
+    def __init__(self, types, moments):
+        self.types = types
+        self.moments = moments
+
+    @property
+    def count(self):
+        first = next(iter(self.moments.values()), None)
+        return int(first.count.sum()) if first is not None else 0
+
+    @property
+    def type_distribution(self):
+        counts = next(iter(self.moments.values())).count if self.moments else []
+        return {eq_type: int(n) for eq_type, n in zip(self.types, counts) if n}
+
+    def mean(self, parameter):
+        return self.moments[parameter].total()[1]
+
+
+def summarize(frame, parameters=PARAMETERS, type_column='Type'):
+    """Summarise a DataFrame with ``type_column`` and the ``parameters`` columns."""
+    codes, types = encode_types(frame[type_column])
+    return TableSummary(types, {
+        name: grouped_moments(frame[name].to_numpy(dtype=np.float64), codes, len(types))
+        for name in parameters
+    })
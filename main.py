@@ -1,19 +1,976 @@
+import gzip
+import hashlib
+import io
+import os
+import shutil
 import sys
+import json
+import tempfile
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QLineEdit, QTableWidget, QTableWidgetItem,
-    QFileDialog, QTabWidget, QMessageBox, QComboBox, QTextEdit
+    QPushButton, QLabel, QLineEdit, QTableView, QProgressBar,
+    QFileDialog, QTabWidget, QMessageBox, QComboBox, QTextEdit, QListWidget
+)
+from PyQt5.QtCore import (
+    Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
 )
-from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from matplotlib.patches import Wedge
+
+from equipment_stats import PARAMETERS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 API_URL = 'http://localhost:8000/api'
 
+# (connect, read) timeouts in seconds for every API call
+API_TIMEOUT = (5, 120)
+API_MAX_WORKERS = 4
+
+# How often to poll a queued PDF report job, in milliseconds; less often
+# while the event stream is connected, which announces finished jobs.
+REPORT_POLL_INTERVAL = 1000
+REPORT_POLL_INTERVAL_PUSHED = 5000
+
+# Server-sent events (/api/events/): (connect, read) timeouts in seconds (the
+# server sends a keepalive every 15 s), the longest wait before reconnecting,
+# and how long to gather dataset events before reloading the history
+EVENT_STREAM_TIMEOUT = (5, 60)
+EVENT_RECONNECT_MAX = 30
+HISTORY_RELOAD_DELAY = 250
+
+# Local cache of dataset payloads and PDF reports
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.chemical_equipment_viz', 'cache')
+CACHE_MEMORY_ENTRIES = 16
+CACHE_DISK_BYTES = 512 * 1024 * 1024
+
+# Downloads (PDF reports, data exports) are written to disk in blocks of this size
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+EXPORT_FORMATS = ('csv', 'parquet')
+
+# Files above this size go through the resumable chunked upload API
+CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+# How often to check on a completed upload the server is ingesting, in milliseconds
+UPLOAD_POLL_INTERVAL = 1000
+UPLOAD_STATE_FILE = os.path.join(os.path.expanduser('~'), '.chemical_equipment_viz', 'uploads.json')
+
+# Content-Encoding for upload bodies, in order of preference. A server that
+# answers 415 is retried with the next one it lists, or uncompressed.
+UPLOAD_CONTENT_ENCODINGS = (['zstd'] if zstandard is not None else []) + ['gzip']
+
+# Row-level validation errors listed under an upload's error or summary
+ROW_ERRORS_SHOWN = 10
+
+
+class ApiCancelled(Exception):
+    pass
+
+
+class CacheEntry:
+    def __init__(self, content, etag=None, last_modified=None, version=None, path=None):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.version = version
+        self.path = path
+    
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    # Two-level LRU of response bodies keyed by kind and dataset id: a small
+    # in-memory level in front of a size-capped directory on disk.
+    
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MEMORY_ENTRIES, max_bytes=CACHE_DISK_BYTES):
+        self.root = directory
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+    
+    def set_namespace(self, name):
+        # Keep each user's cached datasets apart
+        self._memory.clear()
+        self.directory = os.path.join(self.root, name) if name else self.root
+    
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.bin', base + '.json'
+    
+    def get(self, kind, item_id):
+        key = f'{kind}-{item_id}'
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+        
+        content_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(content_path, 'rb') as f:
+                content = f.read()
+            os.utime(content_path)
+        except (OSError, ValueError):
+            return None
+        
+        entry = CacheEntry(content, **meta)
+        self._remember(key, entry)
+        return entry
+    
+    def get_file(self, kind, item_id):
+        # Like get() for large bodies: the entry points at the file on disk
+        # and its content is never read into memory.
+        key = f'{kind}-{item_id}'
+        content_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(content_path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(None, path=content_path, **meta)
+    
+    def put_file(self, kind, item_id, path, etag=None, last_modified=None, version=None):
+        key = f'{kind}-{item_id}'
+        meta = {'etag': etag, 'last_modified': last_modified, 'version': version}
+        self._memory.pop(key, None)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            content_path, meta_path = self._paths(key)
+            shutil.copyfile(path, content_path)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+            self._trim_disk()
+        except OSError as e:
+            print(f'Failed to write cache entry {key}: {e}')
+    
+    def put(self, kind, item_id, content, etag=None, last_modified=None, version=None):
+        key = f'{kind}-{item_id}'
+        meta = {'etag': etag, 'last_modified': last_modified, 'version': version}
+        entry = CacheEntry(content, **meta)
+        self._remember(key, entry)
+        
+        # The disk level is best effort; a failed write only costs a refetch
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            content_path, meta_path = self._paths(key)
+            with open(content_path, 'wb') as f:
+                f.write(content)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+            self._trim_disk()
+        except OSError as e:
+            print(f'Failed to write cache entry {key}: {e}')
+        return entry
+    
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.bin'):
+                path = os.path.join(self.directory, name)
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            for stale in (path, path[:-len('.bin')] + '.json'):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            total -= size
+
+
+class ApiResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+    
+    def json(self):
+        return json.loads(self.content)
+
+
+class ApiSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    progress = pyqtSignal('qint64', 'qint64')
+
+
+def compression_writer(encoding, fileobj):
+    # Writable stream that compresses into fileobj and leaves it open on close.
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).stream_writer(fileobj, closefd=False)
+    return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6, mtime=0)
+
+
+def compress_bytes(encoding, data):
+    buffer = io.BytesIO()
+    with compression_writer(encoding, buffer) as writer:
+        writer.write(data)
+    return buffer.getvalue()
+
+
+def describe_errors(message, errors):
+    # message followed by the first of the server's row-level validation errors
+    lines = [message]
+    for error in errors[:ROW_ERRORS_SHOWN]:
+        value = f" ({error['value']})" if error.get('value') is not None else ''
+        lines.append(f"Row {error['row']}, {error['column']}: {error['message']}{value}")
+    if len(errors) > ROW_ERRORS_SHOWN:
+        lines.append(f'... and {len(errors) - ROW_ERRORS_SHOWN} more')
+    return '\n'.join(lines)
+
+
+class StreamingBody:
+    # File-like request body that reads its parts in turn, reporting
+    # progress and honouring cancellation on every read.
+    PROGRESS_STEP = 256 * 1024
+    content_encoding = None
+    
+    def __init__(self, parts, length, on_progress, cancel_event):
+        self._streams = parts
+        self._parts = list(parts)
+        self._length = length
+        self._sent = 0
+        self._reported = 0
+        self._on_progress = on_progress
+        self._cancel_event = cancel_event
+    
+    def __len__(self):
+        return self._length
+    
+    def read(self, size=-1):
+        if self._cancel_event.is_set():
+            raise ApiCancelled()
+        if size is None or size < 0:
+            size = self._length
+        
+        data = b''
+        while self._parts and len(data) < size:
+            chunk = self._parts[0].read(size - len(data))
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            data += chunk
+        
+        self._sent += len(data)
+        if self._sent - self._reported >= self.PROGRESS_STEP or self._sent == self._length:
+            self._reported = self._sent
+            self._on_progress(self._sent, self._length)
+        return data
+    
+    def close(self):
+        for stream in self._streams:
+            stream.close()
+
+
+class MultipartUpload(StreamingBody):
+    # multipart/form-data body that streams one file from disk.
+    
+    def __init__(self, field, path, on_progress, cancel_event):
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(path)
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: text/csv\r\n\r\n'
+        ).encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        length = len(head) + os.path.getsize(path) + len(tail)
+        parts = [io.BytesIO(head), open(path, 'rb'), io.BytesIO(tail)]
+        super().__init__(parts, length, on_progress, cancel_event)
+
+
+class EncodedBody(StreamingBody):
+    # Compresses another body into a temporary file before sending, so the
+    # request still goes out with a Content-Length; WSGI servers do not
+    # accept chunked request bodies.
+    
+    def __init__(self, body, encoding, on_progress, cancel_event):
+        self.content_type = body.content_type
+        self.content_encoding = encoding
+        spool = tempfile.TemporaryFile()
+        try:
+            with compression_writer(encoding, spool) as writer:
+                while True:
+                    block = body.read(self.PROGRESS_STEP)
+                    if not block:
+                        break
+                    writer.write(block)
+        except BaseException:
+            spool.close()
+            raise
+        finally:
+            body.close()
+        length = spool.tell()
+        spool.seek(0)
+        super().__init__([spool], length, on_progress, cancel_event)
+
+
+class FilePart(StreamingBody):
+    # One byte range of a file, read and hashed up front so the checksum
+    # can go in the request headers. The checksum and reported progress
+    # are always of the file's own bytes, compressed or not.
+    content_type = 'application/octet-stream'
+    
+    def __init__(self, path, offset, length, on_progress, cancel_event, encoding=None):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        if encoding:
+            encoded = compress_bytes(encoding, data)
+            if len(encoded) < len(data):
+                data, self.content_encoding = encoded, encoding
+        sent = len(data)
+        super().__init__(
+            [io.BytesIO(data)], sent,
+            lambda done, total: on_progress(done * length // sent, length), cancel_event
+        )
+
+
+class ApiTask(QRunnable):
+    def __init__(self, session, method, url, timeout, upload=None, part=None, download=None,
+                 content_encoding=None, on_encoding_rejected=None, **kwargs):
+        super().__init__()
+        self.signals = ApiSignals()
+        self.session = session
+        self.method = method
+        self.url = url
+        self.timeout = timeout
+        self.upload = upload
+        self.part = part
+        # A 200 response body is streamed into this file instead of memory
+        self.download = download
+        self.content_encoding = content_encoding
+        self.on_encoding_rejected = on_encoding_rejected
+        self.kwargs = kwargs
+        self._cancel_event = threading.Event()
+    
+    def cancel(self):
+        self._cancel_event.set()
+    
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+    
+    def _request_body(self, encoding):
+        progress = self.signals.progress.emit
+        if self.upload:
+            field, path = self.upload
+            if encoding:
+                body = MultipartUpload(field, path, lambda *args: None, self._cancel_event)
+                body = EncodedBody(body, encoding, progress, self._cancel_event)
+            else:
+                body = MultipartUpload(field, path, progress, self._cancel_event)
+            headers = {'Content-Type': body.content_type}
+        else:
+            path, offset, length = self.part
+            body = FilePart(path, offset, length, progress, self._cancel_event, encoding)
+            headers = {'Content-Type': body.content_type, 'X-Content-SHA256': body.sha256}
+        if body.content_encoding:
+            headers['Content-Encoding'] = body.content_encoding
+        return body, headers
+    
+    def run(self):
+        body = None
+        try:
+            if self.is_cancelled:
+                raise ApiCancelled()
+            
+            kwargs = dict(self.kwargs)
+            encoding = self.content_encoding
+            while True:
+                if self.upload or self.part:
+                    body, headers = self._request_body(encoding)
+                    kwargs['data'] = body
+                    kwargs['headers'] = {**self.kwargs.get('headers', {}), **headers}
+                
+                response = self.session.request(
+                    self.method, self.url, timeout=self.timeout, stream=True, **kwargs
+                )
+                if response.status_code != 415 or body is None or not body.content_encoding:
+                    break
+                # The server cannot decode this encoding: fall back to one it lists.
+                response.close()
+                body.close()
+                accepted = [c.strip() for c in response.headers.get('Accept-Encoding', '').split(',')]
+                encoding = next((c for c in UPLOAD_CONTENT_ENCODINGS if c in accepted), None)
+                if self.on_encoding_rejected:
+                    self.on_encoding_rejected(encoding)
+            
+            with response:
+                if self.download and response.status_code == 200:
+                    self._save(response)
+                    content = b''
+                else:
+                    content = b''.join(self._iter_content(response, 64 * 1024))
+            
+            self.signals.finished.emit(ApiResponse(response.status_code, response.headers, content))
+        except ApiCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            if self.is_cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(str(e))
+        finally:
+            if body is not None:
+                body.close()
+    
+    def _iter_content(self, response, chunk_size):
+        # Content-Length counts encoded bytes, so track progress on the wire.
+        total = int(response.headers.get('Content-Length') or 0)
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if self.is_cancelled:
+                raise ApiCancelled()
+            yield chunk
+            self.signals.progress.emit(response.raw.tell(), total)
+    
+    def _save(self, response):
+        # Write next to the target and rename at the end, so a failed or
+        # cancelled download never leaves a truncated file behind.
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.download)), suffix='.part'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self._iter_content(response, DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(temp_path, self.download)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class ApiClient(QObject):
+    # Runs every HTTP call off the GUI thread on a small QThreadPool, sharing
+    # one keep-alive requests.Session so repeated calls reuse connections.
+    
+    def __init__(self, base_url=API_URL, timeout=API_TIMEOUT, max_workers=API_MAX_WORKERS, parent=None):
+        super().__init__(parent)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.content_encoding = UPLOAD_CONTENT_ENCODINGS[0]
+        self._tasks = set()
+    
+    def set_token(self, token):
+        if token:
+            self.session.headers['Authorization'] = f'Token {token}'
+        else:
+            self.session.headers.pop('Authorization', None)
+    
+    def request(self, method, path, upload=None, part=None, download=None, **kwargs):
+        task = ApiTask(
+            self.session, method, f'{self.base_url}{path}', self.timeout,
+            upload=upload, part=part, download=download, content_encoding=self.content_encoding,
+            on_encoding_rejected=self._encoding_rejected, **kwargs
+        )
+        self._tasks.add(task)
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *args, task=task: self._tasks.discard(task))
+        self.pool.start(task)
+        return task
+    
+    def _encoding_rejected(self, encoding):
+        # Called from a worker thread; later uploads start with what the server accepts.
+        self.content_encoding = encoding
+    
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+    
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+    
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+    
+    def cancel_all(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+
+class EventStream(QObject):
+    # Listens to the server's event stream on a background thread, emitting
+    # received(kind, data) for each event. Reconnects after errors, resuming
+    # from the last event id, until stop() is called.
+    received = pyqtSignal(str, object)
+    connection_changed = pyqtSignal(bool)
+    
+    def __init__(self, url, token, parent=None):
+        super().__init__(parent)
+        self.url = url
+        self.headers = {'Authorization': f'Token {token}', 'Accept': 'text/event-stream'}
+        self.connected = False
+        self.last_event_id = None
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            # Unblocks the thread's read.
+            response.close()
+    
+    def _set_connected(self, connected):
+        if connected != self.connected:
+            self.connected = connected
+            self.connection_changed.emit(connected)
+    
+    def _run(self):
+        delay = retry = 3
+        while not self._stop.is_set():
+            headers = dict(self.headers)
+            if self.last_event_id is not None:
+                headers['Last-Event-ID'] = self.last_event_id
+            try:
+                with requests.get(self.url, headers=headers, stream=True,
+                                  timeout=EVENT_STREAM_TIMEOUT) as response:
+                    self._response = response
+                    if response.status_code == 200:
+                        self._set_connected(True)
+                        delay = retry
+                        retry = self._read(response) or retry
+                    elif response.status_code in (401, 403, 404):
+                        return
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f'Event stream interrupted: {e}')
+            finally:
+                self._response = None
+                self._set_connected(False)
+            # Back off while the server is unreachable; a stream the server
+            # simply ended is resumed after its retry delay.
+            self._stop.wait(delay)
+            delay = min(delay * 2, EVENT_RECONNECT_MAX)
+    
+    def _read(self, response):
+        # Parses text/event-stream; returns the server's retry delay in seconds, if sent.
+        retry = None
+        kind, data = 'message', []
+        response.encoding = 'utf-8'
+        for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+            if self._stop.is_set():
+                break
+            if not line:
+                if data:
+                    try:
+                        self.received.emit(kind, json.loads('\n'.join(data)))
+                    except ValueError:
+                        pass
+                kind, data = 'message', []
+                continue
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'event':
+                kind = value
+            elif field == 'data':
+                data.append(value)
+            elif field == 'id':
+                self.last_event_id = value
+            elif field == 'retry' and value.isdigit():
+                retry = int(value) / 1000
+        return retry
+
+
+class ChunkedUpload(QObject):
+    # Sends one file through the chunked upload API as numbered, checksummed
+    # parts, several at a time, retrying failed parts and resuming a session
+    # left unfinished by an earlier run. The server ingests the completed file
+    # in the background; finished carries the new dataset's detail response.
+    # Exposes the same signals and cancel() as an ApiTask so the main window
+    # can track it like any other request.
+    MAX_RETRIES = 3
+    
+    def __init__(self, api, path, parallel=API_MAX_WORKERS, state_file=UPLOAD_STATE_FILE, parent=None):
+        super().__init__(parent)
+        self.signals = ApiSignals()
+        self.api = api
+        self.path = path
+        self.parallel = parallel
+        self.state_file = state_file
+        self.size = os.path.getsize(path)
+        self.key = f'{os.path.abspath(path)}|{self.size}|{int(os.path.getmtime(path))}'
+        self.session = None
+        self._pending = []
+        self._running = {}
+        self._attempts = {}
+        self._sent = {}
+        self._done_bytes = 0
+        self._stopped = False
+    
+    def start(self):
+        session_id = self._load_state().get(self.key)
+        if session_id:
+            task = self.api.get(f'/uploads/{session_id}/')
+            task.signals.finished.connect(lambda response: self._on_session(response, resumed=True))
+        else:
+            task = self.api.post('/uploads/', json={'filename': os.path.basename(self.path), 'size': self.size})
+            task.signals.finished.connect(self._on_session)
+        task.signals.failed.connect(self._fail)
+        task.signals.cancelled.connect(self.cancel)
+    
+    def cancel(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        for task in list(self._running.values()):
+            task.cancel()
+        self.signals.cancelled.emit()
+    
+    def _part_length(self, number):
+        if number < self.session['part_count']:
+            return self.session['part_size']
+        return self.size - self.session['part_size'] * (self.session['part_count'] - 1)
+    
+    def _on_session(self, response, resumed=False):
+        if self._stopped:
+            return
+        if resumed and response.status_code == 200 and response.json()['status'] in (
+                'queued', 'assembling', 'complete'):
+            # Completed by an earlier run: wait for the server's ingest.
+            self.session = response.json()
+            self._on_status(response)
+            return
+        if resumed and (response.status_code != 200 or response.json()['status'] != 'open'):
+            self._save_state(None)
+            self.start()
+            return
+        if response.status_code not in (200, 201):
+            self._finish(response)
+            return
+        
+        self.session = response.json()
+        self._save_state(self.session['id'])
+        received = {
+            part['number'] for part in self.session['parts']
+            if part['size'] == self._part_length(part['number'])
+        }
+        self._pending = [n for n in range(1, self.session['part_count'] + 1) if n not in received]
+        self._done_bytes = sum(self._part_length(n) for n in received)
+        self._report_progress()
+        self._pump()
+    
+    def _pump(self):
+        if self._stopped:
+            return
+        while self._pending and len(self._running) < self.parallel:
+            self._start_part(self._pending.pop(0))
+        if not self._pending and not self._running:
+            self._complete()
+    
+    def _start_part(self, number):
+        length = self._part_length(number)
+        offset = (number - 1) * self.session['part_size']
+        task = self.api.put(
+            f"/uploads/{self.session['id']}/parts/{number}/", part=(self.path, offset, length)
+        )
+        self._running[number] = task
+        task.signals.progress.connect(
+            lambda done, total, number=number, length=length: self._on_part_progress(number, length, done, total)
+        )
+        task.signals.finished.connect(lambda response, number=number: self._on_part_finished(number, response))
+        task.signals.failed.connect(lambda error, number=number: self._on_part_failed(number, error))
+        task.signals.cancelled.connect(self.cancel)
+    
+    def _on_part_progress(self, number, length, done, total):
+        # Ignore progress of the (small) response body, which shares the signal.
+        if total == length:
+            self._sent[number] = done
+            self._report_progress()
+    
+    def _on_part_finished(self, number, response):
+        if response.status_code != 200:
+            self._on_part_failed(number, response.json().get('error', f'Part {number} failed'))
+            return
+        self._running.pop(number, None)
+        self._sent.pop(number, None)
+        self._done_bytes += self._part_length(number)
+        self._report_progress()
+        self._pump()
+    
+    def _on_part_failed(self, number, error):
+        self._running.pop(number, None)
+        self._sent.pop(number, None)
+        if self._stopped:
+            return
+        attempts = self._attempts.get(number, 0) + 1
+        self._attempts[number] = attempts
+        if attempts > self.MAX_RETRIES:
+            self._fail(error)
+            return
+        self._pending.insert(0, number)
+        QTimer.singleShot(1000 * attempts, self._pump)
+    
+    def _report_progress(self):
+        self.signals.progress.emit(self._done_bytes + sum(self._sent.values()), self.size)
+    
+    def _complete(self):
+        task = self.api.post(f"/uploads/{self.session['id']}/complete/")
+        self._running[0] = task
+        task.signals.finished.connect(self._on_completed)
+        task.signals.failed.connect(self._fail)
+        task.signals.cancelled.connect(self.cancel)
+    
+    def _on_completed(self, response):
+        if response.status_code == 202:
+            self._running.clear()
+            self._wait()
+        elif response.status_code == 201:
+            # Ingested eagerly; the response is the dataset's summary.
+            self._load_dataset(response.json()['id'])
+        else:
+            self._finish(response)
+    
+    def _wait(self):
+        QTimer.singleShot(UPLOAD_POLL_INTERVAL, self._poll)
+    
+    def _poll(self):
+        if self._stopped:
+            return
+        task = self.api.get(f"/uploads/{self.session['id']}/")
+        self._running[0] = task
+        task.signals.finished.connect(self._on_status)
+        task.signals.failed.connect(self._fail)
+        task.signals.cancelled.connect(self.cancel)
+    
+    def _on_status(self, response):
+        if self._stopped:
+            return
+        if response.status_code != 200:
+            self._finish(response)
+            return
+        session = response.json()
+        if session['status'] in ('queued', 'assembling'):
+            self._wait()
+        elif session['status'] == 'complete':
+            self._load_dataset(session['dataset'])
+        else:
+            # Failed, or reopened after an interrupted ingest (500 keeps the
+            # session for a retry, which resumes and completes it again).
+            body = {'error': session['error'] or 'Upload failed', 'errors': session.get('errors', [])}
+            code = 400 if session['status'] == 'failed' else 500
+            self._finish(ApiResponse(code, {}, json.dumps(body).encode()))
+    
+    def _load_dataset(self, dataset_id):
+        task = self.api.get(f"/datasets/{dataset_id}/", params={'layout': 'columns'})
+        self._running[0] = task
+        task.signals.finished.connect(self._finish)
+        task.signals.failed.connect(self._fail)
+        task.signals.cancelled.connect(self.cancel)
+    
+    def _finish(self, response):
+        self._running.clear()
+        if response.status_code != 500:
+            self._save_state(None)
+        self._stopped = True
+        self.signals.finished.emit(response)
+    
+    def _fail(self, error):
+        if self._stopped:
+            return
+        self._stopped = True
+        for task in list(self._running.values()):
+            task.cancel()
+        self.signals.failed.emit(error)
+    
+    def _load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_state(self, session_id):
+        state = self._load_state()
+        if session_id:
+            state[self.key] = session_id
+        else:
+            state.pop(self.key, None)
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(self.state_file, 'w') as f:
+            json.dump(state, f)
+
+
+class BatchUpload(QObject):
+    # Uploads many CSV files, at most `parallel` at a time, each in its own
+    # request to the batch endpoint so the server parses them side by side
+    # and every file's result arrives as soon as its upload returns. Zip
+    # archives are unpacked into a temporary directory first; files too
+    # large for one request go through ChunkedUpload. Progress counts files
+    # and finished carries the (name, dataset, error) result of every file.
+    file_finished = pyqtSignal(str, object, str)
+    
+    def __init__(self, api, paths, parallel=API_MAX_WORKERS, parent=None):
+        super().__init__(parent)
+        self.signals = ApiSignals()
+        self.api = api
+        self.paths = paths
+        self.parallel = parallel
+        self.results = []
+        self._pending = []
+        self._running = {}
+        self._total = 0
+        self._directory = None
+        self._stopped = False
+    
+    def start(self):
+        self._directory = tempfile.TemporaryDirectory(prefix='batch-')
+        for path in self.paths:
+            if path.lower().endswith('.zip'):
+                self._unpack(path)
+            else:
+                self._pending.append((os.path.basename(path), path))
+        self._total = len(self.results) + len(self._pending)
+        self._report_progress()
+        self._pump()
+    
+    def cancel(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        for task in list(self._running.values()):
+            task.cancel()
+        self._cleanup()
+        self.signals.cancelled.emit()
+    
+    def _unpack(self, path):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or name.startswith('.') or not name.lower().endswith('.csv'):
+                        continue
+                    # One folder per member keeps its name for the upload.
+                    folder = os.path.join(self._directory.name, str(len(self._pending)))
+                    os.makedirs(folder)
+                    target = os.path.join(folder, name)
+                    with archive.open(member) as source, open(target, 'wb') as f:
+                        shutil.copyfileobj(source, f, DOWNLOAD_CHUNK_SIZE)
+                    self._pending.append((name, target))
+        except (OSError, zipfile.BadZipFile) as e:
+            self._record(os.path.basename(path), None, f'Could not read archive: {e}')
+    
+    def _pump(self):
+        if self._stopped:
+            return
+        while self._pending and len(self._running) < self.parallel:
+            self._start_file(*self._pending.pop(0))
+        if not self._pending and not self._running:
+            self._finish()
+    
+    def _start_file(self, name, path):
+        if os.path.getsize(path) > CHUNKED_UPLOAD_THRESHOLD:
+            task = ChunkedUpload(self.api, path, parent=self)
+            task.signals.finished.connect(
+                lambda response, name=name, path=path: self._on_chunked_finished(name, path, response)
+            )
+        else:
+            task = self.api.post('/datasets/upload_batch/', upload=('files', path))
+            task.signals.finished.connect(
+                lambda response, name=name, path=path: self._on_batch_finished(name, path, response)
+            )
+        task.signals.failed.connect(lambda error, name=name, path=path: self._done(path, [(name, None, error)]))
+        task.signals.cancelled.connect(self.cancel)
+        self._running[path] = task
+        if isinstance(task, ChunkedUpload):
+            task.start()
+    
+    def _on_batch_finished(self, name, path, response):
+        if response.status_code != 200:
+            self._done(path, [(name, None, self._error(response))])
+            return
+        lines = [json.loads(line) for line in response.content.splitlines() if line.strip()]
+        self._done(path, [
+            (line['filename'], line.get('dataset'),
+             describe_errors(line['error'], line.get('errors', [])) if 'error' in line else '')
+            for line in lines
+        ])
+    
+    def _on_chunked_finished(self, name, path, response):
+        if response.status_code not in (200, 201):
+            self._done(path, [(name, None, self._error(response))])
+        else:
+            self._done(path, [(name, response.json(), '')])
+    
+    @staticmethod
+    def _error(response):
+        try:
+            body = response.json()
+            return describe_errors(body.get('error', f'Upload failed ({response.status_code})'),
+                                   body.get('errors', []))
+        except ValueError:
+            return f'Upload failed ({response.status_code})'
+    
+    def _done(self, path, results):
+        self._running.pop(path, None)
+        if self._stopped:
+            return
+        for name, dataset, error in results:
+            self._record(name, dataset, error)
+        self._report_progress()
+        self._pump()
+    
+    def _record(self, name, dataset, error):
+        self.results.append((name, dataset, error))
+        self.file_finished.emit(name, dataset, error or '')
+    
+    def _report_progress(self):
+        self.signals.progress.emit(len(self.results), self._total)
+    
+    def _finish(self):
+        self._stopped = True
+        self._cleanup()
+        self.signals.finished.emit(self.results)
+    
+    def _cleanup(self):
+        if self._directory is not None:
+            self._directory.cleanup()
+            self._directory = None
+
 
 class LoginWindow(QWidget):
     def __init__(self, main_window):
@@ -88,15 +1045,20 @@ class LoginWindow(QWidget):
             self.error_label.setText('Username and password are required')
             return
         
+        endpoint = '/auth/register/' if self.is_register else '/auth/login/'
+        payload = {'username': username, 'password': password}
+        
+        if self.is_register:
+            payload['email'] = email
+        
+        self.login_btn.setEnabled(False)
+        task = self.main_window.api.post(endpoint, json=payload)
+        task.signals.finished.connect(self.on_auth_response)
+        task.signals.failed.connect(self.on_auth_failed)
+    
+    def on_auth_response(self, response):
+        self.login_btn.setEnabled(True)
         try:
-            endpoint = '/auth/register/' if self.is_register else '/auth/login/'
-            payload = {'username': username, 'password': password}
-            
-            if self.is_register:
-                payload['email'] = email
-            
-            response = requests.post(f'{API_URL}{endpoint}', json=payload)
-            
             if response.status_code in [200, 201]:
                 data = response.json()
                 self.main_window.set_token(data['token'], data['user'])
@@ -107,6 +1069,119 @@ class LoginWindow(QWidget):
         
         except Exception as e:
             self.error_label.setText(f'Error: {str(e)}')
+    
+    def on_auth_failed(self, error):
+        self.login_btn.setEnabled(True)
+        self.error_label.setText(f'Error: {error}')
+
+
+class DataFrameTableModel(QAbstractTableModel):
+    # Rows are exposed to the view in batches as the user scrolls; sorting and
+    # filtering only reorder an index array over the column arrays.
+    FETCH_BATCH = 500
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._columns = []
+        self._arrays = []
+        self._search = None
+        self._all_rows = np.arange(0)
+        self._rows = self._all_rows
+        self._loaded = 0
+        self._filter_text = ''
+        self._sort_column = None
+        self._sort_order = Qt.AscendingOrder
+    
+    def set_frame(self, df):
+        self.beginResetModel()
+        self._columns = [str(c) for c in df.columns]
+        self._arrays = [df[c].to_numpy() for c in df.columns]
+        self._search = None
+        self._all_rows = np.arange(len(df))
+        self._apply_view()
+        self.endResetModel()
+    
+    def set_filter(self, text):
+        self.beginResetModel()
+        self._filter_text = text.strip().lower()
+        self._apply_view()
+        self.endResetModel()
+    
+    def _apply_view(self, keep_loaded=False):
+        rows = self._all_rows
+        if self._filter_text:
+            if self._search is None:
+                # Lower-cased text columns, built on first filter and reused after
+                self._search = [
+                    np.char.lower(arr.astype(str)) for arr in self._arrays if arr.dtype == object
+                ]
+            mask = np.zeros(len(rows), dtype=bool)
+            for column in self._search:
+                mask |= np.char.find(column, self._filter_text) >= 0
+            rows = rows[mask]
+        if self._sort_column is not None and len(rows):
+            keys = self._arrays[self._sort_column][rows]
+            rows = rows[np.argsort(keys, kind='stable')]
+            if self._sort_order == Qt.DescendingOrder:
+                rows = rows[::-1]
+        self._rows = rows
+        # Re-sorting keeps the row set, so the rows already fetched stay fetched.
+        loaded = max(self.FETCH_BATCH, self._loaded) if keep_loaded else self.FETCH_BATCH
+        self._loaded = min(loaded, len(rows))
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return str(self._arrays[index.column()][self._rows[index.row()]])
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section] if section < len(self._columns) else None
+        return str(section + 1)
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._rows)
+    
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.FETCH_BATCH, len(self._rows) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        # A layout change must keep rowCount, so only the order changes here.
+        self.layoutAboutToBeChanged.emit()
+        old_rows = self._rows
+        persistent = self.persistentIndexList()
+        self._sort_column = column if column >= 0 else None
+        self._sort_order = order
+        self._apply_view(keep_loaded=True)
+        if persistent:
+            # Selection and current index follow their rows to the new positions.
+            position = np.empty(len(self._arrays[0]) if self._arrays else 0, dtype=np.int64)
+            position[self._rows] = np.arange(len(self._rows))
+            moved = []
+            for index in persistent:
+                row = int(position[old_rows[index.row()]])
+                moved.append(self.index(row, index.column()) if row < self._loaded else QModelIndex())
+            self.changePersistentIndexList(persistent, moved)
+        self.layoutChanged.emit()
+    
+    def row_values(self, row, columns):
+        if not 0 <= row < len(self._rows) or any(c not in self._columns for c in columns):
+            return None
+        source = self._rows[row]
+        return [self._arrays[self._columns.index(c)][source] for c in columns]
 
 
 class MplCanvas(FigureCanvas):
@@ -116,6 +1191,124 @@ class MplCanvas(FigureCanvas):
         super().__init__(fig)
 
 
+class ChartController:
+    # Owns the dashboard axes and artists, which are created and laid out
+    # once. Showing a dataset updates wedge angles, labels and bar heights in
+    # place; the rendered pixels are kept per dataset version, so switching
+    # back to a dataset is a restore-and-blit instead of a full draw. The
+    # selected table row is an animated overlay blitted over that background.
+    CACHE_ENTRIES = 16
+    BAR_COLORS = ['#FF6384', '#36A2EB', '#4BC0C0']
+    
+    def __init__(self, canvas):
+        self.canvas = canvas
+        figure = canvas.figure
+        figure.clear()
+        self.pie_ax = figure.add_subplot(121)
+        self.bar_ax = figure.add_subplot(122)
+        
+        self.pie_ax.set_title('Equipment Type Distribution')
+        self.pie_ax.set_aspect('equal')
+        self.pie_ax.set_xlim(-1.25, 1.25)
+        self.pie_ax.set_ylim(-1.25, 1.25)
+        self.pie_ax.axis('off')
+        self.pie_colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        self.wedges = []
+        
+        self.bars = self.bar_ax.bar(PARAMETERS, [0.0] * len(PARAMETERS), color=self.BAR_COLORS)
+        self.bar_ax.set_title('Average Parameters')
+        self.bar_ax.set_ylabel('Value')
+        self.selection, = self.bar_ax.plot([], [], 'D', color='black', animated=True)
+        figure.tight_layout()
+        
+        self._key = None
+        self._background = None
+        self._backgrounds = OrderedDict()
+        canvas.mpl_connect('draw_event', self._on_draw)
+    
+    def show(self, key, types):
+        # key identifies the dataset version, e.g. (id, updated_at).
+        self._set_data(types)
+        self.selection.set_data([], [])
+        self._key = key
+        
+        entry = self._backgrounds.get(key)
+        if entry is not None and entry[0] == self._state():
+            self._backgrounds.move_to_end(key)
+            self._background = entry[1]
+            self.canvas.restore_region(self._background)
+            self.canvas.blit(self.canvas.figure.bbox)
+        else:
+            self.canvas.draw()
+    
+    def highlight(self, values):
+        # Overlay one row's parameter values on the bar chart.
+        if values is None:
+            self.selection.set_data([], [])
+        else:
+            self.selection.set_data(range(len(values)), values)
+            top = max(values)
+            if top > self.bar_ax.get_ylim()[1]:
+                self.bar_ax.set_ylim(0, top * 1.1)
+                self.canvas.draw()
+                return
+        if self._background is None:
+            return
+        self.canvas.restore_region(self._background)
+        self.bar_ax.draw_artist(self.selection)
+        self.canvas.blit(self.bar_ax.bbox)
+    
+    def _state(self):
+        # Cached pixels are only valid for the same canvas size and bar scale.
+        return tuple(self.canvas.figure.bbox.bounds), self.bar_ax.get_ylim()
+    
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        if self._key is not None:
+            self._backgrounds[self._key] = (self._state(), self._background)
+            self._backgrounds.move_to_end(self._key)
+            while len(self._backgrounds) > self.CACHE_ENTRIES:
+                self._backgrounds.popitem(last=False)
+        self.bar_ax.draw_artist(self.selection)
+    
+    def _set_data(self, types):
+        counts = types['counts']
+        total = sum(counts)
+        while len(self.wedges) < len(counts):
+            index = len(self.wedges)
+            wedge = Wedge((0, 0), 1, 0, 0, facecolor=self.pie_colors[index % len(self.pie_colors)])
+            self.pie_ax.add_patch(wedge)
+            label = self.pie_ax.text(0, 0, '', va='center')
+            percent = self.pie_ax.text(0, 0, '', ha='center', va='center')
+            self.wedges.append((wedge, label, percent))
+        
+        # Same layout as pie(startangle=90): counter-clockwise from the top.
+        theta = 90.0
+        for index, (wedge, label, percent) in enumerate(self.wedges):
+            visible = index < len(counts) and total > 0
+            for artist in (wedge, label, percent):
+                artist.set_visible(visible)
+            if not visible:
+                continue
+            span = 360.0 * counts[index] / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + span)
+            middle = np.deg2rad(theta + span / 2)
+            x, y = np.cos(middle), np.sin(middle)
+            label.set_text(types['labels'][index])
+            label.set_position((1.1 * x, 1.1 * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            percent.set_text(f'{100.0 * counts[index] / total:1.1f}%')
+            percent.set_position((0.6 * x, 0.6 * y))
+            theta += span
+        
+        heights = [types['overall'][param] if counts else 0.0 for param in PARAMETERS]
+        for bar, height in zip(self.bars, heights):
+            bar.set_height(height)
+        top = max(heights) if heights and max(heights) > 0 else 1.0
+        self.bar_ax.set_ylim(0, top * 1.1)
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -123,6 +1316,20 @@ class MainWindow(QMainWindow):
         self.user = None
         self.current_dataset = None
         self.datasets = []
+        self.api = ApiClient(parent=self)
+        self.cache = ResponseCache()
+        self.dataset_task = None
+        self.chart_task = None
+        self.report_job = None
+        self.report_poll = None
+        self.upload_task = None
+        self.events = None
+        
+        # Dataset events arriving together reload the history once.
+        self.history_timer = QTimer(self)
+        self.history_timer.setSingleShot(True)
+        self.history_timer.setInterval(HISTORY_RELOAD_DELAY)
+        self.history_timer.timeout.connect(self.load_history)
         
         self.login_window = LoginWindow(self)
         self.login_window.show()
@@ -130,8 +1337,38 @@ class MainWindow(QMainWindow):
     def set_token(self, token, user):
         self.token = token
         self.user = user
+        self.api.set_token(token)
+        self.cache.set_namespace(user['username'])
         self.init_ui()
         self.load_history()
+        
+        # Pushes new datasets, upload progress and finished reports, so changes
+        # made elsewhere show up without polling. Our own uploads and deltas
+        # still reload explicitly: events can be missed (e.g. a server whose
+        # processes do not share a cache).
+        self.events = EventStream(f'{self.api.base_url}/events/', token, parent=self)
+        self.events.received.connect(self.on_event)
+        self.events.start()
+    
+    @property
+    def events_connected(self):
+        return self.events is not None and self.events.connected
+    
+    def on_event(self, kind, data):
+        if kind in ('dataset_created', 'dataset_updated', 'dataset_deleted'):
+            self.history_timer.start()
+        if kind == 'dataset_updated' and self.current_dataset:
+            dataset = data['dataset']
+            if (dataset['id'] == self.current_dataset['id']
+                    and dataset['updated_at'] != self.current_dataset.get('updated_at')):
+                # Changed elsewhere (or by our own delta): show the new version.
+                task = self.api.get(f"/datasets/{dataset['id']}/", params={'layout': 'columns'})
+                task.signals.finished.connect(self.on_updated_dataset_loaded)
+                task.signals.failed.connect(lambda error: print(f'Failed to reload dataset: {error}'))
+        elif kind == 'ingest_progress' and self.progress_bar.isVisible():
+            self.statusBar().showMessage(f"Ingesting {data['filename']}: {data['rows']:,} rows stored")
+        elif kind == 'report_finished' and data['job']['id'] == self.report_job and self.report_poll:
+            self.report_poll()
     
     def init_ui(self):
         self.setWindowTitle('Chemical Equipment Parameter Visualizer')
@@ -173,6 +1410,38 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(self.tabs)
         
         central_widget.setLayout(main_layout)
+        
+        # Progress of the running network call
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(250)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        
+        self.cancel_btn = QPushButton('Cancel')
+        self.cancel_btn.clicked.connect(self.api.cancel_all)
+        self.cancel_btn.clicked.connect(self.cancel_report)
+        self.cancel_btn.clicked.connect(self.cancel_upload)
+        self.cancel_btn.hide()
+        self.statusBar().addPermanentWidget(self.cancel_btn)
+    
+    def track_task(self, task, message):
+        self.statusBar().showMessage(message)
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.cancel_btn.show()
+        task.signals.progress.connect(self.on_task_progress)
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(self.on_task_done)
+    
+    def on_task_progress(self, done, total):
+        if total > 0:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(int(done * 100 / total))
+    
+    def on_task_done(self, *args):
+        self.statusBar().clearMessage()
+        self.progress_bar.hide()
+        self.cancel_btn.hide()
     
     def create_upload_tab(self):
         widget = QWidget()
@@ -196,6 +1465,24 @@ class MainWindow(QMainWindow):
         upload_btn.clicked.connect(self.upload_file)
         layout.addWidget(upload_btn)
         
+        # Inserts, updates and deletes by Equipment Name, without a new dataset
+        delta_btn = QPushButton('Apply Changes to Current Dataset...')
+        delta_btn.clicked.connect(self.apply_delta)
+        layout.addWidget(delta_btn)
+        
+        batch_layout = QHBoxLayout()
+        files_btn = QPushButton('Upload Files...')
+        files_btn.clicked.connect(self.browse_batch_files)
+        batch_layout.addWidget(files_btn)
+        
+        folder_btn = QPushButton('Upload Folder...')
+        folder_btn.clicked.connect(self.browse_batch_folder)
+        batch_layout.addWidget(folder_btn)
+        layout.addLayout(batch_layout)
+        
+        self.batch_list = QListWidget()
+        layout.addWidget(self.batch_list)
+        
         info = QLabel('Expected CSV Format:\nColumns: Equipment Name, Type, Flowrate, Pressure, Temperature')
         info.setStyleSheet('background-color: #f0f0f0; padding: 10px; border-radius: 5px;')
         layout.addWidget(info)
@@ -215,10 +1502,22 @@ class MainWindow(QMainWindow):
         
         # Charts
         self.chart_canvas = MplCanvas(self, width=10, height=8, dpi=100)
+        self.charts = ChartController(self.chart_canvas)
         layout.addWidget(self.chart_canvas)
         
         # Data table
-        self.data_table = QTableWidget()
+        self.table_filter = QLineEdit()
+        self.table_filter.setPlaceholderText('Filter rows...')
+        layout.addWidget(self.table_filter)
+        
+        self.table_model = DataFrameTableModel(self)
+        self.table_filter.textChanged.connect(self.table_model.set_filter)
+        self.data_table = QTableView()
+        self.data_table.setModel(self.table_model)
+        # Keep upload order until a header is clicked
+        self.data_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.data_table.setSortingEnabled(True)
+        self.data_table.selectionModel().currentRowChanged.connect(self.on_table_row_changed)
         layout.addWidget(self.data_table)
         
         # PDF button
@@ -226,6 +1525,10 @@ class MainWindow(QMainWindow):
         pdf_btn.clicked.connect(self.generate_pdf)
         layout.addWidget(pdf_btn)
         
+        export_btn = QPushButton('Export Data')
+        export_btn.clicked.connect(self.export_data)
+        layout.addWidget(export_btn)
+        
         widget.setLayout(layout)
         return widget
     
@@ -259,34 +1562,156 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, 'Warning', 'Please select a file first')
             return
         
+        name = os.path.basename(self.selected_file)
+        if os.path.getsize(self.selected_file) > CHUNKED_UPLOAD_THRESHOLD:
+            task = ChunkedUpload(self.api, self.selected_file, parent=self)
+            self.upload_task = task
+            self.track_task(task, f'Uploading {name} in parts...')
+            task.start()
+        else:
+            task = self.api.post('/datasets/upload_csv/', upload=('file', self.selected_file))
+            self.track_task(task, f'Uploading {name}...')
+        task.signals.finished.connect(self.on_upload_finished)
+        task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+    
+    def on_upload_finished(self, response):
         try:
-            with open(self.selected_file, 'rb') as f:
-                files = {'file': f}
-                headers = {'Authorization': f'Token {self.token}'}
-                
-                response = requests.post(
-                    f'{API_URL}/datasets/upload_csv/',
-                    files=files,
-                    headers=headers
-                )
-            
+            # 201 with the new dataset's summary from upload_csv, whose rows
+            # come with the detail; chunked uploads finish with the detail (200)
             if response.status_code == 201:
+                task = self.api.get(f"/datasets/{response.json()['id']}/", params={'layout': 'columns'})
+                task.signals.finished.connect(self.on_upload_finished)
+                task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+            elif response.status_code == 200:
                 self.current_dataset = response.json()
+                self.cache.put(
+                    'dataset', self.current_dataset['id'], response.content,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    version=self.current_dataset.get('updated_at')
+                )
                 self.update_visualization()
                 self.load_history()
                 self.tabs.setCurrentIndex(1)
-                QMessageBox.information(self, 'Success', 'File uploaded successfully!')
+                validation = self.current_dataset.get('validation') or {}
+                if validation.get('rejected'):
+                    QMessageBox.warning(self, 'Uploaded with rejected rows', describe_errors(
+                        f"File uploaded, but {validation['rejected']} of {validation['rows']} rows "
+                        f"were rejected:", validation['errors']
+                    ))
+                else:
+                    QMessageBox.information(self, 'Success', 'File uploaded successfully!')
             else:
-                QMessageBox.critical(self, 'Error', response.json().get('error', 'Upload failed'))
+                body = response.json()
+                QMessageBox.critical(
+                    self, 'Error', describe_errors(body.get('error', 'Upload failed'), body.get('errors', []))
+                )
         
         except Exception as e:
             QMessageBox.critical(self, 'Error', str(e))
     
-    def load_history(self):
+    def apply_delta(self):
+        if not self.current_dataset:
+            QMessageBox.warning(self, 'Warning', 'No dataset loaded')
+            return
+        path, _ = QFileDialog.getOpenFileName(self, 'Select CSV of Changed Rows', '', 'CSV Files (*.csv)')
+        if not path:
+            return
+        
+        task = self.api.post(f"/datasets/{self.current_dataset['id']}/delta/", upload=('file', path))
+        self.track_task(task, f'Applying {os.path.basename(path)}...')
+        task.signals.finished.connect(self.on_delta_applied)
+        task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+    
+    def on_delta_applied(self, response):
         try:
-            headers = {'Authorization': f'Token {self.token}'}
-            response = requests.get(f'{API_URL}/datasets/history/', headers=headers)
+            body = response.json()
+            if response.status_code != 200:
+                QMessageBox.critical(
+                    self, 'Error', describe_errors(body.get('error', 'Update failed'), body.get('errors', []))
+                )
+                return
             
+            task = self.api.get(f"/datasets/{body['dataset']['id']}/", params={'layout': 'columns'})
+            task.signals.finished.connect(self.on_updated_dataset_loaded)
+            task.signals.failed.connect(lambda error: print(f'Failed to reload dataset: {error}'))
+            self.statusBar().showMessage(
+                f"{body['inserted']} rows added, {body['updated']} updated, {body['deleted']} deleted", 5000
+            )
+        
+        except Exception as e:
+            QMessageBox.critical(self, 'Error', str(e))
+    
+    def on_updated_dataset_loaded(self, response):
+        if response.status_code != 200:
+            print(f'Failed to reload dataset: HTTP {response.status_code}')
+            return
+        dataset = response.json()
+        self.cache.put(
+            'dataset', dataset['id'], response.content,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            version=dataset.get('updated_at')
+        )
+        self.current_dataset = dataset
+        self.update_visualization()
+        self.load_history()
+    
+    def browse_batch_files(self):
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, 'Select CSV Files or Zip Archives', '', 'CSV Files and Zip Archives (*.csv *.zip)'
+        )
+        if paths:
+            self.upload_batch(paths)
+    
+    def browse_batch_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, 'Select Folder of CSV Files')
+        if not folder:
+            return
+        paths = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder)
+            if name.lower().endswith(('.csv', '.zip'))
+        )
+        if not paths:
+            QMessageBox.warning(self, 'Warning', 'The folder contains no CSV files')
+            return
+        self.upload_batch(paths)
+    
+    def upload_batch(self, paths):
+        self.batch_list.clear()
+        task = BatchUpload(self.api, paths, parent=self)
+        self.upload_task = task
+        self.track_task(task, f'Uploading {len(paths)} files...')
+        task.file_finished.connect(self.on_batch_file_finished)
+        task.signals.finished.connect(self.on_batch_finished)
+        task.start()
+    
+    def on_batch_file_finished(self, name, dataset, error):
+        if dataset is None:
+            self.batch_list.addItem(f"{name}: failed - {error.splitlines()[0]}")
+            details = error
+        else:
+            validation = dataset.get('validation') or {}
+            rejected = f", {validation['rejected']} rejected" if validation.get('rejected') else ''
+            self.batch_list.addItem(f"{name}: {dataset['total_equipment']} rows{rejected}")
+            details = describe_errors(f'{name}:', validation.get('errors', [])) if rejected else ''
+        # Row-level errors, if any, show on hover.
+        self.batch_list.item(self.batch_list.count() - 1).setToolTip(details)
+    
+    def on_batch_finished(self, results):
+        self.upload_task = None
+        uploaded = sum(dataset is not None for _, dataset, _ in results)
+        self.statusBar().showMessage(f'Uploaded {uploaded} of {len(results)} files', 5000)
+        if uploaded:
+            self.load_history()
+    
+    def load_history(self):
+        task = self.api.get('/datasets/history/')
+        task.signals.finished.connect(self.on_history_loaded)
+        task.signals.failed.connect(lambda error: print(f'Failed to load history: {error}'))
+    
+    def on_history_loaded(self, response):
+        try:
             if response.status_code == 200:
                 self.datasets = response.json()
                 self.history_combo.clear()
@@ -304,35 +1729,75 @@ class MainWindow(QMainWindow):
         if index < 0 or index >= len(self.datasets):
             return
         
-        dataset_id = self.datasets[index]['id']
+        entry = self.datasets[index]
+        dataset_id = entry['id']
+        
+        # Only the most recent selection matters
+        if self.dataset_task is not None:
+            self.dataset_task.cancel()
+            self.dataset_task = None
+        
+        # History already tells us the dataset's version, so a matching cache
+        # entry needs no request at all; otherwise revalidate with ETag
+        cached = self.cache.get('dataset', dataset_id)
+        if cached is not None and cached.version == entry.get('updated_at'):
+            self.show_history_dataset(json.loads(cached.content))
+            return
         
+        self.dataset_task = self.api.get(
+            f'/datasets/{dataset_id}/',
+            params={'layout': 'columns'},
+            headers=cached.validators() if cached is not None else {}
+        )
+        self.track_task(self.dataset_task, 'Loading dataset...')
+        self.dataset_task.signals.finished.connect(
+            lambda response, dataset_id=dataset_id: self.on_dataset_loaded(dataset_id, response)
+        )
+        self.dataset_task.signals.failed.connect(
+            lambda error: QMessageBox.critical(self, 'Error', f'Failed to load dataset: {error}')
+        )
+    
+    def on_dataset_loaded(self, dataset_id, response):
         try:
-            headers = {'Authorization': f'Token {self.token}'}
-            response = requests.get(f'{API_URL}/datasets/{dataset_id}/', headers=headers)
-            
-            if response.status_code == 200:
-                self.current_dataset = response.json()
-                
-                # Update history details
-                details = f"""
-                Filename: {self.current_dataset['filename']}
-                Upload Date: {self.current_dataset['upload_date']}
-                Total Equipment: {self.current_dataset['total_equipment']}
-                Average Flowrate: {self.current_dataset['avg_flowrate']:.2f}
-                Average Pressure: {self.current_dataset['avg_pressure']:.2f}
-                Average Temperature: {self.current_dataset['avg_temperature']:.2f}
-                
-                Equipment Type Distribution:
-                """
-                
-                for eq_type, count in self.current_dataset['type_distribution'].items():
-                    details += f"\n  {eq_type}: {count}"
-                
-                self.history_details.setText(details)
-                
+            cached = self.cache.get('dataset', dataset_id)
+            if response.status_code == 304 and cached is not None:
+                self.show_history_dataset(json.loads(cached.content))
+            elif response.status_code == 200:
+                dataset = response.json()
+                self.cache.put(
+                    'dataset', dataset_id, response.content,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    version=dataset.get('updated_at')
+                )
+                self.show_history_dataset(dataset)
+            else:
+                QMessageBox.critical(self, 'Error', f'Failed to load dataset: HTTP {response.status_code}')
+        
         except Exception as e:
             QMessageBox.critical(self, 'Error', f'Failed to load dataset: {e}')
     
+    def show_history_dataset(self, dataset):
+        self.current_dataset = dataset
+        
+        # Update history details
+        details = f"""
+        Filename: {self.current_dataset['filename']}
+        Upload Date: {self.current_dataset['upload_date']}
+        Total Equipment: {self.current_dataset['total_equipment']}
+        Average Flowrate: {self.current_dataset['avg_flowrate']:.2f}
+        Average Pressure: {self.current_dataset['avg_pressure']:.2f}
+        Average Temperature: {self.current_dataset['avg_temperature']:.2f}
+        
+        Equipment Type Distribution:
+        """
+        
+        for eq_type, count in self.current_dataset['type_distribution'].items():
+            details += f"\n  {eq_type}: {count}"
+        
+        self.history_details.setText(details)
+        self.update_visualization()
+    
     def update_visualization(self):
         if not self.current_dataset:
             return
@@ -347,72 +1812,190 @@ class MainWindow(QMainWindow):
         """
         self.summary_label.setText(summary)
         
-        # Update charts
-        self.chart_canvas.axes.clear()
-        
-        # Create subplots
-        self.chart_canvas.figure.clear()
-        ax1 = self.chart_canvas.figure.add_subplot(121)
-        ax2 = self.chart_canvas.figure.add_subplot(122)
-        
-        # Type distribution pie chart
-        types = list(self.current_dataset['type_distribution'].keys())
-        counts = list(self.current_dataset['type_distribution'].values())
-        ax1.pie(counts, labels=types, autopct='%1.1f%%', startangle=90)
-        ax1.set_title('Equipment Type Distribution')
-        
-        # Parameter bar chart
-        if self.current_dataset['raw_data']:
-            df = pd.DataFrame(self.current_dataset['raw_data'])
-            params = ['Flowrate', 'Pressure', 'Temperature']
-            avg_values = [df[param].mean() for param in params]
-            ax2.bar(params, avg_values, color=['#FF6384', '#36A2EB', '#4BC0C0'])
-            ax2.set_title('Average Parameters')
-            ax2.set_ylabel('Value')
-        
-        self.chart_canvas.figure.tight_layout()
-        self.chart_canvas.draw()
-        
-        # Update data table
-        if self.current_dataset['raw_data']:
-            df = pd.DataFrame(self.current_dataset['raw_data'])
-            self.data_table.setRowCount(len(df))
-            self.data_table.setColumnCount(len(df.columns))
-            self.data_table.setHorizontalHeaderLabels(df.columns)
-            
-            for i, row in df.iterrows():
-                for j, value in enumerate(row):
-                    self.data_table.setItem(i, j, QTableWidgetItem(str(value)))
+        # raw_data arrives as column arrays, so this is a cheap columnar build
+        df = pd.DataFrame(self.current_dataset['raw_data'])
+        self.table_model.set_frame(df)
+        
+        self.load_charts(self.current_dataset)
+    
+    def load_charts(self, dataset):
+        # Charts are drawn from the server's pre-aggregated chart data, a few
+        # hundred bytes per dataset, rather than from the raw rows.
+        if self.chart_task is not None:
+            self.chart_task.cancel()
+            self.chart_task = None
+        
+        cached = self.cache.get('chart-types', dataset['id'])
+        if cached is not None and cached.version == dataset.get('updated_at'):
+            self.draw_charts(dataset, json.loads(cached.content))
+            return
+        
+        self.chart_task = self.api.get(
+            f"/datasets/{dataset['id']}/chart_data/",
+            params={'chart': 'types'},
+            headers=cached.validators() if cached is not None else {}
+        )
+        self.chart_task.signals.finished.connect(
+            lambda response, dataset=dataset: self.on_charts_loaded(dataset, response)
+        )
+        self.chart_task.signals.failed.connect(lambda error: print(f'Failed to load charts: {error}'))
+    
+    def on_charts_loaded(self, dataset, response):
+        self.chart_task = None
+        if self.current_dataset is None or self.current_dataset['id'] != dataset['id']:
+            return
+        
+        cached = self.cache.get('chart-types', dataset['id'])
+        if response.status_code == 304 and cached is not None:
+            self.draw_charts(dataset, json.loads(cached.content))
+        elif response.status_code == 200:
+            self.cache.put(
+                'chart-types', dataset['id'], response.content,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                version=dataset.get('updated_at')
+            )
+            self.draw_charts(dataset, response.json())
+        else:
+            print(f'Failed to load charts: HTTP {response.status_code}')
+    
+    def draw_charts(self, dataset, types):
+        self.charts.show((dataset['id'], dataset.get('updated_at')), types)
+    
+    def on_table_row_changed(self, current, previous):
+        values = self.table_model.row_values(current.row(), PARAMETERS) if current.isValid() else None
+        self.charts.highlight(values)
     
     def generate_pdf(self):
         if not self.current_dataset:
             QMessageBox.warning(self, 'Warning', 'No dataset loaded')
             return
         
-        try:
-            headers = {'Authorization': f'Token {self.token}'}
-            response = requests.get(
-                f"{API_URL}/datasets/{self.current_dataset['id']}/generate_pdf/",
-                headers=headers
+        dataset = self.current_dataset
+        filename, _ = QFileDialog.getSaveFileName(
+            self, 'Save PDF', f"report_{dataset['filename']}.pdf", 
+            'PDF Files (*.pdf)'
+        )
+        if not filename:
+            return
+        
+        cached = self.cache.get_file('pdf', dataset['id'])
+        if cached is not None and cached.version == dataset.get('updated_at'):
+            try:
+                shutil.copyfile(cached.path, filename)
+            except OSError as e:
+                QMessageBox.critical(self, 'Error', str(e))
+                return
+            QMessageBox.information(self, 'Success', 'PDF report generated successfully!')
+            return
+        
+        # Reports are rendered by a server-side worker: submit a job, poll it
+        # until it is done, then stream the finished file to disk.
+        task = self.api.post(f"/datasets/{dataset['id']}/reports/", json={'template': 'standard'})
+        self.track_task(task, 'Queueing PDF report...')
+        task.signals.finished.connect(
+            lambda response, dataset=dataset: self.on_report_status(dataset, filename, response)
+        )
+        task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+    
+    def on_report_status(self, dataset, filename, response):
+        if response.status_code not in (200, 202):
+            self.report_job = None
+            QMessageBox.critical(self, 'Error', 'Failed to generate PDF')
+            return
+        
+        job = response.json()
+        self.report_job = job['id']
+        if job['status'] == 'done':
+            self.report_job = None
+            task = self.api.get(f"/reports/{job['id']}/download/", download=filename)
+            self.track_task(task, 'Downloading PDF report...')
+            task.signals.finished.connect(
+                lambda response, dataset=dataset: self.on_pdf_downloaded(dataset, filename, response)
             )
-            
-            if response.status_code == 200:
-                filename, _ = QFileDialog.getSaveFileName(
-                    self, 'Save PDF', f"report_{self.current_dataset['filename']}.pdf", 
-                    'PDF Files (*.pdf)'
-                )
-                
-                if filename:
-                    with open(filename, 'wb') as f:
-                        f.write(response.content)
-                    QMessageBox.information(self, 'Success', 'PDF report generated successfully!')
-            else:
-                QMessageBox.critical(self, 'Error', 'Failed to generate PDF')
+            task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+        elif job['status'] == 'failed':
+            self.report_job = None
+            QMessageBox.critical(self, 'Error', f"Failed to generate PDF: {job['error']}")
+        else:
+            self.statusBar().showMessage(f"PDF report {job['status']}...")
+            self.cancel_btn.show()
+            # A report_finished event polls at once; the timer is the fallback.
+            self.report_poll = lambda job_id=job['id']: self.poll_report(dataset, filename, job_id)
+            interval = REPORT_POLL_INTERVAL_PUSHED if self.events_connected else REPORT_POLL_INTERVAL
+            QTimer.singleShot(interval, self.report_poll)
+    
+    def poll_report(self, dataset, filename, job_id):
+        if self.report_job != job_id:
+            return
+        task = self.api.get(f'/reports/{job_id}/')
+        task.signals.finished.connect(
+            lambda response, dataset=dataset: self.on_report_polled(dataset, filename, job_id, response)
+        )
+        task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+    
+    def on_report_polled(self, dataset, filename, job_id, response):
+        # Answers for a job no longer waited on (cancelled, or already handled
+        # through an earlier poll) are ignored.
+        if self.report_job == job_id:
+            self.on_report_status(dataset, filename, response)
+    
+    def cancel_upload(self):
+        if self.upload_task is not None:
+            self.upload_task.cancel()
+            self.upload_task = None
+    
+    def cancel_report(self):
+        self.report_job = None
+        self.cancel_btn.hide()
+        self.statusBar().clearMessage()
+    
+    def on_pdf_downloaded(self, dataset, filename, response):
+        if response.status_code == 200:
+            self.cache.put_file(
+                'pdf', dataset['id'], filename,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                version=dataset.get('updated_at')
+            )
+            QMessageBox.information(self, 'Success', 'PDF report generated successfully!')
+        else:
+            QMessageBox.critical(self, 'Error', 'Failed to generate PDF')
+    
+    def export_data(self):
+        if not self.current_dataset:
+            QMessageBox.warning(self, 'Warning', 'No dataset loaded')
+            return
         
-        except Exception as e:
-            QMessageBox.critical(self, 'Error', str(e))
+        dataset = self.current_dataset
+        stem = os.path.splitext(dataset['filename'])[0]
+        filename, selected = QFileDialog.getSaveFileName(
+            self, 'Export Data', f'{stem}.csv',
+            'CSV Files (*.csv);;Parquet Files (*.parquet)'
+        )
+        if not filename:
+            return
+        
+        file_format = os.path.splitext(filename)[1].lower().lstrip('.')
+        if file_format not in EXPORT_FORMATS:
+            file_format = 'parquet' if selected.startswith('Parquet') else 'csv'
+        task = self.api.get(f"/datasets/{dataset['id']}/export/{file_format}/", download=filename)
+        self.track_task(task, 'Exporting data...')
+        task.signals.finished.connect(self.on_export_finished)
+        task.signals.failed.connect(lambda error: QMessageBox.critical(self, 'Error', error))
+    
+    def on_export_finished(self, response):
+        if response.status_code == 200:
+            QMessageBox.information(self, 'Success', 'Data exported successfully!')
+        else:
+            QMessageBox.critical(self, 'Error', f'Export failed: HTTP {response.status_code}')
     
     def logout(self):
+        if self.events is not None:
+            self.events.stop()
+            self.events = None
+        self.api.cancel_all()
+        self.api.set_token(None)
         self.token = None
         self.user = None
         self.current_dataset = None
@@ -424,4 +2007,4 @@ class MainWindow(QMainWindow):
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = MainWindow()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
\ No newline at end of file